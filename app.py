@@ -1,21 +1,39 @@
 import os
 import csv
+import json
+import fnmatch
+import hashlib
+import atexit
 import time
+import shutil
 import threading
 import subprocess
+import uuid
 from datetime import datetime
 from pathlib import Path
-from tempfile import NamedTemporaryFile
 
 import cv2
-from PIL import Image
 
 from flask import (
     Flask, send_from_directory, send_file, render_template, request,
-    redirect, url_for, flash, Response, jsonify, abort, make_response
+    redirect, url_for, flash, Response, jsonify, abort, make_response, g
 )
 
 from camera import camera
+import stereo_engine
+import encoding
+from stereo_worker import StereoWorker
+from jobs import JobQueue, QueueFull
+from result_cache import ResultCache
+from latest_frame import LatestFrame
+from stereo_stream import StereoStream
+import batch
+from catalog import ImageCatalog
+from renditions import RenditionCache, SIZES as RENDITION_SIZES, FORMATS as RENDITION_FORMATS
+from metrics import Registry, timed
+from auto_snap import AutoSnap
+from incremental import IncrementalConverter
+import video
 
 
 CONFIG_FOLDER = Path("config")
@@ -27,14 +45,37 @@ CONVERTED_IMAGES_FOLDER = Path("converted_images")
 STATIC_FOLDER = Path("static")
 TEMPLATES_FOLDER = Path("templates")
 
+BATCH_FOLDER = CONVERTED_IMAGES_FOLDER / "batch"
+# процессов пакетной конвертации: каждый держит свои кадр и массивы numpy (с native — ещё ./stereo --serve)
+BATCH_WORKERS = max(1, int(os.environ.get("BATCH_WORKERS", "2")))
+# сколько последних пакетов хранить в converted_images/batch/
+KEEP_BATCH_OUTPUTS = max(1, int(os.environ.get("KEEP_BATCH_OUTPUTS", "10")))
+# у каждой конвертации свой каталог результатов: converted_images/jobs/<id>/
+JOBS_OUTPUT_FOLDER = CONVERTED_IMAGES_FOLDER / "jobs"
+# сколько последних каталогов задач хранить (latest.* — жёсткая ссылка, переживает удаление)
+KEEP_JOB_OUTPUTS = max(1, int(os.environ.get("KEEP_JOB_OUTPUTS", "20")))
+
 IMAGE_NAME = "pair.jpg"
 STEREO_EXECUTABLE = "./stereo"
 
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
 MAX_CONTENT_LENGTH = 20 * 1024 * 1024  # 20MB
+# /capture сразу после запуска камеры: сколько ждать первый кадр, секунд
+CAPTURE_FRAME_TIMEOUT = float(os.environ.get("CAPTURE_FRAME_TIMEOUT", "3"))
+
+# Видео: исходники в videos/, результаты — converted_images/videos/<имя>_<параметры>/
+VIDEOS_FOLDER = Path("videos")
+VIDEO_OUTPUT_FOLDER = CONVERTED_IMAGES_FOLDER / "videos"
+MAX_VIDEO_CONTENT_LENGTH = int(float(os.environ.get("MAX_VIDEO_MB", "1024")) * 1024 * 1024)
+# потоков на кадры одного видео и кадров в сегменте. У каждого потока свой
+# ./stereo --serve, а тот сам раскладывает кадр на все ядра — много потоков
+# дают только лишние процессы и переключения
+VIDEO_WORKERS = max(1, int(os.environ.get("VIDEO_WORKERS", "2")))
+VIDEO_SEGMENT_FRAMES = max(1, int(os.environ.get("VIDEO_SEGMENT_FRAMES", "300")))
 
 IMAGES_FOLDER.mkdir(parents=True, exist_ok=True)
 CONVERTED_IMAGES_FOLDER.mkdir(parents=True, exist_ok=True)
+VIDEOS_FOLDER.mkdir(parents=True, exist_ok=True)
 STATIC_FOLDER.mkdir(parents=True, exist_ok=True)
 TEMPLATES_FOLDER.mkdir(parents=True, exist_ok=True)
 
@@ -51,225 +92,654 @@ DEFAULT_CONFIG = {
     "target_width": "0",
     "target_height": "0",
     "jpeg_quality": "95",
+    "output_format": "jpeg",  # jpeg|webp
+    "chroma_subsampling": "auto",  # auto|420|444 (auto — 4:2:0 при качестве <= 90)
+    "encoder": "native",  # native (stb в ./stereo)|opencv (cv2.imencode)
+    "engine": "native",  # native|numpy|worker
+    "stream_fps": "10",
+    "stream_max_width": "960",
+    "incremental": "true",  # кадры камеры: пересчитывать только изменившиеся полосы
+    "incremental_threshold": "6",  # порог среднего изменения яркости блока 16x16
+    "depth_smoothing": "0.3",  # доля прошлой глубины в пересчитанных полосах (numpy)
     "auto_snap_enabled": "false",
     "auto_snap_interval": "5",
     "auto_snap_convert": "true",
     "auto_snap_max_files": "50"
 }
 
-auto_snap_thread = None
-auto_snap_stop = threading.Event()
+# Каталог images/ в памяти вместо listdir/glob на каждый запрос
+image_catalog = ImageCatalog(IMAGES_FOLDER, ALLOWED_EXTENSIONS)
+
+# Миниатюры/превью для админки: converted_images/renditions, размер в МБ
+renditions = RenditionCache(
+    IMAGES_FOLDER, CONVERTED_IMAGES_FOLDER / "renditions",
+    max_bytes=int(float(os.environ.get("RENDITION_CACHE_MAX_MB", "128")) * 1024 * 1024),
+)
+
+# долгоживущий ./stereo --serve для engine=worker (стартует при первом запросе)
+stereo_worker = StereoWorker(STEREO_EXECUTABLE)
+
+# Инкрементальная конвертация кадров камеры: у живого потока и у снимков
+# (автоснимок, /capture) своя история — кадры идут с разной частотой
+stream_incremental = IncrementalConverter()
+camera_incremental = IncrementalConverter()
+
+# Пул конвертаций: сам конвертер уже многопоточный, поэтому по умолчанию один воркер
+conversion_jobs = JobQueue(
+    workers=int(os.environ.get("CONVERSION_WORKERS", "1")),
+    max_pending=int(os.environ.get("CONVERSION_QUEUE_SIZE", "16")),
+)
+
+# Видео — отдельная очередь: ролик на минуты не должен задерживать снимки.
+# Одно видео за раз (кадры и так идут параллельно), остановка — при выходе
+video_jobs = JobQueue(workers=1, max_pending=4, keep_finished=50)
+video_stop = threading.Event()
+
+# Кэш результатов: converted_images/cache, размер в МБ (0 — выключен)
+conversion_cache = ResultCache(
+    CONVERTED_IMAGES_FOLDER / "cache",
+    max_bytes=int(float(os.environ.get("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024),
+)
+
+# Последний опубликованный кадр в памяти (ETag + уведомления для /events)
+latest_frame = LatestFrame()
+
+# Метрики для /metrics (формат Prometheus)
+metrics_registry = Registry()
+stage_seconds = metrics_registry.histogram(
+    "stereo_stage_seconds", "Время стадии конвейера (capture, snapshot_write, cache_lookup, resize, "
+    "convert, subprocess, encode, publish, total, video)", labels=("stage",))
+encoded_bytes_total = metrics_registry.counter(
+    "stereo_encoded_bytes_total", "Размер закодированных результатов по формату и кодировщику",
+    labels=("format", "encoder"))
+conversions_total = metrics_registry.counter(
+    "stereo_conversions_total", "Конвертации по движку и результату (ok, cached, error)",
+    labels=("engine", "result"))
+http_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса (у потоков — до начала тела)",
+    labels=("endpoint", "method"))
+
+# Трасса каждой конвертации (JSON-строка со временем стадий): путь к файлу,
+# "stdout" — в консоль; пусто — выключено
+CONVERSION_TRACE_LOG = os.environ.get("CONVERSION_TRACE_LOG", "").strip()
+trace_lock = threading.Lock()
+
+# минимальный интервал автоснимка, сек.
+AUTO_SNAP_MIN_INTERVAL = 0.2
+# инкрементальная конвертация — только для непрерывного источника: если между
+# кадрами прошло больше (2 интервала автоснимка, но не больше стольких секунд),
+# кадр конвертируется целиком и без прошлой глубины
+INCREMENTAL_MAX_GAP = float(os.environ.get("INCREMENTAL_MAX_GAP", "10"))
 
 last_auto_filename = None
 last_auto_time = None
-last_auto_error = None
+last_auto_job = None
+
+# config.csv перечитывается только при изменении файла
+config_cache = {"stamp": None, "cfg": None}
+config_lock = threading.Lock()
+
+
+# опубликованный результат: latest.jpg или latest.webp — по формату вывода
+LATEST_NAMES = [f"latest{ext}" for ext, _ in encoding.FORMATS.values()]
 
 
 def get_latest_converted_image():
-    """Ищем последний сконвертированный JPG/PNG."""
-    files = sorted(
-        CONVERTED_IMAGES_FOLDER.glob("*.jpg"),
-        key=lambda f: f.stat().st_mtime,
-        reverse=True
-    )
-    return files[0] if files else None
+    """Последнее опубликованное изображение (latest.jpg / latest.webp) без обхода каталога."""
+    for name in LATEST_NAMES:
+        latest = CONVERTED_IMAGES_FOLDER / name
+        if latest.exists():
+            return latest
+    return None
 
 
-def update_latest_converted(src: Path):
+def update_latest_converted(src: Path, data: bytes = None) -> bytes:
     """
-    Обновляет "указатель" на последнее сконвертированное изображение.
-    Делаем атомарную подмену latest.jpg (через временный файл и replace).
+    Публикует готовый файл (результат задачи или запись кэша) как latest.<ext>
+    без копирования байтов: жёсткая ссылка под временным именем и атомарный
+    replace; latest другого формата удаляется. Файл читается один раз — для
+    кадра в памяти (data — если байты уже есть); возвращает байты.
     """
+    if data is None:
+        data = src.read_bytes()
+    latest_frame.set(data)
+    dst = CONVERTED_IMAGES_FOLDER / f"latest{src.suffix}"
+    tmp = CONVERTED_IMAGES_FOLDER / f"latest_{uuid.uuid4().hex}.tmp"
     try:
-        dst_dir = CONVERTED_IMAGES_FOLDER
-        dst_dir.mkdir(parents=True, exist_ok=True)
-        tmp = dst_dir / ("latest_tmp_" + str(int(time.time())) + ".jpg")
-        dst = dst_dir / "latest.jpg"
-        # копия источника в tmp, затем атомарная замена
-        with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
-            fdst.write(fsrc.read())
-        tmp.replace(dst)
-    except Exception as e:
-        print(f"[latest] failed to update latest.jpg: {e}")
+        os.link(src, tmp)
+    except OSError:
+        # ФС без жёстких ссылок (или запись кэша уже вытеснена) — пишем байты
+        tmp.write_bytes(data)
+    tmp.replace(dst)
+    for name in LATEST_NAMES:
+        if name != dst.name:
+            (CONVERTED_IMAGES_FOLDER / name).unlink(missing_ok=True)
+    return data
+
+
+def load_latest_from_disk():
+    """При старте поднимаем в память latest.* (или pair.jpg для совместимости)."""
+    for name in (*LATEST_NAMES, "pair.jpg"):
+        path = CONVERTED_IMAGES_FOLDER / name
+        if path.exists():
+            try:
+                latest_frame.set(path.read_bytes())
+                return
+            except OSError as e:
+                print(f"[latest] failed to load {name}: {e}")
 
 
 
-def auto_snap_worker():
-    global last_auto_filename, last_auto_time, last_auto_error
-    while not auto_snap_stop.is_set():
-        cfg = read_config()
-        if cfg.get("auto_snap_enabled", "false").lower() == "true":
-            try:
-                interval = max(1, int(float(cfg.get("auto_snap_interval") or 5)))
-            except Exception:
-                interval = 5
-            want_convert = (cfg.get("auto_snap_convert") or "true").lower() == "true"
-            max_files = max(1, int(float(cfg.get("auto_snap_max_files") or 50)))
-
-            ok, msg = camera.start()
-            if not ok:
-                last_auto_error = f"Камера: {msg}"
-                time.sleep(interval)
-                continue
+def auto_snap_settings() -> dict:
+    cfg = read_config()
+    try:
+        interval = max(AUTO_SNAP_MIN_INTERVAL, float(cfg.get("auto_snap_interval") or 5))
+    except ValueError:
+        interval = 5.0
+    return {"enabled": (cfg.get("auto_snap_enabled") or "false").lower() == "true", "interval": interval}
 
-            if cv2 is None:
-                last_auto_error = "OpenCV не установлен"
-                time.sleep(interval)
-                continue
 
-            frame = camera.get_frame()
-            if frame is None:
-                last_auto_error = "Нет кадра"
-                time.sleep(interval)
-                continue
+def auto_snap_capture():
+    """Этап 1 (по расписанию): только кадр с камеры, без записи на диск."""
+    ok, msg = camera.start()
+    if not ok:
+        return None, f"Камера: {msg}"
+    if cv2 is None:
+        return None, "OpenCV не установлен"
+    with timed(stage_seconds, stage="capture"):
+        # камера могла только что открыться: ждём первый кадр, а не берём пустой
+        _, frame = camera.wait_frame(0, timeout=CAPTURE_FRAME_TIMEOUT)
+    if frame is None:
+        return None, "Нет кадра"
+    return frame, None
 
-            filename = f"auto_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            save_path = IMAGES_FOLDER / filename
-            success = cv2.imwrite(str(save_path), frame, [int(cv2.IMWRITE_JPEG_QUALITY), 92])
-            if not success:
-                last_auto_error = f"Сохранение не удалось: {filename}"
-                time.sleep(interval)
-                continue
 
-            last_auto_filename = filename
-            last_auto_time = datetime.now()
-            last_auto_error = None
+def auto_snap_process(frame, captured_at: float) -> dict:
+    """Этап 2: сохранить самый свежий кадр и поставить конвертацию, если прошлая уже закончилась."""
+    global last_auto_filename, last_auto_time, last_auto_job
+    cfg = read_config()
+    want_convert = (cfg.get("auto_snap_convert") or "true").lower() == "true"
+    max_files = max(1, int(float(cfg.get("auto_snap_max_files") or 50)))
 
-            prune_autosnap_files(max_files)
+    taken = datetime.fromtimestamp(captured_at)
+    # миллисекунды в имени — интервал может быть меньше секунды
+    filename = f"auto_{taken.strftime('%Y%m%d_%H%M%S_%f')[:-3]}.jpg"
+    save_path = IMAGES_FOLDER / filename
+    with timed(stage_seconds, stage="snapshot_write"):
+        success = cv2.imwrite(str(save_path), frame, [int(cv2.IMWRITE_JPEG_QUALITY), 92])
+    if not success:
+        return {"error": f"Сохранение не удалось: {filename}"}
 
-            if want_convert:
-                ok_conv, msg_conv = run_conversion(save_path)
-                if not ok_conv:
-                    last_auto_error = f"Конвертация: {msg_conv}"
-                # run_conversion уже обновит latest.jpg
-            else:
-                # если конвертацию не делаем — можно показывать сырой автоснимок
-                update_latest_converted(save_path)
+    image_catalog.add(filename)
+    renditions.prewarm(filename, sizes=("thumb", "preview"))
+    last_auto_filename = filename
+    last_auto_time = taken
+    prune_autosnap_files(max_files)
 
-            time.sleep(interval)
-        else:
-            time.sleep(2)
+    if not want_convert:
+        # если конвертацию не делаем — можно показывать сырой автоснимок
+        try:
+            update_latest_converted(save_path)
+        except OSError as e:
+            print(f"[latest] failed to update latest.jpg: {e}")
+        return {"conversion": "off"}
+
+    # прошлая автоконвертация ещё идёт — этот кадр не конвертируем, очередь не копится
+    if last_auto_job is not None and last_auto_job.status in ("queued", "running"):
+        return {"conversion": "skipped"}
+    try:
+        last_auto_job, _ = submit_conversion(save_path, frame=frame, incremental=True)
+    except QueueFull as e:
+        return {"error": f"Конвертация: {e}", "conversion": "skipped"}
+    # run_conversion сам обновит latest.*
+    return {"conversion": "submitted"}
 
 
-def start_auto_snap_thread():
-    global auto_snap_thread
-    if auto_snap_thread and auto_snap_thread.is_alive():
-        return
-    auto_snap_stop.clear()
-    auto_snap_thread = threading.Thread(target=auto_snap_worker, daemon=True)
-    auto_snap_thread.start()
+auto_snap = AutoSnap(auto_snap_settings, auto_snap_capture, auto_snap_process)
 
 
 def read_config() -> dict:
-    cfg = DEFAULT_CONFIG.copy()
-    if CONFIG_PATH.exists():
-        with CONFIG_PATH.open(newline='', encoding='utf-8') as f:
-            for row in csv.DictReader(f):
-                k, v = row.get("key"), row.get("value")
-                if k in cfg:
-                    cfg[k] = v
-    else:
+    """
+    Копия текущего конфига. Файл разбирается заново, только если изменились
+    его mtime/размер (правка через /save-config или вручную).
+    """
+    try:
+        st = CONFIG_PATH.stat()
+    except FileNotFoundError:
+        cfg = DEFAULT_CONFIG.copy()
         write_config(cfg)
-    return cfg
+        return cfg
+    stamp = (st.st_mtime_ns, st.st_size)
+    with config_lock:
+        if config_cache["stamp"] == stamp:
+            return dict(config_cache["cfg"])
+
+    cfg = DEFAULT_CONFIG.copy()
+    with CONFIG_PATH.open(newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            k, v = row.get("key"), row.get("value")
+            if k in cfg:
+                cfg[k] = v
+    with config_lock:
+        config_cache["stamp"], config_cache["cfg"] = stamp, cfg
+    return dict(cfg)
 
 
 def write_config(cfg: dict):
-    with CONFIG_PATH.open('w', newline='', encoding='utf-8') as f:
+    # через временный файл: читатель не увидит наполовину записанный конфиг
+    tmp = CONFIG_PATH.with_name(f"{CONFIG_PATH.name}.{threading.get_ident()}.tmp")
+    with tmp.open('w', newline='', encoding='utf-8') as f:
         w = csv.writer(f)
         w.writerow(["key", "value"])
         for k, v in cfg.items():
             w.writerow([k, str(v)])
+    tmp.replace(CONFIG_PATH)
+
+
+resize_stats = {}      # resize_mode -> {"count", "total_ms", "last_ms"}
+resize_stats_lock = threading.Lock()
+
+
+def record_resize(mode: str, ms: float):
+    with resize_stats_lock:
+        st = resize_stats.setdefault(mode, {"count": 0, "total_ms": 0.0, "last_ms": 0.0})
+        st["count"] += 1
+        st["total_ms"] += ms
+        st["last_ms"] = ms
+
+
+encode_stats = {}      # "<encoder> <format> q<quality> <subsampling>" -> {"count", "total_ms", "total_bytes", ...}
+encode_stats_lock = threading.Lock()
+
+
+def record_encode(enc: dict, ms: float, size: int, stages=None):
+    key = f'{enc["encoder"]} {enc["format"]} q{enc["quality"]} {enc["subsampling"]}'
+    with encode_stats_lock:
+        st = encode_stats.setdefault(key, {"count": 0, "total_ms": 0.0, "total_bytes": 0,
+                                           "last_ms": 0.0, "last_bytes": 0})
+        st["count"] += 1
+        st["total_ms"] += ms
+        st["total_bytes"] += size
+        st["last_ms"] = ms
+        st["last_bytes"] = size
+    encoded_bytes_total.inc(size, format=enc["format"], encoder=enc["encoder"])
+    if stages is not None:
+        stages["encoded_bytes"] = size
+
+
+def prepare_frame(input_path: Path, cfg: dict, frame=None, stages=None):
+    """
+    Кадр для конвертера в нужном размере, без временных файлов.
+    Возвращает (frame BGR, resize_mode, миллисекунды на чтение+ресайз).
+    stages — dict трассы конвертации (туда пишется resize_ms).
+    """
+    mode = (stereo_engine.resize_target(cfg) or ("none",))[0]
+    started = time.perf_counter()
+    if frame is None:
+        frame = stereo_engine.load_image(input_path, cfg)
+    else:
+        frame = stereo_engine.resize_frame(frame, cfg)
+    ms = (time.perf_counter() - started) * 1000
+    record_resize(mode, ms)
+    stage_seconds.observe(ms / 1000, stage="resize")
+    if stages is not None:
+        stages["resize_ms"] = round(ms, 2)
+    return frame, mode, ms
+
+
+def incremental_settings(cfg: dict, converter: IncrementalConverter, max_gap: float) -> bool:
+    """
+    Применяет порог/сглаживание из конфига и предельный разрыв между кадрами
+    (max_gap, сек.); True — инкрементальный режим включён.
+    """
+    if str(cfg.get("incremental", "true")).lower() != "true":
+        return False
+    converter.configure(threshold=float(cfg.get("incremental_threshold") or 6),
+                        smoothing=float(cfg.get("depth_smoothing") or 0),
+                        max_gap=min(max_gap, INCREMENTAL_MAX_GAP))
+    return True
 
 
-def maybe_resize_image(input_path: Path, cfg: dict) -> Path:
-    mode = (cfg.get("resize_mode") or "none").lower()
-    tw = int(float(cfg.get("target_width") or 0))
-    th = int(float(cfg.get("target_height") or 0))
-    if mode == "none" or (tw <= 0 and th <= 0):
-        return input_path
-
-    with Image.open(input_path) as im:
-        im = im.convert("RGB")
-        if mode == "fit":
-            if tw <= 0 or th <= 0:
-                return input_path
-            im.thumbnail((tw, th))
-        elif mode == "exact":
-            if tw <= 0 or th <= 0:
-                return input_path
-            im = im.resize((tw, th), Image.LANCZOS)
+def convert_in_process(input_path: Path, cfg: dict, out_dir: Path, frame=None, stages=None,
+                       incremental=False):
+    """
+    Конвертация без запуска ./stereo на каждый снимок: движком stereo_engine
+    (NumPy) или постоянным воркером ./stereo --serve (engine=worker, а также
+    native с ресайзом или с кодированием, которого нет в stb, — пиксели идут
+    в конвертер и обратно через общую память, кодирует cv2.imencode).
+    Если кадр уже в памяти (камера) — файл не перечитываем. incremental — кадр
+    из непрерывной серии (автоснимок): при incremental=true в конфиге пересчитываем
+    только полосы, изменившиеся с прошлого снимка; разовый /capture — всегда целиком.
+    Возвращает (строка с режимом и временем ресайза для сообщения, exact):
+    exact=False — результат инкрементальный (полосы прошлого кадра, сглаженная
+    глубина), в кэш по содержимому его класть нельзя.
+    """
+    parallax = float(cfg.get("parallax_perc", 0.5))
+    layers = int(float(cfg.get("layers_count", 10)))
+    zlayer = int(float(cfg.get("zero_parallax_layer_num", 5)))
+    out_mode = (cfg.get("output_mode") or "both").lower()
+
+    from_camera = frame is not None
+    frame, resize_mode, resize_ms = prepare_frame(input_path, cfg, frame, stages)
+
+    convert = stereo_engine.convert if cfg.get("engine") == "numpy" else stereo_worker.convert
+    mode_code = stereo_engine.OUTPUT_MODES.get(out_mode, 0)
+    exact = not (from_camera and incremental
+                 and incremental_settings(cfg, camera_incremental, 2 * auto_snap_settings()["interval"]))
+    with timed(stage_seconds, stages, stage="convert"):
+        if not exact:
+            outputs = camera_incremental.convert(frame, convert, parallax, layers, zlayer, mode_code)
+            if stages is not None:
+                stages["changed_ratio"] = camera_incremental.last_changed
         else:
-            return input_path
+            outputs = convert(frame, parallax, layers, zlayer, mode_code)
+    if stages is not None and convert == stereo_worker.convert and stereo_worker.last_memory:
+        # буферы задачи в ./stereo --serve (вход и выходы — в общей памяти, остальное — арена)
+        stages["converter_mb"] = round(stereo_worker.last_memory["buffer_bytes"] / 2**20, 1)
+    enc = dict(encoding.encode_settings(cfg), encoder="opencv")
+    started = time.perf_counter()
+    with timed(stage_seconds, stages, stage="encode"):
+        size = encoding.write_outputs(outputs, out_dir, enc)
+    encode_ms = (time.perf_counter() - started) * 1000
+    record_encode(enc, encode_ms, size, stages)
+    return (f"resize {resize_mode}: {resize_ms:.0f} мс, "
+            f"{enc['format']} q{enc['quality']}: {encode_ms:.0f} мс, {size // 1024} КБ"), exact
+
+
+def new_output_dir() -> Path:
+    """Каталог результатов одной конвертации; имена сортируются по времени создания."""
+    out_dir = JOBS_OUTPUT_FOLDER / (time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6])
+    out_dir.mkdir(parents=True)
+    return out_dir
+
+
+def prune_job_outputs(keep: int = KEEP_JOB_OUTPUTS, folder: Path = JOBS_OUTPUT_FOLDER):
+    """Удаляет каталоги задач (или пакетов) сверх последних keep; имена начинаются со времени."""
+    try:
+        dirs = sorted(p for p in folder.iterdir() if p.is_dir())
+    except FileNotFoundError:
+        return
+    for old in dirs[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
 
-        tmpf = NamedTemporaryFile(prefix="resized_", suffix=".jpg", delete=False, dir=str(IMAGES_FOLDER))
-        tmp_path = Path(tmpf.name)
-        quality = max(1, min(100, int(float(cfg.get("jpeg_quality") or 95))))
-        im.save(tmp_path, "JPEG", quality=quality, optimize=True)
-        return tmp_path
 
+def publish_converted(out_dir: Path, out_mode: str, ext: str = ".jpg"):
+    """
+    Публикует результат задачи как latest.<ext>: предпочитаем pair, иначе left/right
+    (ext — расширение формата вывода; /get-image отдаёт Content-Type по содержимому).
+    Возвращает (путь, байты) или (None, None), если конвертер ничего не записал.
+    """
+    pair = out_dir / f"pair{ext}"
+    left = out_dir / f"left{ext}"
+    right = out_dir / f"right{ext}"
+
+    chosen = None
+    if pair.exists() and out_mode in ("both", "pair"):
+        chosen = pair
+    elif out_mode in ("both", "split"):
+        # берём самый свежий из left/right
+        candidates = [p for p in (left, right) if p.exists()]
+        if candidates:
+            chosen = max(candidates, key=lambda p: p.stat().st_mtime)
+
+    if chosen is None:
+        return None, None
+    return chosen, update_latest_converted(chosen)
 
-def run_conversion(input_path: Path) -> tuple[bool, str]:
+
+def cache_params(cfg: dict) -> dict:
+    """
+    Параметры, от которых зависит результат (часть ключа кэша). Инкрементальных
+    настроек здесь нет: в кэш попадают только полные конвертации.
+    """
+    keys = ("parallax_perc", "layers_count", "zero_parallax_layer_num", "output_mode",
+            "resize_mode", "target_width", "target_height", "jpeg_quality", "output_format",
+            "chroma_subsampling", "encoder", "engine")
+    return {k: str(cfg.get(k)) for k in keys}
+
+
+def stream_settings() -> dict:
+    """Параметры живого потока /stereo-feed (читаются потоком раз в секунду)."""
     cfg = read_config()
-    resized_path = maybe_resize_image(input_path, cfg)
+    parallax = float(cfg.get("parallax_perc", 0.5))
+    layers = int(float(cfg.get("layers_count", 10)))
+    zlayer = int(float(cfg.get("zero_parallax_layer_num", 5)))
+    # нативный ./stereo работает только с файлами — в потоке используем numpy
+    engine = stereo_worker if cfg.get("engine") == "worker" else stereo_engine
+
+    pair_mode = stereo_engine.OUTPUT_MODES["pair"]
+    # поток рвётся, когда уходят зрители: после паузы — снова полный кадр
+    fps = float(cfg.get("stream_fps") or 10)
+    incremental = incremental_settings(cfg, stream_incremental, max(1.0, 2.0 / fps))
+
+    def convert(frame):
+        if incremental:
+            return stream_incremental.convert(frame, engine.convert, parallax, layers, zlayer, pair_mode)["pair"]
+        return engine.convert(frame, parallax, layers, zlayer, pair_mode)["pair"]
+
+    # MJPEG — всегда JPEG, но качество и субдискретизация общие с конвертацией
+    enc = dict(encoding.encode_settings(cfg), format="jpeg")
+    return {
+        "fps": fps,
+        "max_width": int(float(cfg.get("stream_max_width") or 0)),
+        "jpeg_quality": max(1, min(100, int(float(cfg.get("jpeg_quality") or 95)))),
+        "encode_params": encoding.imencode_params(enc),
+        "convert": convert,
+    }
+
+
+stereo_stream = StereoStream(camera, stream_settings)
+
+
+def write_trace(record: dict):
+    line = json.dumps(record, ensure_ascii=False)
+    if CONVERSION_TRACE_LOG == "stdout":
+        print(f"[trace] {line}")
+        return
     try:
-        parallax = str(float(cfg.get("parallax_perc", 0.5)))
-        layers = str(int(float(cfg.get("layers_count", 10))))
-        zlayer = str(int(float(cfg.get("zero_parallax_layer_num", 5))))
-        out_mode = (cfg.get("output_mode") or "both").lower()
-        mode_code = {"both": "0", "pair": "1", "split": "2"}.get(out_mode, "0")
-
-        cmd = [STEREO_EXECUTABLE, str(resized_path), parallax, layers, zlayer, mode_code]
-        subprocess.run(cmd, check=True)
+        with trace_lock, open(CONVERSION_TRACE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"[trace] write failed: {e}")
 
-        # Выбираем, что считать "последним": предпочитаем pair.jpg, иначе left/right
-        out_mode = (cfg.get("output_mode") or "both").lower()
-        pair = CONVERTED_IMAGES_FOLDER / "pair.jpg"
-        left = CONVERTED_IMAGES_FOLDER / "left.jpg"
-        right = CONVERTED_IMAGES_FOLDER / "right.jpg"
 
-        chosen = None
-        if pair.exists() and out_mode in ("both", "pair"):
-            chosen = pair
-        elif out_mode in ("both", "split"):
-            # берём самый свежий из left/right
-            candidates = [p for p in (left, right) if p.exists()]
-            if candidates:
-                chosen = max(candidates, key=lambda p: p.stat().st_mtime)
+def run_conversion(input_path: Path, frame=None, incremental=False) -> tuple[bool, str]:
+    """
+    frame — необязательный кадр (BGR ndarray) того же изображения, уже
+    находящийся в памяти; используется движком numpy вместо чтения файла.
+    incremental — кадр из серии автоснимков (см. convert_in_process).
+    Время стадий уходит в /metrics и (если включено) в трассу CONVERSION_TRACE_LOG.
+    """
+    trace = {"input": input_path.name, "engine": None, "result": "ok", "stages": {}}
+    started = time.perf_counter()
+    ok, message = convert_and_publish(input_path, frame, trace, incremental)
+    seconds = time.perf_counter() - started
+
+    result = trace["result"] if ok else "error"
+    stage_seconds.observe(seconds, stage="total")
+    conversions_total.inc(engine=trace["engine"] or "", result=result)
+    if CONVERSION_TRACE_LOG:
+        write_trace(dict(trace, time=datetime.now().isoformat(timespec="milliseconds"),
+                         ok=ok, result=result, total_ms=round(seconds * 1000, 2), message=message))
+    return ok, message
+
+
+def convert_and_publish(input_path: Path, frame, trace: dict, incremental=False) -> tuple[bool, str]:
+    stages = trace["stages"]
+    cfg = read_config()
+    engine = (cfg.get("engine") or "native").lower()
+    trace["engine"] = engine
+    parallax = str(float(cfg.get("parallax_perc", 0.5)))
+    layers = str(int(float(cfg.get("layers_count", 10))))
+    zlayer = str(int(float(cfg.get("zero_parallax_layer_num", 5))))
+    out_mode = (cfg.get("output_mode") or "both").lower()
+    enc = encoding.encode_settings(cfg)
+    trace["format"] = enc["format"]
+    summary = f"parallax={parallax}, layers={layers}, zpl={zlayer}, mode={out_mode}, engine={engine}"
+
+    cache_key = None
+    ext = encoding.extension(enc)
+    if conversion_cache.enabled:
+        try:
+            with timed(stage_seconds, stages, stage="cache_lookup"):
+                cache_key = conversion_cache.make_key(input_path, cache_params(cfg))
+                cached = conversion_cache.get(cache_key, ext)
+        except OSError as e:
+            print(f"[cache] lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            try:
+                with timed(stage_seconds, stages, stage="publish"):
+                    update_latest_converted(conversion_cache.path(cache_key, ext), cached)
+            except Exception as e:
+                return False, f"Не удалось опубликовать результат из кэша: {e}"
+            trace["result"] = "cached"
+            return True, f"Конвертация из кэша ({summary})."
+
+    def publish(cacheable=True):
+        try:
+            with timed(stage_seconds, stages, stage="publish"):
+                chosen, data = publish_converted(out_dir, out_mode, ext)
+        except OSError as e:
+            print(f"[latest] failed to update latest{ext}: {e}")
+            chosen = data = None
+        if cache_key and chosen and cacheable:
+            try:
+                conversion_cache.put(cache_key, chosen, data)
+            except OSError as e:
+                print(f"[cache] store failed: {e}")
+        prune_job_outputs()
+
+    # у задачи свой каталог — параллельные конвертации не перетирают друг друга
+    out_dir = new_output_dir()
+
+    # ресайз делается в памяти; ./stereo читает только файлы, поэтому
+    # native с ресайзом идёт через тот же C++ код в режиме --serve; так же —
+    # если кодирование просят не у stb (WebP, своя субдискретизация, encoder=opencv)
+    if (engine in ("numpy", "worker") or stereo_engine.resize_target(cfg)
+            or not encoding.native_supports(enc)):
+        try:
+            timing, exact = convert_in_process(input_path, cfg, out_dir, frame, stages, incremental)
+        except FileNotFoundError:
+            return False, "Не найден исполняемый файл конвертера (STEREO_EXECUTABLE)."
+        except Exception as e:
+            return False, f"Ошибка конвертации ({engine}): {e}"
+        # приближённый инкрементальный результат не должен отдаваться на /convert тех же байтов
+        publish(cacheable=exact)
+        return True, f"Конвертация ок ({summary}, {timing})."
 
-        if chosen and chosen.exists():
-            update_latest_converted(chosen)
+    try:
+        mode_code = {"both": "0", "pair": "1", "split": "2"}.get(out_mode, "0")
 
-        return True, f"Конвертация ок (parallax={parallax}, layers={layers}, zpl={zlayer}, mode={out_mode})."
+        cmd = [STEREO_EXECUTABLE, str(input_path), parallax, layers, zlayer, mode_code,
+               str(out_dir), str(enc["quality"])]
+        with timed(stage_seconds, stages, stage="subprocess"):
+            proc = subprocess.run(cmd, check=True, stderr=subprocess.PIPE, text=True,
+                                  env=dict(os.environ, STEREO_TIMINGS="1"))
+        timings = native_timings(proc.stderr)
+        if "encode_ms" in timings:
+            stage_seconds.observe(timings["encode_ms"] / 1000, stage="encode")
+            stages["encode_ms"] = timings["encode_ms"]
+            record_encode(enc, timings["encode_ms"], int(timings.get("encoded_bytes", 0)), stages)
+        if "peak_rss_kb" in timings:
+            # процесс на задачу: его пиковый RSS — пиковая память конвертации
+            stages["converter_mb"] = round(timings["peak_rss_kb"] / 1024, 1)
+
+        publish()
+        return True, f"Конвертация ок ({summary}, {enc['format']} q{enc['quality']})."
     except FileNotFoundError:
         return False, "Не найден исполняемый файл конвертера (STEREO_EXECUTABLE)."
-    except subprocess.CalledProcessError:
+    except subprocess.CalledProcessError as e:
+        if e.stderr:
+            print(f"[convert] {e.stderr.strip()}")
         return False, "Ошибка при запуске конвертера."
-    finally:
-        if resized_path != input_path and resized_path.exists():
-            try: resized_path.unlink()
-            except Exception: pass
 
 
+def native_timings(stderr: str) -> dict:
+    """Строка "timings ..." из ./stereo (STEREO_TIMINGS=1); прочий вывод — в консоль, как раньше."""
+    timings = {}
+    for line in (stderr or "").splitlines():
+        if line.startswith("timings "):
+            timings = {k: float(v) for k, v in (item.split("=", 1) for item in line.split()[1:])}
+        elif line.strip():
+            print(f"[convert] {line}")
+    return timings
+
+
+def conversion_key(input_path: Path, cfg: dict) -> tuple:
+    """Ключ склейки: тот же файл с теми же параметрами — одна задача."""
+    return (input_path.name,) + tuple(sorted(cache_params(cfg).items()))
+
+
+def submit_conversion(input_path: Path, frame=None, incremental=False):
+    """Ставит run_conversion в очередь; возвращает (job, created). Может бросить QueueFull."""
+    key = conversion_key(input_path, read_config())
+    return conversion_jobs.submit(key, run_conversion, input_path, frame=frame, incremental=incremental)
+
+
+def video_converter_factory(cfg: dict):
+    """
+    make_converter для video.convert_video: кадр -> SBS-кадр (pair, левый глаз слева).
+    engine=numpy — stereo_engine в потоке; иначе у потока свой ./stereo --serve.
+    """
+    parallax = float(cfg.get("parallax_perc", 0.5))
+    layers = int(float(cfg.get("layers_count", 10)))
+    zlayer = int(float(cfg.get("zero_parallax_layer_num", 5)))
+    pair_mode = stereo_engine.OUTPUT_MODES["pair"]
+
+    def make_converter():
+        if cfg.get("engine") == "numpy":
+            engine, close = stereo_engine, None
+        else:
+            engine = StereoWorker(STEREO_EXECUTABLE)
+            close = engine.stop
+
+        def convert(frame):
+            frame = stereo_engine.resize_frame(frame, cfg)
+            return engine.convert(frame, parallax, layers, zlayer, pair_mode)["pair"]
+        return convert, close
+
+    return make_converter
+
+
+def video_work_dir(input_path: Path, cfg: dict) -> Path:
+    """Каталог результата: те же файл и параметры — тот же каталог (туда же и продолжение)."""
+    keys = ("parallax_perc", "layers_count", "zero_parallax_layer_num", "resize_mode",
+            "target_width", "target_height", "engine")
+    params = json.dumps({k: str(cfg.get(k)) for k in keys}, sort_keys=True)
+    digest = hashlib.sha1(params.encode()).hexdigest()[:8]
+    return VIDEO_OUTPUT_FOLDER / f"{input_path.stem}_{digest}"
+
+
+def run_video_conversion(input_path: Path, cfg: dict, progress: dict) -> tuple[bool, str]:
+    started = time.perf_counter()
+    try:
+        with timed(stage_seconds, stage="video"):
+            target = video.convert_video(
+                input_path, video_work_dir(input_path, cfg), video_converter_factory(cfg),
+                workers=VIDEO_WORKERS, segment_frames=VIDEO_SEGMENT_FRAMES,
+                progress=progress, stop_event=video_stop,
+            )
+    except FileNotFoundError as e:
+        return False, f"Файл не найден: {e.filename}"
+    except Exception as e:
+        return False, f"Ошибка конвертации видео: {e}"
+    if progress.get("cached"):
+        return True, f"Видео уже сконвертировано: {target.relative_to(VIDEO_OUTPUT_FOLDER)}."
+    seconds = time.perf_counter() - started
+    frames = progress.get("frames_done") or 0
+    print(f"[video] {input_path.name}: {frames} frames in {seconds:.1f}s ({progress.get('fps')} fps)")
+    return True, (f"Видео готово: {target.relative_to(VIDEO_OUTPUT_FOLDER)} "
+                  f"({frames} кадров, {progress.get('fps')} кадр/с).")
+
 
 def prune_autosnap_files(max_files: int):
     """Держим только последние N файлов с префиксом auto_*.jpg в images/"""
-    files = []
-    for p in IMAGES_FOLDER.glob("auto_*.jpg"):
-        try:
-            stat = p.stat()
-            files.append((stat.st_mtime, p))
-        except FileNotFoundError:
-            pass
-    files.sort(reverse=True)  # новые сверху
-    for _, p in files[max_files:]:
-        try:
-            p.unlink()
-        except Exception:
-            pass
+    image_catalog.prune_auto(max_files)
 
 
 def list_images():
-    return sorted([f for f in os.listdir(IMAGES_FOLDER) if Path(f).suffix.lower() in ALLOWED_EXTENSIONS])
+    return image_catalog.list_names()
 
 
 def is_allowed(filename: str) -> bool:
@@ -284,14 +754,69 @@ def secure_unique_filename(original_name: str) -> str:
     return f"{safe_stem}_{ts}{ext}"
 
 
-def run_conversion(input_path: Path) -> tuple[bool, str]:
-    try:
-        subprocess.run([STEREO_EXECUTABLE, str(input_path)], check=True)
-        return True, f"Изображение «{input_path.name}» сконвертировано."
-    except FileNotFoundError:
-        return False, "Не найден исполняемый файл конвертера (STEREO_EXECUTABLE)."
-    except subprocess.CalledProcessError:
-        return False, "Ошибка при запуске конвертации."
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        http_seconds.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    return response
+
+
+@metrics_registry.collector
+def collect_state():
+    """Текущее состояние очереди, камеры, живого потока и кэша — в момент запроса /metrics."""
+    jobs = conversion_jobs.stats()
+    videos = video_jobs.stats()
+    cam = camera.status()
+    stream = stereo_stream.stats()
+    cache = conversion_cache.stats()
+    version, _, _ = latest_frame.get()
+    snap = auto_snap.stats()
+    cam_running = 1 if cam["state"] == "running" else 0
+    return [
+        ("stereo_queue_pending", "gauge", "Задачи конвертации в очереди", jobs["pending"]),
+        ("stereo_queue_running", "gauge", "Задачи конвертации в работе", jobs["running"]),
+        ("stereo_queue_capacity", "gauge", "Максимум задач в очереди", jobs["capacity"]),
+        ("video_queue_pending", "gauge", "Видео в очереди", videos["pending"]),
+        ("video_queue_running", "gauge", "Видео в работе", videos["running"]),
+        ("camera_up", "gauge", "Камера открыта и отдаёт кадры", cam_running),
+        ("camera_capture_fps", "gauge", "Фактический FPS захвата", cam["capture_fps"]),
+        ("camera_frames_total", "counter", "Прочитано кадров с камеры", cam["frames_total"]),
+        ("camera_read_failures_total", "counter", "Неудачные чтения кадра", cam["read_failures"]),
+        ("camera_dropped_frames_total", "counter", "Оценка пропущенных кадров по интервалам", cam["dropped_frames"]),
+        ("camera_reopens_total", "counter", "Переоткрытия камеры", cam["reopens"]),
+        ("camera_open_seconds", "gauge", "Время последнего открытия камеры",
+         cam["open_ms"] / 1000 if cam["open_ms"] is not None else None),
+        ("stereo_stream_viewers", "gauge", "Зрители /stereo-feed", stream["viewers"]),
+        ("stereo_stream_fps", "gauge", "FPS живого стерео-потока", stream["fps"]),
+        ("stereo_incremental_converted_ratio", "gauge",
+         "Доля полос, пересчитанных в последнем кадре (инкрементальный режим)",
+         {(("source", "stream"),): stream_incremental.last_changed,
+          (("source", "camera"),): camera_incremental.last_changed}),
+        ("stereo_stream_skipped_frames_total", "counter", "Кадры камеры, пропущенные живым потоком", stream["skipped"]),
+        ("stereo_cache_requests_total", "counter", "Обращения к кэшу результатов",
+         {(("result", "hit_memory"),): cache["hits_memory"], (("result", "hit_disk"),): cache["hits_disk"],
+          (("result", "miss"),): cache["misses"]}),
+        ("stereo_cache_bytes", "gauge", "Размер кэша результатов на диске", cache["disk_bytes"]),
+        ("stereo_latest_version", "counter", "Версия опубликованного кадра", version),
+        ("autosnap_lateness_seconds", "gauge", "Опоздание последнего тика автоснимка",
+         snap["lateness_ms"]["last"] / 1000 if snap["lateness_ms"]["last"] is not None else None),
+        ("autosnap_missed_ticks_total", "counter", "Тики автоснимка, пропущенные целиком", snap["missed_ticks"]),
+        ("autosnap_dropped_frames_total", "counter", "Снятые кадры, вытесненные более свежими", snap["dropped_frames"]),
+        ("autosnap_conversions_total", "counter", "Автоконвертации: поставлено / пропущено (занято)",
+         {(("result", k),): v for k, v in snap["conversions"].items()}),
+    ]
+
+
+@app.route('/metrics')
+def metrics_view():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route('/')
@@ -301,20 +826,42 @@ def serve_index():
 
 @app.route('/get-image')
 def get_image():
-    # приоритет — latest.jpg
-    latest = CONVERTED_IMAGES_FOLDER / "latest.jpg"
-    # совместимость: если latest ещё нет, пробуем pair.jpg
-    fallback = CONVERTED_IMAGES_FOLDER / "pair.jpg"
-
-    target = latest if latest.exists() else (fallback if fallback.exists() else None)
-    if not target:
+    version, etag, data = latest_frame.get()
+    if data is None:
         abort(404, description="Нет сконвертированных изображений")
 
-    resp = make_response(send_file(target, mimetype='image/jpeg'))
-    # Жёстко отключаем кэш
-    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    resp.headers['Pragma'] = 'no-cache'
-    resp.headers['Expires'] = '0'
+    # кадр не менялся — отдаём 304 без тела
+    if request.if_none_match.contains(etag):
+        resp = make_response('', 304)
+    else:
+        resp = make_response(data)
+        resp.headers['Content-Type'] = encoding.mimetype_of(data)
+    # кэшировать можно, но каждый раз сверяться по ETag
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Frame-Version'] = str(version)
+    return resp
+
+
+@app.route('/events')
+def events():
+    """
+    Server-Sent Events: событие "frame" с номером версии при каждой публикации.
+    Зритель перекачивает /get-image только по событию.
+    """
+    def gen():
+        version = -1
+        while True:
+            current = latest_frame.wait_newer(version, timeout=15)
+            if current > version:
+                version = current
+                yield f"event: frame\ndata: {json.dumps({'version': version})}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+
+    resp = Response(gen(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
     return resp
 
 
@@ -329,13 +876,13 @@ def admin():
         if filename:
             input_path = IMAGES_FOLDER / filename
             if input_path.exists():
-                ok, msg = run_conversion(input_path)
-                if ok:
-                    flash(msg, "success")
-                    return redirect(url_for('admin'))
-                else:
-                    flash(msg, "error")
+                try:
+                    job, _ = submit_conversion(input_path)
+                except QueueFull as e:
+                    flash(str(e), "error")
                     return redirect(url_for('admin'))
+                flash(f"Конвертация «{filename}» поставлена в очередь (задача {job.id}).", "success")
+                return redirect(url_for('admin'))
         flash('Файл не найден', 'error')
         return redirect(url_for('admin'))
 
@@ -355,6 +902,8 @@ def upload():
     filename = secure_unique_filename(file.filename)
     save_path = IMAGES_FOLDER / filename
     file.save(save_path)
+    image_catalog.add(filename)
+    renditions.prewarm(filename)
 
     return jsonify({'ok': True, 'message': f'Файл загружен: {filename}', 'filename': filename})
 
@@ -370,8 +919,198 @@ def convert():
     if not input_path.exists():
         return jsonify({'ok': False, 'message': 'Файл не найден.'}), 404
 
-    ok, msg = run_conversion(input_path)
-    return jsonify({'ok': ok, 'message': msg})
+    try:
+        job, created = submit_conversion(input_path)
+    except QueueFull as e:
+        return jsonify({'ok': False, 'message': str(e)}), 429
+
+    # wait=true — старое синхронное поведение (ответ после окончания конвертации)
+    if str(data.get('wait', 'false')).lower() == 'true':
+        job.wait()
+        return jsonify({'ok': job.ok, 'message': job.message, 'job_id': job.id})
+
+    msg = 'Конвертация поставлена в очередь.' if created else 'Такая конвертация уже в очереди.'
+    return jsonify({'ok': True, 'message': msg, 'job_id': job.id, 'status': job.status}), 202
+
+
+@app.route('/jobs', methods=['GET'])
+def jobs_list():
+    return jsonify({'jobs': conversion_jobs.recent(), 'stats': conversion_jobs.stats()})
+
+
+@app.route('/batch-convert', methods=['POST'])
+def batch_convert():
+    """
+    Пакетная конвертация на пуле процессов. Тело: {"filenames": [...]} | {"glob": "auto_*.jpg"} | {"all": true}.
+    Ответ — поток NDJSON: start, file (по мере готовности, с временем), end.
+    """
+    data = request.get_json(silent=True) or {}
+    available = list_images()
+    if data.get('filenames'):
+        known = set(available)
+        files = [n for n in data['filenames'] if n in known]
+    elif data.get('glob'):
+        files = fnmatch.filter(available, str(data['glob']))
+    elif str(data.get('all', 'false')).lower() == 'true':
+        files = available
+    else:
+        files = []
+    if not files:
+        return jsonify({'ok': False, 'message': 'Нет файлов для пакетной конвертации.'}), 400
+
+    cfg = read_config()
+    params = {
+        "parallax_perc": float(cfg.get("parallax_perc", 0.5)),
+        "layers_count": int(float(cfg.get("layers_count", 10))),
+        "zero_parallax_layer_num": int(float(cfg.get("zero_parallax_layer_num", 5))),
+        "output_mode": (cfg.get("output_mode") or "both").lower(),
+        "resize_mode": (cfg.get("resize_mode") or "none").lower(),
+        "target_width": cfg.get("target_width"),
+        "target_height": cfg.get("target_height"),
+        "jpeg_quality": cfg.get("jpeg_quality"),
+        "output_format": cfg.get("output_format"),
+        "chroma_subsampling": cfg.get("chroma_subsampling"),
+        "encoder": cfg.get("encoder"),
+        # постоянный воркер один на сервер — в пакете вместо него numpy в каждом процессе
+        "engine": "native" if cfg.get("engine") == "native" else "numpy",
+        "executable": STEREO_EXECUTABLE,
+    }
+    paths = [IMAGES_FOLDER / n for n in files]
+
+    def gen():
+        try:
+            for event in batch.run_batch(paths, BATCH_FOLDER, params, workers=BATCH_WORKERS):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            # текущий пакет — самый новый, его файлы остаются доступны через /batch-file
+            prune_job_outputs(KEEP_BATCH_OUTPUTS, BATCH_FOLDER)
+
+    return Response(gen(), mimetype='application/x-ndjson')
+
+
+@app.route('/batch-file')
+def batch_file():
+    path = request.args.get('path', '')
+    if not path or '..' in path or path.startswith('/'):
+        return "bad path", 400
+    return send_from_directory(str(BATCH_FOLDER), path)
+
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(conversion_cache.stats())
+
+
+@app.route('/resize-stats', methods=['GET'])
+def resize_stats_view():
+    """Время чтения+ресайза по режимам (none|fit|exact)."""
+    with resize_stats_lock:
+        modes = {
+            mode: {"count": st["count"], "avg_ms": round(st["total_ms"] / st["count"], 1),
+                   "last_ms": round(st["last_ms"], 1)}
+            for mode, st in resize_stats.items()
+        }
+    return jsonify({'ok': True, 'modes': modes})
+
+
+@app.route('/encode-stats', methods=['GET'])
+def encode_stats_view():
+    """Время кодирования и размер результата по кодировщику/формату/качеству."""
+    with encode_stats_lock:
+        encoders = {
+            key: {"count": st["count"], "avg_ms": round(st["total_ms"] / st["count"], 1),
+                  "last_ms": round(st["last_ms"], 1),
+                  "avg_kb": round(st["total_bytes"] / st["count"] / 1024, 1),
+                  "last_kb": round(st["last_bytes"] / 1024, 1)}
+            for key, st in encode_stats.items()
+        }
+    return jsonify({'ok': True, 'encoders': encoders})
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = conversion_jobs.get(job_id)
+    if job is None:
+        return jsonify({'ok': False, 'message': 'Задача не найдена.'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/upload-video', methods=['POST'])
+def upload_video():
+    # видео крупнее снимков: свой лимит размера для этого запроса
+    request.max_content_length = MAX_VIDEO_CONTENT_LENGTH
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'ok': False, 'message': 'Файл не выбран.'}), 400
+
+    if Path(file.filename).suffix.lower() not in video.VIDEO_EXTENSIONS:
+        return jsonify({'ok': False, 'message': 'Допустимы только MP4/AVI.'}), 400
+
+    filename = secure_unique_filename(file.filename)
+    file.save(VIDEOS_FOLDER / filename)
+    return jsonify({'ok': True, 'message': f'Видео загружено: {filename}', 'filename': filename})
+
+
+@app.route('/videos', methods=['GET'])
+def videos_list():
+    """Загруженные видео и готовые SBS-ролики."""
+    sources = sorted(p.name for p in VIDEOS_FOLDER.iterdir()
+                     if p.is_file() and p.suffix.lower() in video.VIDEO_EXTENSIONS)
+    results = []
+    if VIDEO_OUTPUT_FOLDER.exists():
+        for p in sorted(VIDEO_OUTPUT_FOLDER.glob("*/*_sbs.*")):
+            results.append({"path": str(p.relative_to(VIDEO_OUTPUT_FOLDER)), "size": p.stat().st_size})
+    return jsonify({'ok': True, 'videos': sources, 'results': results})
+
+
+@app.route('/convert-video', methods=['POST'])
+def convert_video():
+    """
+    Ставит видео в очередь конвертации. Повторный запрос с теми же файлом и
+    параметрами продолжает прерванную конвертацию с последнего готового сегмента.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename')
+    if not filename or any(x in filename for x in ('..', '/', '\\')):
+        return jsonify({'ok': False, 'message': 'Не указано имя файла.'}), 400
+
+    input_path = VIDEOS_FOLDER / filename
+    if not input_path.exists():
+        return jsonify({'ok': False, 'message': 'Файл не найден.'}), 404
+
+    cfg = read_config()
+    progress = {"status": "queued"}
+    key = (filename, str(video_work_dir(input_path, cfg)))
+    try:
+        job, created = video_jobs.submit(key, run_video_conversion, input_path, cfg, progress)
+    except QueueFull as e:
+        return jsonify({'ok': False, 'message': str(e)}), 429
+    if created:
+        job.progress = progress
+
+    msg = 'Видео поставлено в очередь.' if created else 'Это видео уже конвертируется.'
+    return jsonify({'ok': True, 'message': msg, 'job_id': job.id, 'status': job.status}), 202
+
+
+@app.route('/video-jobs', methods=['GET'])
+def video_jobs_list():
+    return jsonify({'jobs': video_jobs.recent(), 'stats': video_jobs.stats()})
+
+
+@app.route('/video-jobs/<job_id>', methods=['GET'])
+def video_job_status(job_id):
+    job = video_jobs.get(job_id)
+    if job is None:
+        return jsonify({'ok': False, 'message': 'Задача не найдена.'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/video-file')
+def video_file():
+    path = request.args.get('path', '')
+    if not path or '..' in path or path.startswith('/'):
+        return "bad path", 400
+    return send_from_directory(str(VIDEO_OUTPUT_FOLDER), path, as_attachment=True)
 
 
 @app.route('/camera-feed')
@@ -381,10 +1120,11 @@ def camera_feed():
         return Response(f"<h3 style='font-family:sans-serif'>Ошибка камеры: {msg}</h3>", mimetype='text/html')
 
     def gen():
+        # каждый новый кадр кодируется один раз на всех зрителей; без нового кадра ничего не шлём
+        seq = 0
         while True:
-            frame = camera.get_jpeg()
+            seq, frame = camera.wait_jpeg(seq, timeout=1.0)
             if frame is None:
-                time.sleep(0.05)
                 continue
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
@@ -392,6 +1132,36 @@ def camera_feed():
     return Response(gen(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
+@app.route('/stereo-feed')
+def stereo_feed():
+    """Живой side-by-side поток с камеры (MJPEG), конвертация в памяти."""
+    ok, msg = camera.start()
+    if not ok:
+        return Response(f"<h3 style='font-family:sans-serif'>Ошибка камеры: {msg}</h3>", mimetype='text/html')
+
+    def gen():
+        with stereo_stream.viewer():
+            seq = 0
+            while True:
+                seq, frame = stereo_stream.wait_jpeg(seq, timeout=1.0)
+                if frame is None:
+                    continue
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+
+    return Response(gen(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@app.route('/stereo-feed-status')
+def stereo_feed_status():
+    return jsonify(dict(stereo_stream.stats(), incremental=stream_incremental.stats()))
+
+
+@app.route('/camera-status')
+def camera_status():
+    return jsonify(camera.status())
+
+
 @app.route('/capture', methods=['POST'])
 def capture():
     want_convert = request.args.get('convert', 'false').lower() == 'true'
@@ -402,26 +1172,51 @@ def capture():
     if cv2 is None:
         return jsonify({'ok': False, 'message': 'OpenCV не установлен.'}), 500
 
-    frame = camera.get_frame()
+    with timed(stage_seconds, stage="capture"):
+        # камера могла только что открыться: ждём первый кадр, а не берём пустой
+        _, frame = camera.wait_frame(0, timeout=CAPTURE_FRAME_TIMEOUT)
     if frame is None:
         return jsonify({'ok': False, 'message': 'Нет кадра с камеры.'}), 500
+    frame = frame.copy()   # кадр камеры общий и только для чтения
 
     filename = f"camera_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
     save_path = IMAGES_FOLDER / filename
-    success = cv2.imwrite(str(save_path), frame, [int(cv2.IMWRITE_JPEG_QUALITY), 92])
+    with timed(stage_seconds, stage="snapshot_write"):
+        success = cv2.imwrite(str(save_path), frame, [int(cv2.IMWRITE_JPEG_QUALITY), 92])
     if not success:
         return jsonify({'ok': False, 'message': 'Не удалось сохранить файл.'}), 500
+    image_catalog.add(filename)
+    renditions.prewarm(filename)
 
     if want_convert:
-        ok_conv, msg_conv = run_conversion(save_path)
-        return jsonify({'ok': ok_conv, 'message': msg_conv, 'filename': filename})
+        try:
+            job, _ = submit_conversion(save_path, frame=frame)
+        except QueueFull as e:
+            return jsonify({'ok': False, 'message': str(e), 'filename': filename}), 429
+        return jsonify({'ok': True, 'message': f'Снимок сохранён: {filename}, конвертация в очереди.',
+                        'filename': filename, 'job_id': job.id}), 202
 
     return jsonify({'ok': True, 'message': f'Снимок сохранён: {filename}', 'filename': filename})
 
 
 @app.route('/images', methods=['GET'])
 def images_api():
-    return jsonify({'images': list_images()})
+    """
+    Список из каталога. Без параметров — все имена (как раньше).
+    offset/limit — страница, origin=upload|camera|auto и q=подстрока — фильтры.
+    """
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = max(0, int(request.args.get('limit', 0))) or None
+    except ValueError:
+        return jsonify({'ok': False, 'message': 'offset/limit должны быть числами.'}), 400
+    origin = request.args.get('origin') or None
+    if origin not in (None, 'upload', 'camera', 'auto'):
+        return jsonify({'ok': False, 'message': 'origin: upload|camera|auto.'}), 400
+
+    total, items = image_catalog.query(offset, limit, origin, request.args.get('q'))
+    return jsonify({'images': [i['name'] for i in items], 'items': items,
+                    'total': total, 'offset': offset, 'limit': limit})
 
 
 @app.route('/config.json', methods=['GET'])
@@ -461,8 +1256,30 @@ def save_config():
     cfg["target_height"] = clamp_int(data.get("target_height", cfg["target_height"]), 0, 10000, 0)
     cfg["jpeg_quality"]  = clamp_int(data.get("jpeg_quality",  cfg["jpeg_quality"]),  1, 100, 95)
 
+    output_format = (data.get("output_format", cfg["output_format"]) or "jpeg").lower()
+    if output_format not in encoding.FORMATS: output_format = "jpeg"
+    cfg["output_format"] = output_format
+
+    subsampling = str(data.get("chroma_subsampling", cfg["chroma_subsampling"]) or "auto").lower()
+    if subsampling not in encoding.SUBSAMPLING: subsampling = "auto"
+    cfg["chroma_subsampling"] = subsampling
+
+    encoder = (data.get("encoder", cfg["encoder"]) or "native").lower()
+    if encoder not in encoding.ENCODERS: encoder = "native"
+    cfg["encoder"] = encoder
+
+    cfg["stream_fps"] = clamp_float(data.get("stream_fps", cfg["stream_fps"]), 0.5, 60.0, 10)
+    cfg["stream_max_width"] = clamp_int(data.get("stream_max_width", cfg["stream_max_width"]), 0, 10000, 960)
+    cfg["incremental"] = "true" if str(data.get("incremental", cfg["incremental"])).lower() in ("1","true","yes","on") else "false"
+    cfg["incremental_threshold"] = clamp_float(data.get("incremental_threshold", cfg["incremental_threshold"]), 0.0, 255.0, 6)
+    cfg["depth_smoothing"] = clamp_float(data.get("depth_smoothing", cfg["depth_smoothing"]), 0.0, 0.95, 0.3)
+
+    engine = (data.get("engine", cfg["engine"]) or "native").lower()
+    if engine not in ("native", "numpy", "worker"): engine = "native"
+    cfg["engine"] = engine
+
     cfg["auto_snap_enabled"] = "true" if str(data.get("auto_snap_enabled", cfg["auto_snap_enabled"])).lower() in ("1","true","yes","on") else "false"
-    cfg["auto_snap_interval"] = clamp_int(data.get("auto_snap_interval", cfg["auto_snap_interval"]), 1, 3600, 5)
+    cfg["auto_snap_interval"] = clamp_float(data.get("auto_snap_interval", cfg["auto_snap_interval"]), AUTO_SNAP_MIN_INTERVAL, 3600, 5)
     cfg["auto_snap_convert"] = "true" if str(data.get("auto_snap_convert", cfg["auto_snap_convert"])).lower() in ("1","true","yes","on") else "false"
     cfg["auto_snap_max_files"] = clamp_int(data.get("auto_snap_max_files", cfg["auto_snap_max_files"]), 1, 10000, 50)
 
@@ -482,22 +1299,66 @@ def image_file():
     return send_file(path)
 
 
+@app.route('/image-rendition')
+def image_rendition():
+    """
+    Уменьшенная копия: size=thumb|preview, format=jpeg|webp.
+    Если v совпадает с текущей версией исходника (mtime_ns) — кэшировать можно навсегда.
+    """
+    name = request.args.get('name', '')
+    if not name or any(x in name for x in ('..', '/', '\\')):
+        return "bad name", 400
+    size = request.args.get('size', 'thumb')
+    fmt = request.args.get('format', 'jpeg').lower()
+    if size not in RENDITION_SIZES or fmt not in RENDITION_FORMATS:
+        return "bad size/format", 400
+
+    try:
+        found = renditions.get(name, size, fmt)
+    except Exception as e:
+        return f"rendition failed: {e}", 500
+    if not found:
+        return "not found", 404
+    path, version = found
+
+    resp = send_file(path, mimetype=RENDITION_FORMATS[fmt][2], conditional=True, etag=path.name)
+    if request.args.get('v') == str(version):
+        resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        resp.headers['Cache-Control'] = 'public, max-age=60'
+    return resp
+
+
 @app.route('/auto-snap-status')
 def auto_snap_status():
     cfg = read_config()
     return jsonify({
         "enabled": cfg.get("auto_snap_enabled") == "true",
-        "interval": int(cfg.get("auto_snap_interval") or 5),
+        "interval": float(cfg.get("auto_snap_interval") or 5),
         "convert": cfg.get("auto_snap_convert") == "true",
         "max_files": int(float(cfg.get("auto_snap_max_files") or 50)),
-        "running": auto_snap_thread.is_alive() if 'auto_snap_thread' in globals() and auto_snap_thread else False,
+        "running": auto_snap.running(),
         "last_filename": last_auto_filename,
+        "last_version": image_catalog.version_of(last_auto_filename) if last_auto_filename else None,
         "last_time": last_auto_time.isoformat() if last_auto_time else None,
-        "last_error": last_auto_error
+        "last_error": auto_snap.last_error,
+        "last_job": last_auto_job.to_dict() if last_auto_job else None,
+        "scheduler": auto_snap.stats(),
     })
 
 
 
+load_latest_from_disk()
+image_catalog.start()
+
+
+def start_services():
+    """Фоновые службы процесса сервера — общие для app.run и server_async.py."""
+    atexit.register(stereo_worker.stop)
+    atexit.register(video_stop.set)
+    auto_snap.start()
+
+
 if __name__ == '__main__':
-    start_auto_snap_thread()
+    start_services()
     app.run(host='0.0.0.0', port=8000, threaded=True)
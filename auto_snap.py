@@ -0,0 +1,153 @@
+# auto_snap.py
+# Автоснимок в два этапа. Планировщик снимает кадр строго по расписанию
+# (монотонный дедлайн, без накопления дрейфа) и кладёт его в маленький буфер;
+# обработчик в своём потоке берёт самый свежий кадр (старые выбрасываются),
+# сохраняет его и ставит конвертацию. Если обработка не успевает — кадры
+# пропускаются, а не копятся.
+
+import threading
+import time
+from collections import deque
+
+
+class AutoSnap:
+    def __init__(self, settings, capture, process, buffer_size=2):
+        """
+        settings() -> dict: enabled (bool), interval (сек, float) — вызывается каждый цикл, должен быть дешёвым;
+        capture() -> (frame, error) — кадр с камеры или (None, текст ошибки);
+        process(frame, captured_at) -> dict: error (или None), conversion ("submitted"|"skipped"|"off").
+        """
+        self.settings = settings
+        self.capture = capture
+        self.process = process
+
+        self.cond = threading.Condition()
+        self.buffer = deque(maxlen=buffer_size)
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.cycles = 0              # сработавших тиков расписания
+        self.missed_ticks = 0        # тиков, пропущенных целиком (захват дольше интервала)
+        self.dropped_frames = 0      # снятых кадров, вытесненных более свежими до обработки
+        self.processed = 0
+        self.conversions = {"submitted": 0, "skipped": 0, "off": 0}
+        self.last_lateness_ms = None
+        self.max_lateness_ms = 0.0
+        self.total_lateness_ms = 0.0
+        self.last_capture_error = None
+        self.last_process_error = None
+
+    def start(self):
+        if any(t.is_alive() for t in self.threads):
+            return
+        self.stop_event.clear()
+        self.threads = [
+            threading.Thread(target=self._scheduler, daemon=True),
+            threading.Thread(target=self._processor, daemon=True),
+        ]
+        for t in self.threads:
+            t.start()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+
+    def running(self) -> bool:
+        return bool(self.threads) and all(t.is_alive() for t in self.threads)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "cycles": self.cycles,
+                "missed_ticks": self.missed_ticks,
+                "dropped_frames": self.dropped_frames,
+                "processed": self.processed,
+                "pending": len(self.buffer),
+                "conversions": dict(self.conversions),
+                "lateness_ms": {
+                    "last": self.last_lateness_ms,
+                    "max": round(self.max_lateness_ms, 2),
+                    "avg": round(self.total_lateness_ms / self.cycles, 2) if self.cycles else None,
+                },
+            }
+
+    @property
+    def last_error(self):
+        return self.last_capture_error or self.last_process_error
+
+    def _scheduler(self):
+        deadline = None
+        interval = None
+        while not self.stop_event.is_set():
+            cfg = self.settings()
+            if not cfg["enabled"]:
+                deadline = None
+                self.stop_event.wait(1.0)
+                continue
+
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now
+            elif cfg["interval"] != interval and deadline - now > cfg["interval"]:
+                # интервал уменьшили — не ждём до конца старого
+                deadline = now + cfg["interval"]
+            interval = cfg["interval"]
+
+            if now < deadline:
+                # не дольше секунды: смена настроек подхватывается без рестарта
+                self.stop_event.wait(min(deadline - now, 1.0))
+                continue
+
+            lateness = now - deadline
+            if lateness >= interval:
+                # не догоняем пропущенные тики пачкой — просто переходим к текущему
+                skipped = int(lateness // interval)
+                deadline += skipped * interval
+                lateness -= skipped * interval
+                with self.cond:
+                    self.missed_ticks += skipped
+            deadline += interval
+
+            with self.cond:
+                self.cycles += 1
+                self.last_lateness_ms = round(lateness * 1000, 2)
+                self.max_lateness_ms = max(self.max_lateness_ms, self.last_lateness_ms)
+                self.total_lateness_ms += self.last_lateness_ms
+
+            try:
+                frame, error = self.capture()
+            except Exception as e:
+                frame, error = None, str(e)
+            self.last_capture_error = error
+            if frame is None:
+                continue
+
+            with self.cond:
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.dropped_frames += 1
+                self.buffer.append((frame, time.time()))
+                self.cond.notify()
+
+    def _processor(self):
+        while not self.stop_event.is_set():
+            with self.cond:
+                self.cond.wait_for(lambda: self.buffer or self.stop_event.is_set(), timeout=1.0)
+                if not self.buffer:
+                    continue
+                frame, captured_at = self.buffer.pop()
+                # всё, что старше, уже неактуально
+                self.dropped_frames += len(self.buffer)
+                self.buffer.clear()
+
+            try:
+                result = self.process(frame, captured_at) or {}
+            except Exception as e:
+                result = {"error": str(e)}
+
+            with self.cond:
+                self.processed += 1
+                conversion = result.get("conversion")
+                if conversion in self.conversions:
+                    self.conversions[conversion] += 1
+            self.last_process_error = result.get("error")
@@ -0,0 +1,170 @@
+# batch.py
+# Пакетная конвертация: файлы раскладываются по пулу процессов (BATCH_WORKERS в app.py),
+# у каждого файла свой каталог результатов, прогресс отдаётся построчно (NDJSON).
+
+import atexit
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+import encoding
+import stereo_engine
+from stereo_worker import StereoWorker
+
+
+# по умолчанию немного: каждый процесс держит свои копии кадра и промежуточных массивов numpy
+POOL_WORKERS = 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# в дочернем процессе: свой ./stereo --serve, если кодировать нужно не в stb
+_worker = None
+
+
+def get_pool(workers: int = POOL_WORKERS) -> ProcessPoolExecutor:
+    """Общий пул на все пакеты; spawn — потому что родитель многопоточный (Flask, камера)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def discard_pool(pool: ProcessPoolExecutor):
+    """Упавший (например, по OOM) пул больше не принимает задачи — следующий get_pool создаст новый."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def worker_for(executable: str) -> StereoWorker:
+    global _worker
+    if _worker is None:
+        _worker = StereoWorker(os.path.abspath(executable))
+        atexit.register(_worker.stop)
+    return _worker
+
+
+def convert_file(input_path: str, out_dir: str, params: dict) -> dict:
+    """
+    Конвертирует один файл в out_dir/{left,right,pair}.<jpg|webp>. Выполняется в дочернем процессе.
+    params: parallax_perc, layers_count, zero_parallax_layer_num, output_mode,
+    resize_mode, target_width, target_height, jpeg_quality, output_format,
+    chroma_subsampling, encoder, engine, executable.
+    """
+    started = time.perf_counter()
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    mode_code = stereo_engine.OUTPUT_MODES.get(params["output_mode"], 0)
+
+    enc = encoding.encode_settings(params)
+    native = params.get("engine") == "native"
+    resize = (params.get("resize_mode") or "none") != "none"
+    frame = None
+    if resize or not native or not encoding.native_supports(enc):
+        frame = stereo_engine.load_image(input_path, params)
+
+    if native and not encoding.native_supports(enc):
+        # тот же C++ код, но пиксели возвращаются сюда и кодируются cv2.imencode
+        results = worker_for(params["executable"]).convert(
+            frame, params["parallax_perc"], params["layers_count"],
+            params["zero_parallax_layer_num"], mode_code,
+        )
+        encoding.write_outputs(results, out, dict(enc, encoder="opencv"))
+        outputs = sorted(f"{name}{encoding.extension(enc)}" for name in results)
+    elif native:
+        src = Path(input_path).resolve()
+        if frame is not None:
+            # ./stereo читает только файлы: уменьшенный кадр — без потерь, рядом с результатом
+            src = out / ".input.png"
+            cv2.imwrite(str(src), frame)
+        try:
+            subprocess.run(
+                [os.path.abspath(params["executable"]), str(src), str(params["parallax_perc"]),
+                 str(params["layers_count"]), str(params["zero_parallax_layer_num"]), str(mode_code),
+                 str(out), str(enc["quality"])],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+        finally:
+            if frame is not None:
+                src.unlink(missing_ok=True)
+        outputs = sorted(p.name for p in out.glob("*.jpg"))
+    else:
+        results = stereo_engine.convert(
+            frame, params["parallax_perc"], params["layers_count"],
+            params["zero_parallax_layer_num"], mode_code,
+        )
+        encoding.write_outputs(results, out, dict(enc, encoder="opencv"))
+        outputs = sorted(f"{name}{encoding.extension(enc)}" for name in results)
+
+    return {"outputs": outputs, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def run_batch(files, out_root: Path, params: dict, workers: int = POOL_WORKERS):
+    """
+    Генератор событий пакета: start, file (по мере готовности), end.
+    Если клиент отключился (генератор закрыт) — ещё не начатые файлы снимаются.
+    Каталог результатов файла — его полное имя: foo.jpg и foo.png не смешиваются.
+    """
+    batch_id = time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+    batch_dir = Path(out_root) / batch_id
+    pool = get_pool(workers)
+    started = time.perf_counter()
+
+    yield {"event": "start", "batch_id": batch_id, "total": len(files),
+           "workers": workers}
+
+    futures = {}
+    for path in files:
+        path = Path(path)
+        args = (convert_file, str(path), str(batch_dir / path.name), params)
+        try:
+            fut = pool.submit(*args)
+        except BrokenProcessPool:
+            # пул упал в прошлом пакете или на первых файлах этого — пересоздаём один раз
+            discard_pool(pool)
+            pool = get_pool(workers)
+            fut = pool.submit(*args)
+        futures[fut] = path
+
+    done = ok_count = 0
+    try:
+        for fut in as_completed(futures):
+            path = futures[fut]
+            done += 1
+            try:
+                res = fut.result()
+                ok_count += 1
+                yield {"event": "file", "filename": path.name, "ok": True, "done": done,
+                       "total": len(files), "seconds": res["seconds"],
+                       "outputs": [f"{batch_id}/{path.name}/{n}" for n in res["outputs"]]}
+            except BrokenProcessPool as e:
+                discard_pool(pool)
+                yield {"event": "file", "filename": path.name, "ok": False, "done": done,
+                       "total": len(files), "message": f"процесс пула упал: {e}"}
+            except Exception as e:
+                yield {"event": "file", "filename": path.name, "ok": False, "done": done,
+                       "total": len(files), "message": str(e)}
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+    yield {"event": "end", "batch_id": batch_id, "ok_count": ok_count,
+           "failed": len(files) - ok_count, "seconds": round(time.perf_counter() - started, 3)}
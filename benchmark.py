@@ -0,0 +1,356 @@
+# benchmark.py
+# Воспроизводимый бенчмарк конвертации: синтетические кадры 720p/1080p/4K/8K
+# (и при желании свои файлы), перебор parallax / layers / output_mode,
+# время по стадиям, результат в JSON и сравнение с сохранённым baseline.
+#
+#   python benchmark.py --quick
+#   python benchmark.py --engines native,numpy --output bench_results.json
+#   python benchmark.py --engines native,native-reference   # ядро lut против прежнего
+#   python benchmark.py --engines native,worker --formats jpeg,webp --quality 100,90,80
+#   python benchmark.py --save-baseline bench_baseline.json
+#   python benchmark.py --baseline bench_baseline.json --threshold 0.15
+#
+# Код возврата 1, если относительно baseline есть регрессии.
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import cv2
+from PIL import Image
+
+import encoding
+import stereo_engine
+from stereo_worker import StereoWorker
+
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+MODE_NAMES = {0: "both", 1: "pair", 2: "split"}
+SEED = 20240501
+
+
+def synthetic_image(width: int, height: int, seed: int = SEED) -> np.ndarray:
+    """
+    Детерминированный тестовый кадр (BGR): плавные градиенты (глубина меняется
+    по всему кадру), шум (как у камеры) и фигуры с резкими краями (дырки
+    при сдвиге), чтобы нагрузка на fill_holes была как у реальных снимков.
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.empty((height, width, 3), dtype=np.float32)
+    base[..., 0] = 255 * xx / max(1, width - 1)
+    base[..., 1] = 255 * yy / max(1, height - 1)
+    base[..., 2] = 128 + 100 * np.sin(xx / width * 6.0) * np.cos(yy / height * 4.0)
+
+    noise = rng.normal(0, 12, (height // 8 + 1, width // 8 + 1, 3)).astype(np.float32)
+    base += cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+    image = np.clip(base, 0, 255).astype(np.uint8)
+
+    scale = width / 1280
+    for _ in range(24):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cx, cy = int(rng.integers(0, width)), int(rng.integers(0, height))
+        if rng.random() < 0.5:
+            cv2.circle(image, (cx, cy), int(rng.integers(20, 120) * scale), color, -1)
+        else:
+            w, h = (int(v * scale) for v in rng.integers(30, 240, 2))
+            cv2.rectangle(image, (cx, cy), (cx + w, cy + h), color, -1)
+    return image
+
+
+def prepare_inputs(names, extra_images, data_dir: Path) -> list:
+    """[(метка, путь к JPEG)] — синтетика кэшируется в data_dir между запусками."""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    inputs = []
+    for name in names:
+        width, height = RESOLUTIONS[name]
+        path = data_dir / f"synthetic_{name}_{SEED}.jpg"
+        if not path.exists():
+            tmp = path.with_suffix(".tmp.jpg")
+            cv2.imwrite(str(tmp), synthetic_image(width, height), [int(cv2.IMWRITE_JPEG_QUALITY), 92])
+            tmp.replace(path)
+        inputs.append((name, path))
+    for pattern in extra_images:
+        for p in sorted(glob.glob(pattern)):
+            inputs.append((Path(p).name, Path(p)))
+    return inputs
+
+
+def parse_timings(stderr: str) -> dict:
+    """Строка "timings decode_ms=... ..." из ./stereo при STEREO_TIMINGS=1."""
+    for line in stderr.splitlines():
+        if line.startswith("timings "):
+            return {k: float(v) for k, v in (item.split("=") for item in line.split()[1:])}
+    return {}
+
+
+def publish_ms(result: Path, work: Path) -> float:
+    """Публикация как в app.update_latest_converted: жёсткая ссылка + replace."""
+    started = time.perf_counter()
+    tmp = work / f"latest_{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(result, tmp)
+    except OSError:
+        tmp.write_bytes(result.read_bytes())
+    tmp.replace(work / "latest.jpg")
+    return (time.perf_counter() - started) * 1000
+
+
+def run_native(executable, path, parallax, layers, zpl, mode, work: Path, quality=100, kernel="lut") -> dict:
+    out_dir = work / "out"
+    out_dir.mkdir(exist_ok=True)
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [executable, str(path), str(parallax), str(layers), str(zpl), str(mode), str(out_dir), str(quality)],
+        env=dict(os.environ, STEREO_TIMINGS="1", STEREO_KERNEL=kernel),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    stages = {"subprocess_ms": (time.perf_counter() - started) * 1000}
+    stages.update(parse_timings(proc.stderr))
+    result = out_dir / ("left.jpg" if mode == 2 else "pair.jpg")
+    stages["publish_ms"] = publish_ms(result, work)
+    return stages
+
+
+def run_in_process(convert, path, parallax, layers, zpl, mode, work: Path, timed: bool, enc: dict) -> dict:
+    stages = {}
+    started = time.perf_counter()
+    frame = cv2.imread(str(path), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    stages["decode_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    if timed:
+        outputs = convert(frame, parallax, layers, zpl, mode, timings=stages)
+    else:
+        outputs = convert(frame, parallax, layers, zpl, mode)
+    stages["convert_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    stages["encoded_bytes"] = encoding.write_outputs(outputs, work, enc)
+    stages["encode_ms"] = (time.perf_counter() - started) * 1000
+
+    result = ("left" if mode == 2 else "pair") + encoding.extension(enc)
+    stages["publish_ms"] = publish_ms(work / result, work)
+    return stages
+
+
+def resize_ms(path: Path, repeat: int) -> dict:
+    """Чтение + ресайз до 1920x1080 (как в app при resize_mode=fit/exact), медиана в мс."""
+    result = {}
+    for mode in ("fit", "exact"):
+        cfg = {"resize_mode": mode, "target_width": 1920, "target_height": 1080}
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            stereo_engine.load_image(path, cfg)
+            samples.append((time.perf_counter() - started) * 1000)
+        result[f"resize_{mode}_ms"] = round(statistics.median(samples), 3)
+    return result
+
+
+def summarize(samples: list) -> dict:
+    """
+    Медиана и минимум по каждой стадии; total_ms — сумма медиан верхнего уровня.
+    encoded_bytes (размер всех выходов) от повтора не зависит — берётся как есть;
+    peak_rss_kb / buffer_bytes (память ./stereo) — максимум по повторам.
+    """
+    sizes = [s.pop("encoded_bytes") for s in samples if "encoded_bytes" in s]
+    peaks = [s.pop("peak_rss_kb") for s in samples if "peak_rss_kb" in s]
+    buffers = [s.pop("buffer_bytes") for s in samples if "buffer_bytes" in s]
+    stages = {}
+    for key in samples[0]:
+        values = [s[key] for s in samples if key in s]
+        stages[key] = {"median": round(statistics.median(values), 3), "min": round(min(values), 3)}
+    if "subprocess_ms" in stages:
+        total = stages["subprocess_ms"]["median"] + stages["publish_ms"]["median"]
+    else:
+        total = sum(stages[k]["median"] for k in ("decode_ms", "convert_ms", "encode_ms", "publish_ms"))
+    return {"stages": stages, "total_ms": round(total, 3), "encoded_bytes": int(sizes[-1]) if sizes else None,
+            "peak_rss_mb": round(max(peaks) / 1024, 1) if peaks else None,
+            "buffer_mb": round(max(buffers) / 2**20, 1) if buffers else None}
+
+
+def case_key(case: dict) -> str:
+    # format/quality входят в ключ; у старых результатов их нет — они считаются JPEG q100
+    return (f'{case["engine"]}|{case["image"]}|p={case["parallax_perc"]}|l={case["layers_count"]}|m={case["output_mode"]}'
+            f'|{case.get("format", "jpeg")}|q={case.get("quality", 100)}')
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """Регрессии: медиана выросла больше чем на threshold (доля) и больше чем на min_delta_ms."""
+    base_cases = {case_key(c): c for c in baseline.get("cases", [])}
+    regressions = []
+    for case in results["cases"]:
+        base = base_cases.get(case_key(case))
+        if base is None:
+            continue
+        checks = [("total_ms", base["total_ms"], case["total_ms"])]
+        for stage, st in case["stages"].items():
+            if stage in base["stages"]:
+                checks.append((stage, base["stages"][stage]["median"], st["median"]))
+        for name, old, new in checks:
+            if new > old * (1 + threshold) and new - old > min_delta_ms:
+                regressions.append({"case": case_key(case), "metric": name,
+                                    "baseline": old, "current": new,
+                                    "change": round(new / old - 1, 3) if old else None})
+    return regressions
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Бенчмарк конвертации в стереопару")
+    ap.add_argument("--resolutions", default="720p,1080p,4k,8k")
+    ap.add_argument("--images", action="append", default=[],
+                    help="свои файлы (glob), можно несколько раз, например images/*.jpg")
+    ap.add_argument("--parallax", default="0.5,1.0")
+    ap.add_argument("--layers", default="10,20")
+    ap.add_argument("--modes", default="0,1,2", help="0=both, 1=pair, 2=split")
+    ap.add_argument("--engines", default="native", help="native,native-reference,numpy,worker")
+    ap.add_argument("--formats", default="jpeg", help="jpeg,webp (webp — только numpy/worker)")
+    ap.add_argument("--quality", default="100", help="качество кодирования, например 100,90,80")
+    ap.add_argument("--subsampling", default="auto", choices=encoding.SUBSAMPLING,
+                    help="цветность JPEG для numpy/worker (native — всегда правило stb)")
+    ap.add_argument("--zpl", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--executable", default="./stereo")
+    ap.add_argument("--data-dir", default="bench_data", help="кэш синтетических кадров")
+    ap.add_argument("--output", default="bench_results.json")
+    ap.add_argument("--baseline", help="сравнить с ранее сохранёнными результатами")
+    ap.add_argument("--save-baseline", help="сохранить результаты как baseline")
+    ap.add_argument("--threshold", type=float, default=0.15, help="допустимый рост медианы (доля)")
+    ap.add_argument("--min-delta-ms", type=float, default=5.0, help="игнорировать рост меньше этого")
+    ap.add_argument("--quick", action="store_true", help="720p/1080p, один набор параметров, 1 повтор")
+    args = ap.parse_args(argv)
+
+    if args.quick:
+        args.resolutions, args.parallax, args.layers, args.repeat = "720p,1080p", "0.5", "10", 1
+
+    resolutions = [r for r in args.resolutions.split(",") if r]
+    unknown = [r for r in resolutions if r not in RESOLUTIONS]
+    if unknown:
+        ap.error(f"неизвестные разрешения: {', '.join(unknown)} (есть {', '.join(RESOLUTIONS)})")
+    parallaxes = [float(v) for v in args.parallax.split(",")]
+    layers_list = [int(v) for v in args.layers.split(",")]
+    modes = [int(v) for v in args.modes.split(",")]
+    engines = [e for e in args.engines.split(",") if e]
+    formats = [f for f in args.formats.split(",") if f]
+    unknown = [f for f in formats if f not in encoding.FORMATS]
+    if unknown:
+        ap.error(f"неизвестные форматы: {', '.join(unknown)} (есть {', '.join(encoding.FORMATS)})")
+    qualities = [int(v) for v in args.quality.split(",")]
+    executable = os.path.abspath(args.executable)
+
+    inputs = prepare_inputs(resolutions, args.images, Path(args.data_dir))
+    worker = StereoWorker(executable) if "worker" in engines else None
+
+    results = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "host": platform.node(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "commit": git_commit(),
+            "repeat": args.repeat,
+        },
+        "inputs": [],
+        "cases": [],
+    }
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="stereo_bench_") as tmp:
+            work = Path(tmp)
+            for label, path in inputs:
+                with Image.open(path) as im:
+                    info = {"image": label, "path": str(path), "size": list(im.size)}
+                info.update(resize_ms(path, args.repeat))
+                results["inputs"].append(info)
+                print(f"[bench] {label}: resize fit {info['resize_fit_ms']} ms, exact {info['resize_exact_ms']} ms")
+
+                combos = itertools.product(engines, parallaxes, layers_list, modes, formats, qualities)
+                for engine, parallax, layers, mode, fmt, quality in combos:
+                    if fmt != "jpeg" and engine.startswith("native"):
+                        # ./stereo пишет только JPEG (stb); WebP — через worker/numpy
+                        continue
+                    enc = {"format": fmt, "quality": quality, "subsampling": args.subsampling, "encoder": "opencv"}
+                    samples = []
+                    for _ in range(args.repeat):
+                        if engine == "native":
+                            s = run_native(executable, path, parallax, layers, args.zpl, mode, work, quality)
+                        elif engine == "native-reference":
+                            s = run_native(executable, path, parallax, layers, args.zpl, mode, work, quality,
+                                           kernel="reference")
+                        elif engine == "numpy":
+                            s = run_in_process(stereo_engine.convert, path, parallax, layers,
+                                               args.zpl, mode, work, timed=True, enc=enc)
+                        elif engine == "worker":
+                            s = run_in_process(worker.convert, path, parallax, layers,
+                                               args.zpl, mode, work, timed=False, enc=enc)
+                        else:
+                            ap.error(f"неизвестный движок: {engine}")
+                        samples.append(s)
+                    case = {"engine": engine, "image": label, "parallax_perc": parallax,
+                            "layers_count": layers, "output_mode": mode, "format": fmt, "quality": quality}
+                    case.update(summarize(samples))
+                    results["cases"].append(case)
+                    stages = ", ".join(f"{k[:-3]} {v['median']:.1f}" for k, v in case["stages"].items())
+                    size = f", {case['encoded_bytes'] / 1024:.0f} KB" if case["encoded_bytes"] else ""
+                    if case["peak_rss_mb"]:
+                        size += f", peak {case['peak_rss_mb']:.0f} MB"
+                    print(f"[bench] {engine} {label} p={parallax} l={layers} "
+                          f"mode={MODE_NAMES.get(mode, mode)} {fmt} q{quality}: "
+                          f"{case['total_ms']:.1f} ms ({stages}){size}")
+    finally:
+        if worker:
+            worker.stop()
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        results["baseline"] = {"path": args.baseline, "commit": baseline.get("meta", {}).get("commit"),
+                               "threshold": args.threshold, "regressions": regressions}
+        for r in regressions:
+            print(f"[bench] REGRESSION {r['case']} {r['metric']}: {r['baseline']:.1f} -> {r['current']:.1f} ms")
+        print(f"[bench] regressions: {len(regressions)}")
+        exit_code = 1 if regressions else 0
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"[bench] results: {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"[bench] baseline saved: {args.save_baseline}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,15 +3,29 @@ try:
 except Exception:
     cv2 = None
 
+import glob
+import json
+import os
+import re
 import threading
 import time
+from pathlib import Path
+
+FOURCCS = ["MJPG", "YUYV", None]
+
+# подряд неудачных чтений, после которых переоткрываем камеру (~1 с)
+READ_FAILURES_BEFORE_REOPEN = 50
+
 
 class Camera:
-    def __init__(self, device_index=0, width=1280, height=720, fps=30):
+    def __init__(self, device_index=0, width=1280, height=720, fps=30, state_path=None):
         self.device_index = device_index
         self.width = width
         self.height = height
         self.fps = fps
+        self.fourcc = None
+        # последний рабочий набор (index, size, fps, fourcc) — пробуем его первым
+        self.state_path = Path(state_path) if state_path else None
 
         self.cap = None
         self.lock = threading.Lock()
@@ -19,18 +33,47 @@ class Camera:
         self.running = False
         self.thread = None
 
-    def _open_once(self, idx, width, height, fps, fourcc_code=None):
+        # Открытие идёт в фоне, не под self.lock: state = stopped|starting|running|error
+        self.state = "stopped"
+        self.state_changed = threading.Condition(self.lock)
+        self.last_error = None
+        self.open_ms = None
+        self.first_frame_ms = None
+        self.open_started = None
+
+        # Раздача кадров зрителям: каждый новый кадр получает номер,
+        # в JPEG кодируется один раз и отдаётся всем одинаковыми байтами
+        self.frame_cond = threading.Condition(self.lock)
+        self.frame_seq = 0
+        self.encode_lock = threading.Lock()
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self.jpeg_quality = 85
+
+        # Счётчики для /metrics: кадры, неудачные чтения, пропуски по интервалам
+        self.frames_total = 0
+        self.read_failures = 0
+        self.dropped_frames = 0
+        self.reopens = 0
+        self.capture_fps = 0.0
+        self.last_frame_time = None
+
+    def _open_once(self, idx, width, height, fps, fourcc=None):
+        """
+        Возвращает (cap, device_ok): cap — открытая камера с первым кадром или None;
+        device_ok=False — устройство не открылось вообще (другие форматы пробовать бессмысленно).
+        """
         cap = cv2.VideoCapture(idx, cv2.CAP_V4L2)
         if not cap or not cap.isOpened():
             cap2 = cv2.VideoCapture(idx)
             if not cap2 or not cap2.isOpened():
                 if cap: cap.release()
-                return None
+                return None, False
             if cap: cap.release()
             cap = cap2
 
-        if fourcc_code is not None:
-            cap.set(cv2.CAP_PROP_FOURCC, fourcc_code)
+        if fourcc is not None:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
         cap.set(cv2.CAP_PROP_FRAME_WIDTH,  int(width))
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, int(height))
         cap.set(cv2.CAP_PROP_FPS,          int(fps))
@@ -39,61 +82,265 @@ class Camera:
         for _ in range(10):
             ok, frame = cap.read()
             if ok and frame is not None and frame.size:
-                return cap
-            cv2.waitKey(1)
+                return cap, True
+            time.sleep(0.01)
 
         cap.release()
-        return None
+        return None, True
+
+    def source_name(self) -> str:
+        return f"/dev/video{self.device_index}"
+
+    def _load_state(self):
+        if not self.state_path or not self.state_path.exists():
+            return None
+        try:
+            st = json.loads(self.state_path.read_text(encoding="utf-8"))
+            return int(st["index"]), int(st["width"]), int(st["height"]), int(st["fps"]), st.get("fourcc")
+        except Exception:
+            return None
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({
+                "index": self.device_index, "width": self.width, "height": self.height,
+                "fps": self.fps, "fourcc": self.fourcc,
+            }), encoding="utf-8")
+            tmp.replace(self.state_path)
+        except Exception as e:
+            print(f"[camera] failed to save state: {e}")
+
+    def _device_indices(self):
+        """Существующие /dev/videoN (один раз за попытку), иначе — прежний список наугад."""
+        found = sorted(int(m.group(1)) for m in
+                       (re.match(r"/dev/video(\d+)$", p) for p in glob.glob("/dev/video*")) if m)
+        if not found:
+            found = [1, 0, 2, 3]  # сначала попробуем 1 (часто MJPG)
+        if self.device_index in found:
+            found.remove(self.device_index)
+            found.insert(0, self.device_index)
+        return found
 
     def _try_open(self):
-        indices = [self.device_index, 1, 0, 2, 3]  # сначала попробуем 1 (часто MJPG)
-        fourccs = [cv2.VideoWriter_fourcc(*'MJPG'),
-                   cv2.VideoWriter_fourcc(*'YUYV'),
-                   None]
+        cached = self._load_state()
+        if cached:
+            idx, w, h, f, fc = cached
+            cap, _ = self._open_once(idx, w, h, f, fc)
+            if cap:
+                self.device_index, self.width, self.height, self.fps, self.fourcc = idx, w, h, f, fc
+                return cap
+
         sizes = [(self.width, self.height), (1280,720), (640,480)]
         fps_list = [self.fps, 30, 25, 15]
 
-        for idx in indices:
-            for (w,h) in sizes:
-                for f in fps_list:
-                    for fc in fourccs:
-                        cap = self._open_once(idx, w, h, f, fc)
+        for idx in self._device_indices():
+            device_ok = True
+            for (w,h) in dict.fromkeys(sizes):
+                for f in dict.fromkeys(fps_list):
+                    for fc in FOURCCS:
+                        cap, device_ok = self._open_once(idx, w, h, f, fc)
                         if cap:
-                            self.device_index, self.width, self.height, self.fps = idx, w, h, f
+                            self.device_index, self.width, self.height, self.fps, self.fourcc = idx, w, h, f, fc
+                            self._save_state()
                             return cap
+                        if not device_ok:
+                            break
+                    if not device_ok:
+                        break
+                if not device_ok:
+                    break
         return None
 
-    def start(self):
-        if cv2 is None:
-            return False, "OpenCV (cv2) не установлен."
+    def _opener(self):
+        t0 = time.monotonic()
+        cap = self._try_open()
         with self.lock:
-            if self.running:
-                return True, "OK"
-            cap = self._try_open()
+            self.open_ms = round((time.monotonic() - t0) * 1000, 1)
+            if self.state != "starting":
+                # stop() пришёл, пока открывали
+                if cap:
+                    cap.release()
+                return
             if not cap:
-                return False, "Камера не открывается (проверь индексы/форматы)."
+                self.state = "error"
+                self.last_error = "Камера не открывается (проверь индексы/форматы)."
+                self.state_changed.notify_all()
+                return
             self.cap = cap
             self.running = True
-            self.thread = threading.Thread(target=self._reader, daemon=True)
-            self.thread.start()
-            return True, "OK"
+            self.state = "running"
+            self.last_error = None
+            self.state_changed.notify_all()
+        print(f"[camera] opened {self.source_name()} {self.width}x{self.height}@{self.fps} "
+              f"{self.fourcc or 'auto'} in {self.open_ms} ms")
+        self._reader()
+
+    def start(self, timeout=10.0):
+        """
+        Запускает камеру (открытие — в фоне, get_frame не блокируется).
+        Ждёт не дольше timeout; если камера ещё открывается — (False, "...запускается").
+        """
+        if cv2 is None:
+            return False, "OpenCV (cv2) не установлен."
+        with self.lock:
+            if self.state == "running":
+                return True, "OK"
+            if self.state != "starting":
+                self.state = "starting"
+                self.open_started = time.monotonic()
+                self.first_frame_ms = None
+                self.thread = threading.Thread(target=self._opener, daemon=True)
+                self.thread.start()
+            self.state_changed.wait_for(lambda: self.state != "starting", timeout)
+            if self.state == "running":
+                return True, "OK"
+            if self.state == "starting":
+                return False, "Камера запускается, повторите позже."
+            return False, self.last_error
+
+    def _count_frame(self, now, window):
+        """Под self.lock: FPS за окно ~2 с и оценка пропущенных драйвером кадров по интервалу."""
+        self.frames_total += 1
+        if self.last_frame_time is not None and self.fps:
+            expected = 1.0 / self.fps
+            gap = now - self.last_frame_time
+            if gap > expected * 1.5:
+                self.dropped_frames += int(round(gap / expected)) - 1
+        self.last_frame_time = now
+        window_start, window_frames = window
+        if now - window_start >= 2.0:
+            self.capture_fps = round((self.frames_total - window_frames) / (now - window_start), 2)
+            return now, self.frames_total
+        return window
 
     def _reader(self):
+        failures = 0
+        window = (time.monotonic(), self.frames_total)
         while self.running and self.cap:
             ok, frame = self.cap.read()
             if ok and frame is not None and frame.size:
+                failures = 0
+                now = time.monotonic()
                 with self.lock:
+                    if self.first_frame_ms is None and self.open_started is not None:
+                        self.first_frame_ms = round((now - self.open_started) * 1000, 1)
                     self.last_frame = frame
+                    self.frame_seq += 1
+                    window = self._count_frame(now, window)
+                    self.frame_cond.notify_all()
             else:
+                failures += 1
+                with self.lock:
+                    self.read_failures += 1
+                if failures >= READ_FAILURES_BEFORE_REOPEN:
+                    # камера "отвалилась": переоткрываем, сохранённый набор пробуется первым
+                    if not self._reopen():
+                        return
+                    failures = 0
+                    continue
                 time.sleep(0.02)
 
+    def _reopen(self) -> bool:
+        with self.lock:
+            if not self.running:
+                return False
+            cap, self.cap = self.cap, None
+            self.reopens += 1
+            self.last_frame_time = None
+            self.state = "starting"
+            self.open_started = time.monotonic()
+            self.first_frame_ms = None
+        if cap:
+            cap.release()
+        t0 = time.monotonic()
+        cap = self._try_open()
+        with self.lock:
+            self.open_ms = round((time.monotonic() - t0) * 1000, 1)
+            if not cap or not self.running:
+                self.running = False
+                self.state = "error" if not cap else "stopped"
+                self.last_error = None if cap else "Камера отключилась и не открывается."
+                self.state_changed.notify_all()
+                if cap:
+                    cap.release()
+                return False
+            self.cap = cap
+            self.state = "running"
+            self.state_changed.notify_all()
+        print(f"[camera] reopened in {self.open_ms} ms")
+        return True
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "state": self.state,
+                "device_index": self.device_index,
+                "width": self.width,
+                "height": self.height,
+                "fps": self.fps,
+                "fourcc": self.fourcc,
+                "open_ms": self.open_ms,
+                "first_frame_ms": self.first_frame_ms,
+                "last_error": self.last_error,
+                "capture_fps": self.capture_fps if self.state == "running" else 0.0,
+                "frames_total": self.frames_total,
+                "read_failures": self.read_failures,
+                "dropped_frames": self.dropped_frames,
+                "reopens": self.reopens,
+            }
+
+    def _encode(self, seq, frame):
+        """JPEG для кадра seq; кодирует только первый, кому он понадобился."""
+        with self.encode_lock:
+            with self.lock:
+                if self.jpeg_seq >= seq:
+                    return self.jpeg_seq, self.jpeg
+            ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if not ok:
+                return seq, None
+            data = buf.tobytes()
+            with self.lock:
+                self.jpeg, self.jpeg_seq = data, seq
+            return seq, data
+
+    def wait_jpeg(self, last_seq=0, timeout=1.0):
+        """
+        Ждёт кадр новее last_seq и возвращает (seq, jpeg).
+        Медленный клиент получает сразу самый свежий кадр, промежуточные пропускаются.
+        По таймауту — (last_seq, None).
+        """
+        if cv2 is None:
+            return last_seq, None
+        with self.frame_cond:
+            if not self.frame_cond.wait_for(lambda: self.frame_seq > last_seq, timeout):
+                return last_seq, None
+            seq, frame = self.frame_seq, self.last_frame
+            if self.jpeg_seq == seq:
+                return seq, self.jpeg
+        return self._encode(seq, frame)
+
+    def wait_frame(self, last_seq=0, timeout=1.0):
+        """
+        Ждёт кадр новее last_seq и возвращает (seq, frame) без копии —
+        кадр только для чтения. По таймауту — (last_seq, None).
+        """
+        with self.frame_cond:
+            if not self.frame_cond.wait_for(lambda: self.frame_seq > last_seq, timeout):
+                return last_seq, None
+            return self.frame_seq, self.last_frame
+
     def get_jpeg(self):
         with self.lock:
-            frame = None if self.last_frame is None else self.last_frame.copy()
+            seq, frame = self.frame_seq, self.last_frame
+            if frame is not None and self.jpeg_seq == seq:
+                return self.jpeg
         if frame is None or cv2 is None:
             return None
-        ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-        return buf.tobytes() if ok else None
+        return self._encode(seq, frame)[1]
 
     def get_frame(self):
         with self.lock:
@@ -102,10 +349,117 @@ class Camera:
     def stop(self):
         with self.lock:
             self.running = False
+            self.state = "stopped"
             cap = self.cap
             self.cap = None
         if cap:
             cap.release()
 
 
-camera = Camera(device_index=1)
+class FakeCapture:
+    """
+    Подмена cv2.VideoCapture для стендов и нагрузочных тестов: кадры с заданным FPS
+    из видео (по кругу), картинки/папки с картинками или синтетические (градиент
+    с движущейся полосой — каждый кадр отличается, кэш результатов не срабатывает).
+    """
+
+    def __init__(self, source, width, height, fps):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_at = time.monotonic()
+        self.index = 0
+        self.video = None
+        self.images = []
+        self.base = None
+
+        path = Path(source)
+        if source != "synthetic" and path.is_dir():
+            files = sorted(p for p in path.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+            self.images = [self._fit(cv2.imread(str(p))) for p in files]
+            self.images = [img for img in self.images if img is not None]
+        elif source != "synthetic" and path.suffix.lower() in (".mp4", ".avi"):
+            self.video = cv2.VideoCapture(str(path))
+        elif source != "synthetic":
+            image = cv2.imread(str(path))
+            self.images = [self._fit(image)] if image is not None else []
+        else:
+            import numpy as np
+            xx = np.linspace(0, 255, width, dtype=np.float32)
+            yy = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+            self.base = np.empty((height, width, 3), dtype=np.uint8)
+            self.base[..., 0] = xx
+            self.base[..., 1] = yy
+            self.base[..., 2] = (xx + yy) / 2
+
+    def _fit(self, image):
+        if image is None:
+            return None
+        if image.shape[1] != self.width or image.shape[0] != self.height:
+            image = cv2.resize(image, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        return image
+
+    def isOpened(self) -> bool:
+        if self.video is not None:
+            return self.video.isOpened()
+        return self.base is not None or bool(self.images)
+
+    def read(self):
+        # темп как у настоящей камеры: read() блокируется до следующего кадра
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(self.next_at + self.interval, time.monotonic() - self.interval)
+        self.index += 1
+
+        if self.video is not None:
+            ok, frame = self.video.read()
+            if not ok:
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, frame = self.video.read()
+            return ok, self._fit(frame) if ok else None
+        if self.images:
+            return True, self.images[self.index % len(self.images)].copy()
+        frame = self.base.copy()
+        bar = max(8, self.width // 16)
+        x = (self.index * 8) % max(1, self.width - bar)
+        frame[:, x:x + bar] = 255 - frame[:, x:x + bar]
+        return True, frame
+
+    def release(self):
+        if self.video is not None:
+            self.video.release()
+
+
+class FakeCamera(Camera):
+    """Camera без устройства: тот же жизненный цикл, очереди кадров и счётчики, источник — FakeCapture."""
+
+    def __init__(self, source="synthetic", width=1280, height=720, fps=30):
+        super().__init__(device_index=None, width=width, height=height, fps=fps)
+        self.source = source
+        self.fourcc = "fake"
+
+    def source_name(self) -> str:
+        return f"fake:{self.source}"
+
+    def _try_open(self):
+        cap = FakeCapture(self.source, self.width, self.height, self.fps)
+        if not cap.isOpened():
+            print(f"[camera] fake source {self.source} has no frames")
+            return None
+        return cap
+
+
+def _from_env():
+    """CAMERA_SOURCE: пусто — настоящая камера; synthetic | картинка | папка | mp4/avi — FakeCamera."""
+    width = int(os.environ.get("CAMERA_WIDTH", "1280"))
+    height = int(os.environ.get("CAMERA_HEIGHT", "720"))
+    fps = int(os.environ.get("CAMERA_FPS", "30"))
+    source = os.environ.get("CAMERA_SOURCE", "").strip()
+    if source:
+        return FakeCamera(source, width, height, fps)
+    return Camera(device_index=1, width=width, height=height, fps=fps, state_path="config/camera.json")
+
+
+camera = _from_env()
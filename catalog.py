@@ -0,0 +1,149 @@
+# catalog.py
+# Каталог images/ в памяти: имя, размер, mtime, происхождение (upload/camera/auto).
+# Пополняется кодом, который пишет файлы; полная сверка с диском — редко, в фоне
+# (файлы можно подкладывать в images/ вручную).
+
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+
+def origin_of(name: str) -> str:
+    if name.startswith("auto_"):
+        return "auto"
+    if name.startswith("camera_"):
+        return "camera"
+    return "upload"
+
+
+class ImageCatalog:
+    def __init__(self, folder: Path, extensions, reconcile_interval=30.0):
+        self.folder = Path(folder)
+        self.extensions = {e.lower() for e in extensions}
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.Lock()
+        self.entries = {}       # name -> {"name", "size", "mtime", "version", "origin"}
+        self.names = []         # отсортированы по имени (как раньше отдавал list_images)
+        self.auto = deque()     # auto_* от старых к новым — для обрезки за O(1)
+        self.thread = None
+        self.reconcile()
+
+    def _accepts(self, name: str) -> bool:
+        return Path(name).suffix.lower() in self.extensions
+
+    def _insert(self, entry):
+        name = entry["name"]
+        if name not in self.entries:
+            bisect.insort(self.names, name)
+            if entry["origin"] == "auto":
+                # имена auto_YYYYmmdd_HHMMSS — обычно приходят по порядку
+                if not self.auto or self.auto[-1] <= name:
+                    self.auto.append(name)
+                else:
+                    items = sorted(list(self.auto) + [name])
+                    self.auto = deque(items)
+        self.entries[name] = entry
+
+    def _delete(self, name):
+        if self.entries.pop(name, None) is None:
+            return
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            del self.names[i]
+        if origin_of(name) == "auto":
+            if self.auto and self.auto[0] == name:
+                self.auto.popleft()
+            else:
+                try:
+                    self.auto.remove(name)
+                except ValueError:
+                    pass
+
+    def add(self, name: str):
+        """Вызывать после записи файла в каталог."""
+        if not self._accepts(name):
+            return
+        try:
+            st = (self.folder / name).stat()
+        except FileNotFoundError:
+            return
+        entry = {"name": name, "size": st.st_size, "mtime": st.st_mtime,
+                 "version": st.st_mtime_ns, "origin": origin_of(name)}
+        with self.lock:
+            self._insert(entry)
+
+    def remove(self, name: str):
+        with self.lock:
+            self._delete(name)
+
+    def reconcile(self):
+        """Полная сверка с диском (добавляет подложенные вручную, убирает удалённые)."""
+        found = {}
+        with os.scandir(self.folder) as it:
+            for de in it:
+                if de.is_file() and self._accepts(de.name):
+                    st = de.stat()
+                    found[de.name] = {"name": de.name, "size": st.st_size, "mtime": st.st_mtime,
+                                      "version": st.st_mtime_ns, "origin": origin_of(de.name)}
+        with self.lock:
+            for name in [n for n in self.entries if n not in found]:
+                self._delete(name)
+            for entry in found.values():
+                self._insert(entry)
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._reconciler, daemon=True)
+        self.thread.start()
+
+    def _reconciler(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                self.reconcile()
+            except Exception as e:
+                print(f"[catalog] reconcile failed: {e}")
+
+    def version_of(self, name: str):
+        """mtime_ns файла — версия для URL рендишенов."""
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry["version"] if entry else None
+
+    def list_names(self) -> list:
+        with self.lock:
+            return list(self.names)
+
+    def query(self, offset=0, limit=None, origin=None, q=None):
+        """(total, [entry, ...]) с фильтром по происхождению и подстроке имени."""
+        with self.lock:
+            if origin is None and not q:
+                total = len(self.names)
+                names = self.names[offset:offset + limit if limit else None]
+            else:
+                names = [n for n in self.names
+                         if (origin is None or self.entries[n]["origin"] == origin)
+                         and (not q or q.lower() in n.lower())]
+                total = len(names)
+                names = names[offset:offset + limit if limit else None]
+            return total, [dict(self.entries[n]) for n in names]
+
+    def prune_auto(self, max_files: int):
+        """Оставляет только последние max_files автоснимков; удаляет самые старые."""
+        victims = []
+        with self.lock:
+            while len(self.auto) > max_files:
+                name = self.auto[0]
+                self._delete(name)
+                victims.append(name)
+        for name in victims:
+            try:
+                (self.folder / name).unlink()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"[catalog] failed to delete {name}: {e}")
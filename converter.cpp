@@ -1,6 +1,8 @@
 // converter.cpp
 // Генерация стереопары из моно-изображения по яркости (как "глубине").
-// Пишет результаты в converted_images/{left.jpg,right.jpg,pair.jpg}.
+// Пишет результаты в <output_dir>/{left.jpg,right.jpg,pair.jpg}
+// (по умолчанию converted_images/, у каждой задачи сервера — свой каталог).
+// С флагом --serve работает как долгоживущий воркер (см. serve()).
 // Аргументы см. в комментарии в начале файла.
 
 #define STB_IMAGE_IMPLEMENTATION
@@ -13,38 +15,78 @@
 #include <thread>
 #include <algorithm>
 #include <iostream>
+#include <sstream>
+#include <string>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <new>
+#include <atomic>
+#include <mutex>
+#include <condition_variable>
+#include <functional>
+#include <memory>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/resource.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
 #include "stb_image.h"
 #include "stb_image_write.h"
 
 // ------------------------------------------------------------
-// Заполнение "дырок" (прозрачных пикселей по альфа-каналу) построчно
+// Время стадий (мс, накопительно). При STEREO_TIMINGS=1 печатается в stderr
+// одной строкой "timings decode_ms=... process_ms=... fill_ms=... encode_ms=... encoded_bytes=...
+// buffer_bytes=... peak_rss_kb=..."
 // ------------------------------------------------------------
-void fill_rows(uint8_t* image, int width, int height, int start_y, int end_y) {
-    const int imgBpp = 4;
-    const int stride = width * imgBpp;
+struct StageTimings {
+    double decode_ms = 0, process_ms = 0, fill_ms = 0, encode_ms = 0;
+    long long encoded_bytes = 0;   // суммарный размер записанных файлов
+    long long buffer_bytes = 0;    // буферы задачи: вход, выходы, z-буферы/маски, строки глубины
+};
+static StageTimings g_timings;
+
+using Clock = std::chrono::steady_clock;
+
+static double ms_since(Clock::time_point start) {
+    return std::chrono::duration<double, std::milli>(Clock::now() - start).count();
+}
+
+// ------------------------------------------------------------
+// Заполнение "дырок" (пикселей, куда при раскладке ничего не легло) построчно.
+// Выходы RGB без альфа-канала: занятость даёт occupied(y, x) — z-буфер (split)
+// или битовая маска (pair). Выходы заранее не обнуляются: каждая дырка заливается,
+// а строка, где нет ни одного пикселя, заполняется нулями (чёрная, как и раньше).
+// ------------------------------------------------------------
+template <class Occupied>
+static void fill_rows(uint8_t* image, int width, int start_y, int end_y, Occupied occupied) {
+    const int imgBpp = 3;
+    const size_t stride = (size_t)width * imgBpp;
 
     for (int y = start_y; y < end_y; y++) {
         uint8_t* row = image + y * stride;
 
         int x = 0;
         while (x < width) {
-            // пропустить непрозрачные
-            while (x < width && row[x * imgBpp + 3] == 255) x++;
+            // пропустить занятые
+            while (x < width && occupied(y, x)) x++;
             int start = x;
 
-            // найти прозрачный сегмент
-            while (x < width && row[x * imgBpp + 3] == 0) x++;
+            // найти пустой сегмент
+            while (x < width && !occupied(y, x)) x++;
             int end = x;
 
             if (start == end) continue; // нет дырки
             if (start == 0 && end == width) {
-                // строка полностью прозрачная — нечем интерполировать
+                // строка полностью пустая — нечем интерполировать
+                std::memset(row, 0, stride);
                 continue;
             }
 
-            int left = (start > 0) ? start - 1 : end;          // ближайший слева непрозрачный
-            int right = (end < width) ? end : left;            // ближайший справа непрозрачный
+            int left = (start > 0) ? start - 1 : end;          // ближайший слева занятый
+            int right = (end < width) ? end : left;            // ближайший справа занятый
 
             for (int i = start; i < end; i++) {
                 uint8_t* dst = row + i * imgBpp;
@@ -63,13 +105,138 @@ void fill_rows(uint8_t* image, int width, int height, int start_y, int end_y) {
                         );
                     }
                 }
-                dst[3] = 255; // сделать непрозрачным
             }
         }
     }
 }
 
-void fill_holes(uint8_t* image, int width, int height) {
+// Выход: RGB-кадр и его занятость — ровно одно из zbuf / bits
+struct StereoOutput {
+    uint8_t* rgb = nullptr;
+    const uint8_t* zbuf = nullptr;    // split: z-буфер width*height, 0 — пиксель пуст
+    const uint8_t* bits = nullptr;    // pair: 1 бит на пиксель, строка — bits_stride байт
+    int bits_stride = 0;
+};
+
+static void fill_output(const StereoOutput& out, int width, int start_y, int end_y) {
+    if (out.zbuf) {
+        const uint8_t* zbuf = out.zbuf;
+        fill_rows(out.rgb, width, start_y, end_y, [zbuf, width](int y, int x) {
+            return zbuf[(size_t)y * width + x] != 0;
+        });
+    } else {
+        const uint8_t* bits = out.bits;
+        const int stride = out.bits_stride;
+        fill_rows(out.rgb, width, start_y, end_y, [bits, stride](int y, int x) {
+            return ((bits[(size_t)y * stride + (x >> 3)] >> (x & 7)) & 1) != 0;
+        });
+    }
+}
+
+// ------------------------------------------------------------
+// Пул потоков: создаётся один раз на процесс (важно для --serve),
+// задачи раздаются тайлами по атомарному счётчику; вызывающий поток тоже работает.
+// ------------------------------------------------------------
+class ThreadPool {
+public:
+    explicit ThreadPool(int threads) {
+        for (int i = 1; i < threads; i++) workers.emplace_back([this]{ worker_loop(); });
+    }
+
+    ~ThreadPool() {
+        {
+            std::lock_guard<std::mutex> lk(mutex);
+            stopping = true;
+        }
+        wake.notify_all();
+        for (auto& t : workers) t.join();
+    }
+
+    int size() const { return (int)workers.size() + 1; }
+
+    // fn(i) для всех i из [0, count); возвращается, когда все задачи выполнены
+    void parallel_for(int count, const std::function<void(int)>& fn) {
+        if (count <= 0) return;
+        std::lock_guard<std::mutex> run(run_mutex);
+        {
+            std::lock_guard<std::mutex> lk(mutex);
+            task = &fn;
+            task_count = count;
+            next.store(0);
+            pending = count;
+            generation++;
+        }
+        wake.notify_all();
+
+        int finished = drain(&fn, count);
+        std::unique_lock<std::mutex> lk(mutex);
+        pending -= finished;
+        done.wait(lk, [this]{ return pending == 0 && active == 0; });
+        // опоздавший поток увидит пустую задачу и ничего не вызовет
+        task = nullptr;
+        task_count = 0;
+    }
+
+private:
+    int drain(const std::function<void(int)>* fn, int count) {
+        int finished = 0;
+        for (int i = next.fetch_add(1); i < count; i = next.fetch_add(1)) {
+            (*fn)(i);
+            finished++;
+        }
+        return finished;
+    }
+
+    void worker_loop() {
+        uint64_t seen = 0;
+        while (true) {
+            const std::function<void(int)>* fn;
+            int count;
+            {
+                std::unique_lock<std::mutex> lk(mutex);
+                wake.wait(lk, [&]{ return stopping || generation != seen; });
+                if (stopping) return;
+                seen = generation;
+                fn = task;
+                count = task_count;
+                active++;
+            }
+            int finished = fn ? drain(fn, count) : 0;
+            {
+                std::lock_guard<std::mutex> lk(mutex);
+                pending -= finished;
+                active--;
+                if (pending == 0 && active == 0) done.notify_all();
+            }
+        }
+    }
+
+    std::vector<std::thread> workers;
+    std::mutex run_mutex;               // один parallel_for за раз
+    std::mutex mutex;
+    std::condition_variable wake, done;
+    const std::function<void(int)>* task = nullptr;
+    int task_count = 0;
+    std::atomic<int> next{0};
+    int pending = 0;
+    int active = 0;
+    uint64_t generation = 0;
+    bool stopping = false;
+};
+
+static ThreadPool& pool() {
+    static ThreadPool instance(std::max(1, (int)std::thread::hardware_concurrency()));
+    return instance;
+}
+
+// строк в одной задаче пула (тайл): меньше задач — меньше синхронизации
+static const int ROWS_PER_TILE = 16;
+
+// Ядро: lut (по умолчанию) или reference (прежний расчёт на каждый пиксель и
+// потоки на каждый вызов) — для сравнения в бенчмарке. STEREO_KERNEL=reference
+static bool g_reference_kernel = false;
+
+void fill_holes(const StereoOutput& out, int width, int height) {
     std::vector<std::thread> threads;
     int num_threads = (int)std::thread::hardware_concurrency();
     if (num_threads <= 0) num_threads = 1;
@@ -78,229 +245,471 @@ void fill_holes(uint8_t* image, int width, int height) {
     for (int i = 0; i < num_threads; i++) {
         int start_y = i * rows_per_thread;
         int end_y = (i == num_threads - 1) ? height : start_y + rows_per_thread;
-        threads.emplace_back(fill_rows, image, width, height, start_y, end_y);
+        threads.emplace_back([&out, width, start_y, end_y]{ fill_output(out, width, start_y, end_y); });
     }
     for (auto& t : threads) t.join();
 }
 
 // ------------------------------------------------------------
-// Основная обработка строк: раскладка по слоям и смещениям
-// Если left != right — пишем 2 изображения (split).
-// Если left == right — пишем в "парное" изображение (pair) пополам.
+// Арена промежуточных буферов (z-буферы, маска pair, карты reference): один блок,
+// размечается заново на каждую задачу. В --serve живёт весь процесс — память
+// берётся один раз под самый большой кадр, а не выделяется и обнуляется на каждый запрос.
 // ------------------------------------------------------------
-void process_rows(
-    uint8_t* image, uint8_t* left, uint8_t* right,
-    uint8_t* left_depths, uint8_t* right_depths,
-    int width, int height, int start_y, int end_y,
-    int layers_count, int zero_parallax_layer_num,
-    double max_shift
-) {
-    const int srcBpp = 3;   // image RGB
-    const int dstBpp = 4;   // RGBA у целевых буферов
-
-    const int imgStride = width * srcBpp;
-    const int outStride = width * dstBpp;
-
-    if (left != right) {
-        // Режим split: отдельные кадры left/right
-        for (int y = start_y; y < end_y; y++) {
-            for (int x = 0; x < width; x++) {
-                int image_pix_index = y * imgStride + x * srcBpp;
-
-                // Серый как "глубина" (Luma: 0.299 R + 0.587 G + 0.114 B)
-                uint8_t depth = (uint8_t)(
-                    (77 * image[image_pix_index + 0] +
-                     150 * image[image_pix_index + 1] +
-                      29 * image[image_pix_index + 2]) >> 8
-                );
-
-                int layer_num = (layers_count > 1)
-                    ? (depth * layers_count) / 255
-                    : 0;
-
-                // Смещение: чем ближе (меньше layer_num относительно zero_parallax_layer_num), тем больше сдвиг
-                double shift = max_shift * (1.0 - (double)layer_num / (double)zero_parallax_layer_num);
-
-                int left_x  = x + (int)(shift + 0.5);
-                int right_x = x - (int)(shift + 0.5);
-
-                if ((left_x >= 0) && (left_x < width) &&
-                    (depth > left_depths[y * width + left_x])) {
-                    left_depths[y * width + left_x] = depth;
-                    int left_pix_index = y * outStride + left_x * dstBpp;
-                    std::memcpy(left + left_pix_index, image + image_pix_index, srcBpp);
-                    left[left_pix_index + 3] = 255;
-                }
+class Arena {
+public:
+    ~Arena() { std::free(block); }
+
+    static size_t align(size_t bytes) { return (bytes + 63) & ~(size_t)63; }
+
+    // Новая разметка на total байт (сумма align() всех take); прежние указатели недействительны
+    bool reset(size_t total) {
+        used = 0;
+        if (total <= capacity) return true;
+        std::free(block);
+        block = (uint8_t*)std::malloc(total);
+        capacity = block ? total : 0;
+        return block != nullptr;
+    }
 
-                if ((right_x >= 0) && (right_x < width) &&
-                    (depth > right_depths[y * width + right_x])) {
-                    right_depths[y * width + right_x] = depth;
-                    int right_pix_index = y * outStride + right_x * dstBpp;
-                    std::memcpy(right + right_pix_index, image + image_pix_index, srcBpp);
-                    right[right_pix_index + 3] = 255;
-                }
-            }
-        }
-    } else {
-        // Режим pair: одно изображение, левый кадр в левой половине, правый — в правой
-        int half_width = width / 2;
+    uint8_t* take(size_t bytes) {
+        uint8_t* p = block + used;
+        used += align(bytes);
+        return p;
+    }
 
-        for (int y = start_y; y < end_y; y++) {
-            for (int x = 0; x < width; x++) {
-                int image_pix_index = y * imgStride + x * srcBpp;
+    size_t used_bytes() const { return used; }
+    size_t capacity_bytes() const { return capacity; }
 
-                uint8_t depth = (uint8_t)(
-                    (77 * image[image_pix_index + 0] +
-                     150 * image[image_pix_index + 1] +
-                      29 * image[image_pix_index + 2]) >> 8
-                );
+private:
+    uint8_t* block = nullptr;
+    size_t capacity = 0;
+    size_t used = 0;
+};
 
-                int layer_num = (layers_count > 1)
-                    ? (depth * layers_count) / 255
-                    : 0;
+// ------------------------------------------------------------
+// Кадр и его выходы. Глубина (яркость) считается на лету построчно — карты
+// глубины на весь кадр нет; смещение по глубине берётся из таблицы на 256 значений.
+// Выходы — RGB (3 байта на пиксель) точно своего размера, занятость пикселя —
+// z-буфер (split) или битовая маска (pair) вместо альфа-канала.
+// ------------------------------------------------------------
+struct StereoFrame {
+    const uint8_t* image = nullptr;   // RGB
+    int width = 0, height = 0;
+    uint8_t* depth = nullptr;         // только reference: карта глубины кадра
+    int* shift = nullptr;             // только reference: смещение на каждый пиксель
+    int shift_lut[256] = {0};         // depth -> смещение в пикселях
+
+    // split: отдельные кадры (RGB) и их z-буферы, nullptr — не нужны
+    uint8_t* left = nullptr;
+    uint8_t* right = nullptr;
+    uint8_t* left_depths = nullptr;
+    uint8_t* right_depths = nullptr;
+
+    // pair: левый кадр в левой половине, правый — в правой (RGB), nullptr — не нужен.
+    // z-буфер — на половину ширины, общий для обеих половин (как и было);
+    // занятость пикселей — отдельная битовая маска
+    uint8_t* pair = nullptr;
+    uint8_t* pair_depths = nullptr;
+    uint8_t* pair_bits = nullptr;
+    int pair_bits_stride = 0;
+};
+
+// Таблица depth -> смещение: та же арифметика, что и раньше на каждый пиксель
+static void build_shift_lut(int* lut, int layers_count, int zero_parallax_layer_num, double max_shift) {
+    for (int depth = 0; depth < 256; depth++) {
+        int layer_num = (layers_count > 1)
+            ? (depth * layers_count) / 255
+            : 0;
+        // Смещение: чем ближе (меньше layer_num относительно zero_parallax_layer_num), тем больше сдвиг
+        double shift = max_shift * (1.0 - (double)layer_num / (double)zero_parallax_layer_num);
+        lut[depth] = (int)(shift + 0.5);
+    }
+}
 
-                double shift = max_shift * (1.0 - (double)layer_num / (double)zero_parallax_layer_num);
+// Серый как "глубина" (Luma: 0.299 R + 0.587 G + 0.114 B); простой цикл без ветвлений —
+// компилятор векторизует его (-O3 -march=native)
+static void luma_row(const uint8_t* src, uint8_t* dst, int width) {
+    for (int x = 0; x < width; x++) {
+        dst[x] = (uint8_t)((77 * src[x * 3 + 0] + 150 * src[x * 3 + 1] + 29 * src[x * 3 + 2]) >> 8);
+    }
+}
 
-                int left_x  = (x + (int)(shift + 0.5)) / 2;
-                int right_x = (x - (int)(shift + 0.5)) / 2 + half_width;
+// ------------------------------------------------------------
+// Раскладка строки y по глубине строки (z-буфер: побеждает больший depth).
+// shift_of(x, depth) — смещение пикселя x.
+// ------------------------------------------------------------
+template <class ShiftOf>
+static void scatter_row(const StereoFrame& f, int y, const uint8_t* depth_row, ShiftOf shift_of) {
+    const int bpp = 3;   // вход и выходы RGB
+    const int width = f.width;
+    const uint8_t* src = f.image + (size_t)y * width * bpp;
 
-                if ((left_x >= 0) && (left_x < half_width) &&
-                    (depth > left_depths[y * half_width + left_x])) {
-                    left_depths[y * half_width + left_x] = depth;
-                    int left_pix_index = y * outStride + left_x * dstBpp;
-                    std::memcpy(left + left_pix_index, image + image_pix_index, srcBpp);
-                    left[left_pix_index + 3] = 255;
-                }
+    if (f.left) {
+        // Режим split: отдельные кадры left/right
+        uint8_t* left = f.left + (size_t)y * width * bpp;
+        uint8_t* right = f.right + (size_t)y * width * bpp;
+        uint8_t* left_depths = f.left_depths + (size_t)y * width;
+        uint8_t* right_depths = f.right_depths + (size_t)y * width;
 
-                if ((right_x >= half_width) && (right_x < width) &&
-                    (depth > right_depths[y * half_width + (right_x - half_width)])) {
-                    right_depths[y * half_width + (right_x - half_width)] = depth;
-                    int right_pix_index = y * outStride + right_x * dstBpp;
-                    std::memcpy(right + right_pix_index, image + image_pix_index, srcBpp);
-                    right[right_pix_index + 3] = 255;
-                }
+        for (int x = 0; x < width; x++) {
+            const uint8_t depth = depth_row[x];
+            const int shift = shift_of(x, depth);
+
+            int left_x  = x + shift;
+            int right_x = x - shift;
+
+            if ((left_x >= 0) && (left_x < width) && (depth > left_depths[left_x])) {
+                left_depths[left_x] = depth;
+                std::memcpy(left + left_x * bpp, src + x * bpp, bpp);
+            }
+
+            if ((right_x >= 0) && (right_x < width) && (depth > right_depths[right_x])) {
+                right_depths[right_x] = depth;
+                std::memcpy(right + right_x * bpp, src + x * bpp, bpp);
+            }
+        }
+    }
+
+    if (f.pair) {
+        // Режим pair: одно изображение, левый кадр в левой половине, правый — в правой
+        const int half_width = width / 2;
+        uint8_t* pair = f.pair + (size_t)y * width * bpp;
+        uint8_t* pair_depths = f.pair_depths + (size_t)y * half_width;
+        uint8_t* bits = f.pair_bits + (size_t)y * f.pair_bits_stride;
+
+        for (int x = 0; x < width; x++) {
+            const uint8_t depth = depth_row[x];
+            const int shift = shift_of(x, depth);
+
+            int left_x  = (x + shift) / 2;
+            int right_x = (x - shift) / 2 + half_width;
+
+            if ((left_x >= 0) && (left_x < half_width) && (depth > pair_depths[left_x])) {
+                pair_depths[left_x] = depth;
+                std::memcpy(pair + left_x * bpp, src + x * bpp, bpp);
+                bits[left_x >> 3] |= (uint8_t)(1 << (left_x & 7));
+            }
+
+            if ((right_x >= half_width) && (right_x < width) &&
+                (depth > pair_depths[right_x - half_width])) {
+                pair_depths[right_x - half_width] = depth;
+                std::memcpy(pair + right_x * bpp, src + x * bpp, bpp);
+                bits[right_x >> 3] |= (uint8_t)(1 << (right_x & 7));
             }
         }
     }
 }
 
 // ------------------------------------------------------------
-// Создать два изображения: left.jpg/right.jpg
+// Основная обработка строк (тайл): глубина строки в буфер потока, затем раскладка по таблице смещений
+// ------------------------------------------------------------
+void process_rows(const StereoFrame& f, int start_y, int end_y) {
+    // у каждого потока пула свой буфер на одну строку; растёт только до самого широкого кадра
+    thread_local std::vector<uint8_t> depth_row;
+    if ((int)depth_row.size() < f.width) depth_row.resize(f.width);
+
+    const int* lut = f.shift_lut;
+    for (int y = start_y; y < end_y; y++) {
+        luma_row(f.image + (size_t)y * f.width * 3, depth_row.data(), f.width);
+        scatter_row(f, y, depth_row.data(), [lut](int, uint8_t depth) { return lut[depth]; });
+    }
+}
+
+// Прежнее ядро: layer_num и смещение в double на каждый пиксель, карты на весь кадр
+void process_rows_reference(const StereoFrame& f, int start_y, int end_y,
+                            int layers_count, int zero_parallax_layer_num, double max_shift) {
+    const int width = f.width;
+    for (int y = start_y; y < end_y; y++) {
+        for (int x = 0; x < width; x++) {
+            const uint8_t* px = f.image + ((size_t)y * width + x) * 3;
+            uint8_t depth = (uint8_t)((77 * px[0] + 150 * px[1] + 29 * px[2]) >> 8);
+            int layer_num = (layers_count > 1)
+                ? (depth * layers_count) / 255
+                : 0;
+            double shift = max_shift * (1.0 - (double)layer_num / (double)zero_parallax_layer_num);
+            f.depth[(size_t)y * width + x] = depth;
+            f.shift[(size_t)y * width + x] = (int)(shift + 0.5);
+        }
+    }
+    for (int y = start_y; y < end_y; y++) {
+        const int* shift = f.shift + (size_t)y * width;
+        scatter_row(f, y, f.depth + (size_t)y * width, [shift](int x, uint8_t) { return shift[x]; });
+    }
+}
+
+// ------------------------------------------------------------
+// Посчитать выходы (RGB, width x height) в буферы вызывающего за один проход:
+// left/right — split (оба или nullptr), pair — pair (или nullptr).
+// Выходы обнулять не нужно; z-буферы и маска — в arena.
 // ------------------------------------------------------------
-void create_stereo_pair(uint8_t* image, int width, int height,
-                        int layers_count, int zero_parallax_layer_num,
-                        double parallax_perc) {
-    const int pcount = width * height;
-
-    uint8_t* left  = new (std::nothrow) uint8_t[pcount * 4];
-    uint8_t* right = new (std::nothrow) uint8_t[pcount * 4];
-    uint8_t* left_depths  = new (std::nothrow) uint8_t[pcount];
-    uint8_t* right_depths = new (std::nothrow) uint8_t[pcount];
-
-    if (!left || !right || !left_depths || !right_depths) {
-        if (left) delete[] left;
-        if (right) delete[] right;
-        if (left_depths) delete[] left_depths;
-        if (right_depths) delete[] right_depths;
+bool build_stereo(const uint8_t* image, int width, int height,
+                  int layers_count, int zero_parallax_layer_num, double parallax_perc,
+                  uint8_t* left, uint8_t* right, uint8_t* pair, Arena& arena) {
+    const size_t pcount = (size_t)width * height;
+    const bool split = left && right;
+    const int half_width = width / 2;
+    const int bits_stride = (width + 7) / 8;
+    // при нечётной ширине у правой половины на столбец больше: последний
+    // попадает на элемент дальше строки z-буфера — отсюда +1
+    const size_t pair_depth_bytes = (size_t)half_width * height + 1;
+    const size_t pair_bits_bytes = (size_t)bits_stride * height;
+
+    size_t total = 0;
+    if (split) total += 2 * Arena::align(pcount);
+    if (pair) total += Arena::align(pair_depth_bytes) + Arena::align(pair_bits_bytes);
+    if (g_reference_kernel) total += Arena::align(pcount) + Arena::align(pcount * sizeof(int));
+    if (!arena.reset(total)) {
         std::cerr << "Failed to allocate memory\n";
-        return;
+        return false;
     }
 
-    std::memset(left, 0, pcount * 4);
-    std::memset(right, 0, pcount * 4);
-    std::memset(left_depths, 0, pcount);
-    std::memset(right_depths, 0, pcount);
+    auto process_start = Clock::now();
+    StereoFrame f;
+    f.image = image;
+    f.width = width;
+    f.height = height;
+    std::vector<StereoOutput> outputs;
+    if (split) {
+        f.left = left;
+        f.right = right;
+        f.left_depths = arena.take(pcount);
+        f.right_depths = arena.take(pcount);
+        std::memset(f.left_depths, 0, pcount);
+        std::memset(f.right_depths, 0, pcount);
+        outputs.push_back({left, f.left_depths, nullptr, 0});
+        outputs.push_back({right, f.right_depths, nullptr, 0});
+    }
+    if (pair) {
+        f.pair = pair;
+        f.pair_depths = arena.take(pair_depth_bytes);
+        f.pair_bits = arena.take(pair_bits_bytes);
+        f.pair_bits_stride = bits_stride;
+        std::memset(f.pair_depths, 0, pair_depth_bytes);
+        std::memset(f.pair_bits, 0, pair_bits_bytes);
+        outputs.push_back({pair, nullptr, f.pair_bits, bits_stride});
+    }
+    if (g_reference_kernel) {
+        f.depth = arena.take(pcount);
+        f.shift = (int*)arena.take(pcount * sizeof(int));
+    }
+    g_timings.buffer_bytes += (long long)arena.used_bytes();
 
     double max_shift = (double)width * parallax_perc / 100.0;
 
-    // Многопоточный проход строк
-    std::vector<std::thread> threads;
-    int num_threads = (int)std::thread::hardware_concurrency();
-    if (num_threads <= 0) num_threads = 1;
-    int rows_per_thread = std::max(1, height / num_threads);
+    if (g_reference_kernel) {
+        // Многопоточный проход строк: потоки создаются на каждый вызов
+        std::vector<std::thread> threads;
+        int num_threads = (int)std::thread::hardware_concurrency();
+        if (num_threads <= 0) num_threads = 1;
+        int rows_per_thread = std::max(1, height / num_threads);
+
+        for (int i = 0; i < num_threads; i++) {
+            int start_y = i * rows_per_thread;
+            int end_y = (i == num_threads - 1) ? height : start_y + rows_per_thread;
+            if (start_y >= height) break;
+            threads.emplace_back(process_rows_reference, std::cref(f), start_y, end_y,
+                                 layers_count, zero_parallax_layer_num, max_shift);
+        }
+        for (auto& t : threads) t.join();
+        g_timings.process_ms += ms_since(process_start);
 
-    for (int i = 0; i < num_threads; i++) {
-        int start_y = i * rows_per_thread;
-        int end_y = (i == num_threads - 1) ? height : start_y + rows_per_thread;
-        threads.emplace_back(process_rows,
-            image, left, right,
-            left_depths, right_depths,
-            width, height, start_y, end_y,
-            layers_count, zero_parallax_layer_num, max_shift
-        );
+        auto fill_start = Clock::now();
+        std::vector<std::thread> fills;
+        for (const StereoOutput& out : outputs) {
+            fills.emplace_back([&out, width, height](){ fill_holes(out, width, height); });
+        }
+        for (auto& t : fills) t.join();
+        g_timings.fill_ms += ms_since(fill_start);
+        return true;
     }
-    for (auto& t : threads) t.join();
-
-    delete[] left_depths;
-    delete[] right_depths;
 
-    // Постпроцесс: заливка дырок и запись
-    std::thread left_write([&](){
-        fill_holes(left, width, height);
-        stbi_write_jpg("converted_images/left.jpg", width, height, 4, left, 100);
+    build_shift_lut(f.shift_lut, layers_count, zero_parallax_layer_num, max_shift);
+    g_timings.buffer_bytes += (long long)pool().size() * width;   // строки глубины в потоках
+    const int tiles = (height + ROWS_PER_TILE - 1) / ROWS_PER_TILE;
+    pool().parallel_for(tiles, [&](int tile) {
+        int start_y = tile * ROWS_PER_TILE;
+        process_rows(f, start_y, std::min(height, start_y + ROWS_PER_TILE));
     });
-    std::thread right_write([&](){
-        fill_holes(right, width, height);
-        stbi_write_jpg("converted_images/right.jpg", width, height, 4, right, 100);
-    });
-
-    left_write.join();
-    right_write.join();
+    g_timings.process_ms += ms_since(process_start);
 
-    delete[] left;
-    delete[] right;
+    // Постпроцесс: заливка дырок — тайлы всех выходов в одном пуле
+    auto fill_start = Clock::now();
+    pool().parallel_for(tiles * (int)outputs.size(), [&](int task) {
+        int start_y = (task % tiles) * ROWS_PER_TILE;
+        fill_output(outputs[task / tiles], width, start_y, std::min(height, start_y + ROWS_PER_TILE));
+    });
+    g_timings.fill_ms += ms_since(fill_start);
+    return true;
 }
 
 // ------------------------------------------------------------
-// Создать одно изображение pair.jpg (левая и правая половины)
+// Посчитать и записать выходы output_mode (0=both, 1=pair, 2=split)
+// в out_dir/{left,right,pair}.jpg; JPEG кодируются параллельно.
+// quality 1..100; при quality <= 90 stb пишет цветность 4:2:0, выше — 4:4:4.
 // ------------------------------------------------------------
-void create_stereo_pair_H(uint8_t* image, int width, int height,
-                          int layers_count, int zero_parallax_layer_num,
-                          double parallax_perc) {
-    const int pcount = width * height;
+bool create_outputs(const uint8_t* image, int width, int height,
+                    int layers_count, int zero_parallax_layer_num, double parallax_perc,
+                    int output_mode, const std::string& out_dir, int quality) {
+    const size_t frame_bytes = (size_t)width * height * 3;
+    const bool want_split = (output_mode == 0 || output_mode == 2);
+    const bool want_pair = (output_mode == 0 || output_mode == 1);
+
+    // выходы без обнуления (build_stereo пишет каждый пиксель)
+    std::unique_ptr<uint8_t[]> left, right, pair;
+    if (want_split) {
+        left.reset(new (std::nothrow) uint8_t[frame_bytes]);
+        right.reset(new (std::nothrow) uint8_t[frame_bytes]);
+    }
+    if (want_pair) pair.reset(new (std::nothrow) uint8_t[frame_bytes]);
+    if ((want_split && (!left || !right)) || (want_pair && !pair)) {
+        std::cerr << "Failed to allocate memory\n";
+        return false;
+    }
+    g_timings.buffer_bytes += (long long)frame_bytes * (1 + (want_split ? 2 : 0) + (want_pair ? 1 : 0));
 
-    uint8_t* pair        = new (std::nothrow) uint8_t[pcount * 4];
-    uint8_t* pair_depths = new (std::nothrow) uint8_t[pcount];
+    Arena arena;
+    if (!build_stereo(image, width, height, layers_count, zero_parallax_layer_num, parallax_perc,
+                      left.get(), right.get(), pair.get(), arena)) {
+        return false;
+    }
 
-    if (!pair || !pair_depths) {
-        if (pair) delete[] pair;
-        if (pair_depths) delete[] pair_depths;
-        std::cerr << "Failed to allocate memory\n";
-        return;
+    auto encode_start = Clock::now();
+    std::vector<std::pair<const uint8_t*, std::string>> jobs;
+    if (want_split) {
+        jobs.emplace_back(left.get(), out_dir + "/left.jpg");
+        jobs.emplace_back(right.get(), out_dir + "/right.jpg");
     }
+    if (want_pair) jobs.emplace_back(pair.get(), out_dir + "/pair.jpg");
+    std::vector<int> written(jobs.size(), 0);
+    pool().parallel_for((int)jobs.size(), [&](int i) {
+        written[i] = stbi_write_jpg(jobs[i].second.c_str(), width, height, 3, jobs[i].first, quality);
+    });
+    g_timings.encode_ms += ms_since(encode_start);
+
+    bool ok = true;
+    for (size_t i = 0; i < jobs.size(); i++) {
+        struct stat st;
+        if (!written[i]) {
+            std::cerr << "Failed to write " << jobs[i].second << "\n";
+            ok = false;
+        } else if (stat(jobs[i].second.c_str(), &st) == 0) {
+            g_timings.encoded_bytes += (long long)st.st_size;
+        }
+    }
+    return ok;
+}
 
-    std::memset(pair, 0, pcount * 4);
-    std::memset(pair_depths, 0, pcount);
+// ------------------------------------------------------------
+// Режим воркера (--serve): долгоживущий процесс, команды построчно из stdin,
+// пиксели — через общий mmap-файл. Раскладка файла (RGB, по width*height*3):
+//   [вход][left][right][pair]
+// Запрос:  convert <shm_path> <width> <height> <parallax_perc> <layers_count> <zero_parallax_layer_num> <output_mode>
+// Ответ:   ok buffer_bytes=<память задачи> arena_bytes=<размер арены> | err <сообщение>
+// quit — завершить процесс.
+// Выходы пишутся прямо в свои слоты файла; своя память процесса — только арена.
+// ------------------------------------------------------------
 
-    double max_shift = (double)width * parallax_perc / 100.0;
+struct SharedBuffer {
+    std::string path;
+    uint8_t* data = nullptr;
+    size_t size = 0;
 
-    // Многопоточный проход строк (left==right => pair)
-    std::vector<std::thread> threads;
-    int num_threads = (int)std::thread::hardware_concurrency();
-    if (num_threads <= 0) num_threads = 1;
-    int rows_per_thread = std::max(1, height / num_threads);
+    void unmap() {
+        if (data) munmap(data, size);
+        data = nullptr;
+        size = 0;
+        path.clear();
+    }
 
-    for (int i = 0; i < num_threads; i++) {
-        int start_y = i * rows_per_thread;
-        int end_y = (i == num_threads - 1) ? height : start_y + rows_per_thread;
-        threads.emplace_back(process_rows,
-            image, pair, pair,
-            pair_depths, pair_depths,
-            width, height, start_y, end_y,
-            layers_count, zero_parallax_layer_num, max_shift
-        );
+    // Переотображаем только если сменился файл или его размер
+    bool map(const std::string& p) {
+        struct stat st;
+        if (stat(p.c_str(), &st) != 0) return false;
+        if (data && p == path && (size_t)st.st_size == size) return true;
+        unmap();
+        int fd = open(p.c_str(), O_RDWR);
+        if (fd < 0) return false;
+        void* mem = mmap(nullptr, (size_t)st.st_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        close(fd);
+        if (mem == MAP_FAILED) return false;
+        data = (uint8_t*)mem;
+        size = (size_t)st.st_size;
+        path = p;
+        return true;
     }
-    for (auto& t : threads) t.join();
+};
+
+int serve() {
+    SharedBuffer shm;
+    Arena arena;   // z-буферы и маски, переиспользуются между запросами
+    std::string line;
+
+    while (std::getline(std::cin, line)) {
+        std::istringstream in(line);
+        std::string cmd, path;
+        int width = 0, height = 0, layers_count = 10, zero_parallax_layer_num = 5, output_mode = 0;
+        double parallax_perc = 0.5;
+
+        in >> cmd;
+        if (cmd == "quit") break;
+        if (cmd != "convert") {
+            std::cout << "err unknown command" << std::endl;
+            continue;
+        }
+        in >> path >> width >> height >> parallax_perc >> layers_count
+           >> zero_parallax_layer_num >> output_mode;
+        if (!in || width <= 0 || height <= 0) {
+            std::cout << "err bad request" << std::endl;
+            continue;
+        }
+        layers_count = std::max(1, layers_count);
+        zero_parallax_layer_num = std::max(1, zero_parallax_layer_num);
 
-    delete[] pair_depths;
+        const size_t frame_bytes = (size_t)width * height * 3;
+        if (!shm.map(path) || shm.size < frame_bytes * 4) {
+            std::cout << "err shared buffer unavailable" << std::endl;
+            continue;
+        }
 
-    std::thread pair_write([&](){
-        fill_holes(pair, width, height);
-        stbi_write_jpg("converted_images/pair.jpg", width, height, 4, pair, 100);
-    });
+        const bool want_split = (output_mode == 0 || output_mode == 2);
+        const bool want_pair = (output_mode == 0 || output_mode == 1);
+        g_timings.buffer_bytes = (long long)frame_bytes * (1 + (want_split ? 2 : 0) + (want_pair ? 1 : 0));
+
+        // both — один проход: глубина общая для split и pair
+        bool ok = build_stereo(shm.data, width, height, layers_count, zero_parallax_layer_num,
+                               parallax_perc,
+                               want_split ? shm.data + frame_bytes : nullptr,
+                               want_split ? shm.data + frame_bytes * 2 : nullptr,
+                               want_pair ? shm.data + frame_bytes * 3 : nullptr,
+                               arena);
+        if (ok) {
+            std::cout << "ok buffer_bytes=" << g_timings.buffer_bytes
+                      << " arena_bytes=" << arena.capacity_bytes() << std::endl;
+        } else {
+            std::cout << "err conversion failed" << std::endl;
+        }
+    }
+
+    shm.unmap();
+    return 0;
+}
 
-    pair_write.join();
-    delete[] pair;
+// Пиковый RSS процесса (кБ). Процесс — на одну задачу, так что это пик задачи.
+// VmHWM, а не getrusage: ru_maxrss переживает execve и показал бы пик родителя (Python)
+static long peak_rss_kb() {
+    FILE* status = std::fopen("/proc/self/status", "r");
+    if (status) {
+        char line[256];
+        long kb = -1;
+        while (std::fgets(line, sizeof(line), status)) {
+            if (std::sscanf(line, "VmHWM: %ld kB", &kb) == 1) break;
+        }
+        std::fclose(status);
+        if (kb >= 0) return kb;
+    }
+    struct rusage usage;
+    getrusage(RUSAGE_SELF, &usage);
+    return usage.ru_maxrss;
 }
 
 // ------------------------------------------------------------
@@ -309,38 +718,56 @@ void create_stereo_pair_H(uint8_t* image, int width, int height,
 int main(int argc, char **argv) {
     if (argc < 2) {
         std::cerr << "image path required\n";
-        std::cerr << "usage: ./stereo <input_path> [parallax_perc] [layers_count] [zero_parallax_layer_num] [output_mode]\n";
+        std::cerr << "usage: ./stereo <input_path> [parallax_perc] [layers_count] [zero_parallax_layer_num] [output_mode] [output_dir] [jpeg_quality]\n";
+        std::cerr << "       ./stereo --serve\n";
         return 1;
     }
 
+    const char* kernel = std::getenv("STEREO_KERNEL");
+    g_reference_kernel = kernel && std::strcmp(kernel, "reference") == 0;
+
+    if (std::strcmp(argv[1], "--serve") == 0) {
+        return serve();
+    }
+
     // Значения по умолчанию
     double parallax_perc = 0.5;
     int layers_count = 10;
     int zero_parallax_layer_num = 5;
     int output_mode = 0; // 0=both, 1=pair only, 2=split only
+    std::string out_dir = "converted_images";
+    int quality = 100;
 
     if (argc > 2) parallax_perc = std::atof(argv[2]);
     if (argc > 3) layers_count = std::max(1, std::atoi(argv[3]));
     if (argc > 4) zero_parallax_layer_num = std::max(1, std::atoi(argv[4]));
     if (argc > 5) output_mode = std::atoi(argv[5]);
+    if (argc > 6 && argv[6][0] != '\0') out_dir = argv[6];
+    if (argc > 7) quality = std::max(1, std::min(100, std::atoi(argv[7])));
 
     // Загрузка входного изображения (приводим к 3 каналам RGB)
     int width = 0, height = 0, channels = 0;
+    auto decode_start = Clock::now();
     uint8_t* image = stbi_load(argv[1], &width, &height, &channels, 3);
+    g_timings.decode_ms += ms_since(decode_start);
     if (!image) {
         std::cerr << "Failed to load image: " << argv[1] << "\n"
                   << stbi_failure_reason() << std::endl;
         return 1;
     }
 
-    // Создание выходов в зависимости от режима
-    if (output_mode == 0 || output_mode == 2) {
-        create_stereo_pair(image, width, height, layers_count, zero_parallax_layer_num, parallax_perc);
-    }
-    if (output_mode == 0 || output_mode == 1) {
-        create_stereo_pair_H(image, width, height, layers_count, zero_parallax_layer_num, parallax_perc);
-    }
+    // Создание выходов в зависимости от режима (both — за один проход)
+    bool ok = create_outputs(image, width, height, layers_count, zero_parallax_layer_num,
+                             parallax_perc, output_mode, out_dir, quality);
 
     stbi_image_free(image);
-    return 0;
+
+    const char* timings = std::getenv("STEREO_TIMINGS");
+    if (timings && timings[0] && timings[0] != '0') {
+        std::fprintf(stderr, "timings decode_ms=%.3f process_ms=%.3f fill_ms=%.3f encode_ms=%.3f encoded_bytes=%lld "
+                     "buffer_bytes=%lld peak_rss_kb=%ld\n",
+                     g_timings.decode_ms, g_timings.process_ms, g_timings.fill_ms, g_timings.encode_ms,
+                     g_timings.encoded_bytes, g_timings.buffer_bytes, peak_rss_kb());
+    }
+    return ok ? 0 : 1;
 }
@@ -0,0 +1,82 @@
+# encoding.py
+# Кодирование результатов: формат (JPEG/WebP), качество, субдискретизация
+# цветности и кем кодировать — stb внутри ./stereo или cv2.imencode
+# (libjpeg-turbo / libwebp) по пикселям, вернувшимся из конвертера.
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+
+FORMATS = {"jpeg": (".jpg", "image/jpeg"), "webp": (".webp", "image/webp")}
+SUBSAMPLING = ("auto", "420", "444")
+ENCODERS = ("native", "opencv")
+
+# stb_image_write сам выбирает 4:2:0 при quality <= 90 и 4:4:4 выше
+STB_SUBSAMPLE_MAX_QUALITY = 90
+
+
+def encode_settings(cfg: dict) -> dict:
+    """Нормализованные параметры кодирования из конфига (или параметров пакета)."""
+    fmt = (cfg.get("output_format") or "jpeg").lower()
+    subsampling = str(cfg.get("chroma_subsampling") or "auto").lower()
+    encoder = (cfg.get("encoder") or "native").lower()
+    return {
+        "format": fmt if fmt in FORMATS else "jpeg",
+        "quality": max(1, min(100, int(float(cfg.get("jpeg_quality") or 95)))),
+        "subsampling": subsampling if subsampling in SUBSAMPLING else "auto",
+        "encoder": encoder if encoder in ENCODERS else "native",
+    }
+
+
+def extension(settings: dict) -> str:
+    return FORMATS[settings["format"]][0]
+
+
+def native_supports(settings: dict) -> bool:
+    """Может ли ./stereo (stb) записать результат сам: только JPEG и его правило субдискретизации."""
+    if settings["encoder"] != "native" or settings["format"] != "jpeg":
+        return False
+    if settings["subsampling"] == "auto":
+        return True
+    stb_420 = settings["quality"] <= STB_SUBSAMPLE_MAX_QUALITY
+    return (settings["subsampling"] == "420") == stb_420
+
+
+def imencode_params(settings: dict) -> list:
+    if settings["format"] == "webp":
+        return [int(cv2.IMWRITE_WEBP_QUALITY), settings["quality"]]
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), settings["quality"]]
+    subsampling = settings["subsampling"]
+    if subsampling == "auto":
+        # как у stb — одинаковый результат при смене кодировщика
+        subsampling = "420" if settings["quality"] <= STB_SUBSAMPLE_MAX_QUALITY else "444"
+    factor = cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420 if subsampling == "420" else cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444
+    params += [int(cv2.IMWRITE_JPEG_SAMPLING_FACTOR), int(factor)]
+    return params
+
+
+def encode(image, settings: dict) -> bytes:
+    """BGR-кадр -> байты файла."""
+    ok, buf = cv2.imencode(extension(settings), image, imencode_params(settings))
+    if not ok:
+        raise RuntimeError(f"imencode failed ({settings['format']})")
+    return buf.tobytes()
+
+
+def write_outputs(outputs: dict, out_dir, settings: dict) -> int:
+    """Пишет {name: BGR} в out_dir/<name>.<ext>; возвращает суммарный размер в байтах."""
+    total = 0
+    for name, image in outputs.items():
+        data = encode(image, settings)
+        (out_dir / f"{name}{extension(settings)}").write_bytes(data)
+        total += len(data)
+    return total
+
+
+def mimetype_of(data: bytes) -> str:
+    """Content-Type по сигнатуре (latest.jpg может оказаться WebP после смены формата)."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
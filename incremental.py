@@ -0,0 +1,176 @@
+# incremental.py
+# Инкрементальная конвертация последовательных кадров камеры. Весь конвейер
+# (глубина, раскладка по z-буферу, заливка дырок) построчный, поэтому
+# горизонтальная полоса исходника даёт ровно те же строки результата:
+# пересчитываются только полосы, где кадр заметно изменился (блочный дифф
+# по уменьшенному серому), остальное берётся из прошлого результата.
+# Глубину в пересчитанных полосах можно сглаживать во времени — меньше мерцания.
+
+import threading
+import time
+
+import numpy as np
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+import stereo_engine
+
+
+class IncrementalConverter:
+    def __init__(self, band_rows=16, threshold=6.0, smoothing=0.0, refresh_interval=150, max_gap=None):
+        """
+        band_rows — высота полосы (и сторона блока диффа) в пикселях;
+        threshold — порог среднего изменения яркости блока (0..255), ниже — шум;
+        0 — любой изменившийся пиксель (сравниваются сами строки, результат
+        совпадает с полным пересчётом);
+        smoothing — доля прошлой глубины в пересчитанных полосах (0 — без сглаживания),
+        только для движка stereo_engine (в ./stereo глубина считается внутри);
+        refresh_interval — полный пересчёт раз в N кадров (медленные изменения света);
+        max_gap — если с прошлого кадра прошло больше max_gap секунд, это уже другая
+        сцена: полный пересчёт без прошлой глубины (None — без ограничения).
+        """
+        self.band_rows = band_rows
+        self.threshold = threshold
+        self.smoothing = smoothing
+        self.refresh_interval = refresh_interval
+        self.max_gap = max_gap
+        self.lock = threading.Lock()
+        self._reset()
+
+        self.frames = 0
+        self.full_frames = 0
+        self.bands_total = 0
+        self.bands_converted = 0
+        self.last_changed = None
+        self.last_ms = None
+
+    def _reset(self):
+        self.key = None
+        self.blocks = None      # уменьшенный серый прошлого кадра (блоки band_rows x band_rows)
+        self.frame = None       # сам прошлый кадр — только при threshold 0
+        self.depth = None       # сглаженная глубина (uint8), если включено сглаживание
+        self.outputs = None     # прошлый результат {"left", "right", "pair"}
+        self.since_full = 0
+        self.last_time = None   # time.perf_counter() прошлого кадра
+
+    def configure(self, threshold=None, smoothing=None, max_gap=None):
+        with self.lock:
+            if max_gap is not None:
+                self.max_gap = float(max_gap)
+            if threshold is not None:
+                self.threshold = float(threshold)
+            if smoothing is not None and float(smoothing) != self.smoothing:
+                self.smoothing = float(smoothing)
+                self._reset()
+
+    def _block_means(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        size = (max(1, -(-w // self.band_rows)), max(1, -(-h // self.band_rows)))
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def _changed_runs(self, frame, blocks, bands):
+        """[(band_from, band_to), ...] — подряд идущие изменившиеся полосы."""
+        if self.threshold <= 0 and self.frame is not None:
+            rows = np.zeros(bands * self.band_rows, dtype=bool)
+            rows[:frame.shape[0]] = (frame != self.frame).any(axis=(1, 2))
+            changed = np.flatnonzero(rows.reshape(bands, self.band_rows).any(axis=1))
+        else:
+            diff = np.abs(blocks - self.blocks).max(axis=1)
+            changed = np.flatnonzero(diff[:bands] > self.threshold)
+        runs = []
+        for band in changed:
+            if runs and runs[-1][1] == band:
+                runs[-1][1] = band + 1
+            else:
+                runs.append([band, band + 1])
+        return runs
+
+    def convert(self, frame: np.ndarray, convert, parallax_perc=0.5, layers_count=10,
+                zero_parallax_layer_num=5, output_mode=0) -> dict:
+        """
+        Как convert движка (stereo_engine.convert или StereoWorker.convert), но
+        пересчитывает только изменившиеся полосы. Возвращает новые массивы
+        (прошлый результат вызывающему не отдаётся — его можно держать сколько угодно).
+        """
+        started = time.perf_counter()
+        frame = np.ascontiguousarray(frame[..., :3])
+        height = frame.shape[0]
+        bands = -(-height // self.band_rows)
+        depth_aware = self.smoothing > 0 and convert is stereo_engine.convert
+
+        with self.lock:
+            key = (frame.shape, float(parallax_perc), int(layers_count), int(zero_parallax_layer_num),
+                   int(output_mode), convert)
+            blocks = self._block_means(frame)
+            stale = (self.max_gap is not None and self.last_time is not None
+                     and started - self.last_time > self.max_gap)
+            reset = key != self.key or self.outputs is None or stale
+            if reset:
+                self.depth = None
+            full = reset or bool(self.refresh_interval and self.since_full >= self.refresh_interval)
+
+            if full:
+                runs = [[0, bands]]
+            else:
+                runs = self._changed_runs(frame, blocks, bands)
+
+            if full:
+                self.outputs = {}
+            for first, last in runs:
+                y0, y1 = first * self.band_rows, min(height, last * self.band_rows)
+                strip = frame[y0:y1]
+                kwargs = {}
+                if depth_aware:
+                    depth = stereo_engine.luma_depth(strip)
+                    if self.depth is not None:
+                        prev = self.depth[y0:y1].astype(np.float32)
+                        depth = (prev * self.smoothing + depth * (1.0 - self.smoothing) + 0.5).astype(np.uint8)
+                    if self.depth is None:
+                        self.depth = np.empty(frame.shape[:2], dtype=np.uint8)
+                    self.depth[y0:y1] = depth
+                    kwargs["depth"] = depth
+                result = convert(strip, parallax_perc, layers_count, zero_parallax_layer_num,
+                                 output_mode, **kwargs)
+                for name, image in result.items():
+                    if full:
+                        self.outputs[name] = image
+                    else:
+                        self.outputs[name][y0:y1] = image
+
+            # опорный кадр для диффа обновляем только в пересчитанных полосах:
+            # медленный дрейф ниже порога накапливается и в итоге тоже пересчитается
+            if full:
+                self.blocks = blocks
+            else:
+                for first, last in runs:
+                    self.blocks[first:last] = blocks[first:last]
+            self.frame = frame.copy() if self.threshold <= 0 else None
+
+            converted = int(sum(last - first for first, last in runs))
+            self.key = key
+            self.last_time = started
+            self.since_full = 0 if full else self.since_full + 1
+            self.frames += 1
+            self.full_frames += 1 if full else 0
+            self.bands_total += bands
+            self.bands_converted += converted
+            self.last_changed = round(converted / bands, 3)
+            outputs = {name: image.copy() for name, image in self.outputs.items()}
+            self.last_ms = round((time.perf_counter() - started) * 1000, 2)
+            return outputs
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "frames": self.frames,
+                "full_frames": self.full_frames,
+                "converted_ratio": round(self.bands_converted / self.bands_total, 3) if self.bands_total else None,
+                "last_changed": self.last_changed,
+                "last_ms": self.last_ms,
+                "threshold": self.threshold,
+                "smoothing": self.smoothing,
+            }
@@ -0,0 +1,123 @@
+# jobs.py
+# Очередь задач конвертации: ограниченный пул воркеров, очередь с backpressure
+# и склейка одинаковых запросов (тот же файл + те же параметры = одна задача).
+
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key, func, args, kwargs):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "queued"  # queued|running|done|error
+        self.ok = None
+        self.message = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = None   # dict, который задача обновляет по ходу (видео), или None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None) -> bool:
+        return self.done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "ok": self.ok,
+            "message": self.message,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "duration": (self.finished - self.started) if self.finished and self.started else None,
+            "progress": dict(self.progress) if self.progress is not None else None,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers=1, max_pending=16, keep_finished=200):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()   # id -> Job (активные и недавние завершённые)
+        self.active = {}            # key -> Job (queued/running) для склейки
+        self.keep_finished = keep_finished
+        self.workers = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._worker, name=f"convert-{i}", daemon=True)
+            t.start()
+            self.workers.append(t)
+
+    def submit(self, key, func, *args, **kwargs) -> tuple[Job, bool]:
+        """
+        Ставит задачу в очередь. Если такая же (по key) уже ждёт или выполняется —
+        возвращает её. Второй элемент результата — была ли создана новая задача.
+        При переполнении очереди бросает QueueFull.
+        """
+        with self.lock:
+            if key is not None and key in self.active:
+                return self.active[key], False
+            job = Job(key, func, args, kwargs)
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull("очередь конвертации переполнена")
+            if key is not None:
+                self.active[key] = job
+            self.jobs[job.id] = job
+            self._trim()
+            return job, True
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def recent(self, limit=50) -> list:
+        with self.lock:
+            return [j.to_dict() for j in list(self.jobs.values())[-limit:]][::-1]
+
+    def stats(self) -> dict:
+        with self.lock:
+            running = sum(1 for j in self.active.values() if j.status == "running")
+        return {
+            "pending": self.queue.qsize(),
+            "running": running,
+            "capacity": self.queue.maxsize,
+            "workers": len(self.workers),
+        }
+
+    def _trim(self):
+        # выкидываем самые старые завершённые задачи сверх лимита
+        finished = [jid for jid, j in self.jobs.items() if j.done.is_set()]
+        for jid in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[jid]
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            job.status = "running"
+            job.started = time.time()
+            try:
+                job.ok, job.message = job.func(*job.args, **job.kwargs)
+            except Exception as e:
+                job.ok, job.message = False, f"Ошибка задачи: {e}"
+            job.status = "done" if job.ok else "error"
+            job.finished = time.time()
+            # освобождаем ссылки на аргументы (кадры с камеры)
+            job.args, job.kwargs = (), {}
+            with self.lock:
+                if job.key is not None and self.active.get(job.key) is job:
+                    del self.active[job.key]
+            job.done.set()
+            self.queue.task_done()
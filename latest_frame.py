@@ -0,0 +1,36 @@
+# latest_frame.py
+# Последний опубликованный стерео-кадр в памяти: версия, ETag и ожидание
+# следующей версии (для SSE / long-poll), чтобы зрители качали кадр только при изменении.
+
+import hashlib
+import threading
+import time
+
+
+class LatestFrame:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.version = 0
+        self.data = None
+        self.etag = None
+        self.updated = None
+
+    def set(self, data: bytes):
+        digest = hashlib.sha1(data).hexdigest()[:16]
+        with self.cond:
+            self.version += 1
+            self.data = data
+            self.etag = digest
+            self.updated = time.time()
+            self.cond.notify_all()
+
+    def get(self):
+        """(version, etag, data); data = None, если ещё ничего не опубликовано."""
+        with self.cond:
+            return self.version, self.etag, self.data
+
+    def wait_newer(self, version: int, timeout: float) -> int:
+        """Ждёт версию новее version (не дольше timeout), возвращает текущую."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.version > version, timeout)
+            return self.version
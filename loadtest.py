@@ -0,0 +1,561 @@
+# loadtest.py
+# Нагрузочный тест приложения без камеры: сервер (app.py или server_async.py)
+# запускается в копии проекта с FakeCamera (синтетические кадры, картинка,
+# папка или видео), против него — зрители (опрос /get-image по ETag или поток
+# /camera-feed | /stereo-feed) и операторы (/capture?convert=true и /convert).
+# Итог: p50/p95/p99, пропускная способность, байты по маршрутам, FPS потоков,
+# CPU/RSS сервера и процессов конвертера (./stereo, пул пакетной конвертации).
+#
+#   python loadtest.py --quick
+#   python loadtest.py --pollers 20 --streamers 5 --operators 2 --duration 60
+#   python loadtest.py --server async --streamers 100 --stream-path /stereo-feed
+#   python loadtest.py --camera videos/clip.mp4 --camera-size 1920x1080 --output load.json
+#   python loadtest.py --url http://192.168.1.10:8000 --pollers 10   # уже запущенный сервер
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent
+# в копию проекта не берём результаты, кэши и загруженные видео
+COPY_IGNORE = shutil.ignore_patterns(".git", "__pycache__", "converted_images", "videos", "bench_data",
+                                     "camera.json", "*.pyc", "loadtest_results.json", "bench_results.json")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class Recorder:
+    """Замеры по маршрутам: задержки, статусы, байты. Общий для всех клиентов."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.routes = {}
+
+    def add(self, route, seconds, status, size):
+        if not self.active:
+            return
+        with self.lock:
+            r = self.routes.setdefault(route, {"latencies": [], "statuses": {}, "bytes": 0, "errors": 0})
+            if status is None:
+                r["errors"] += 1
+                return
+            r["latencies"].append(seconds)
+            r["statuses"][str(status)] = r["statuses"].get(str(status), 0) + 1
+            r["bytes"] += size
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def latency_summary(values) -> dict:
+    ms = [v * 1000 for v in values]
+    return {
+        "p50_ms": round(percentile(ms, 0.50), 2) if ms else None,
+        "p95_ms": round(percentile(ms, 0.95), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 0.99), 2) if ms else None,
+        "max_ms": round(max(ms), 2) if ms else None,
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else None,
+    }
+
+
+# --- процессы: CPU и RSS сервера и его потомков через /proc (Linux) ---
+
+def _proc_stat(pid):
+    """(ppid, comm, utime+stime, cutime+cstime, rss) в секундах/байтах или None."""
+    try:
+        raw = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    comm = raw[raw.index("(") + 1:raw.rindex(")")]
+    fields = raw[raw.rindex(")") + 2:].split()
+    # после comm: state(0) ppid(1) ... utime(11) stime(12) cutime(13) cstime(14) ... rss(21)
+    return (int(fields[1]), comm, (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+            (int(fields[13]) + int(fields[14])) / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE)
+
+
+def _descendants(root):
+    parents = {}
+    for entry in Path("/proc").iterdir():
+        if entry.name.isdigit():
+            st = _proc_stat(entry.name)
+            if st:
+                parents.setdefault(st[0], []).append(int(entry.name))
+    found, todo = [], [root]
+    while todo:
+        for child in parents.get(todo.pop(), []):
+            found.append(child)
+            todo.append(child)
+    return found
+
+
+class ProcSampler:
+    """
+    Опрос /proc раз в interval: CPU сервера, CPU потомков (живых — напрямую,
+    завершившихся — через cutime/cstime сервера, так короткие ./stereo тоже учитываются),
+    пиковый RSS сервера и суммарный пиковый RSS потомков.
+    """
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.samples = []
+        self.start_point = None
+        self.peak_server_rss = 0
+        self.peak_children_rss = 0
+        self.children_seen = {}
+
+    def _sample(self):
+        server = _proc_stat(self.pid)
+        if server is None:
+            return None
+        children = {}
+        for pid in _descendants(self.pid):
+            st = _proc_stat(pid)
+            if st:
+                children[pid] = st
+                self.children_seen[pid] = st[1]
+        return {
+            "t": time.monotonic(),
+            "server_cpu": server[2],
+            "reaped_cpu": server[3],
+            "live_cpu": sum(st[2] for st in children.values()),
+            "server_rss": server[4],
+            "children_rss": sum(st[4] for st in children.values()),
+        }
+
+    def start(self):
+        self.start_point = self._sample()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            s = self._sample()
+            if s is None:
+                return
+            self.samples.append(s)
+            self.peak_server_rss = max(self.peak_server_rss, s["server_rss"])
+            self.peak_children_rss = max(self.peak_children_rss, s["children_rss"])
+
+    def stop(self) -> dict:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        first, last = self.start_point, (self.samples[-1] if self.samples else None)
+        if not first or not last:
+            return {}
+        elapsed = last["t"] - first["t"]
+        server_cpu = last["server_cpu"] - first["server_cpu"]
+        children_cpu = (last["reaped_cpu"] - first["reaped_cpu"]) + (last["live_cpu"] - first["live_cpu"])
+        names = {}
+        for name in self.children_seen.values():
+            names[name] = names.get(name, 0) + 1
+        return {
+            "server": {
+                "cpu_seconds": round(server_cpu, 2),
+                "cpu_percent": round(100 * server_cpu / elapsed, 1) if elapsed else None,
+                "peak_rss_mb": round(self.peak_server_rss / 2**20, 1),
+            },
+            "converters": {
+                "cpu_seconds": round(children_cpu, 2),
+                "cpu_percent": round(100 * children_cpu / elapsed, 1) if elapsed else None,
+                "peak_rss_mb": round(self.peak_children_rss / 2**20, 1),
+                "processes_seen": names,
+            },
+        }
+
+
+# --- сервер ---
+
+def prepare_workdir(workdir: Path):
+    """Копия проекта: тест не трогает images/, converted_images/ и конфиг рабочей установки."""
+    if workdir.exists():
+        shutil.rmtree(workdir)
+    shutil.copytree(ROOT, workdir, ignore=COPY_IGNORE, symlinks=True)
+    return workdir
+
+
+def start_server(kind, workdir: Path, port: int, camera: str, size, fps: int, log_path: Path):
+    env = dict(os.environ, CAMERA_SOURCE=camera, CAMERA_WIDTH=str(size[0]), CAMERA_HEIGHT=str(size[1]),
+               CAMERA_FPS=str(fps), HOST="127.0.0.1", ASYNC_PORT=str(port), PYTHONUNBUFFERED="1")
+    if kind == "async":
+        cmd = [sys.executable, "server_async.py"]
+    else:
+        cmd = [sys.executable, "-c", "import app; app.start_services(); "
+               f"app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    log = open(log_path, "wb")
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return proc, log
+
+
+def stop_server(proc):
+    if proc.poll() is not None:
+        return
+    # SIGINT — чтобы отработал atexit (остановка ./stereo --serve)
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def wait_ready(host, port, timeout=60.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/config.json")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.3)
+    return False
+
+
+# --- клиенты ---
+
+class Client:
+    def __init__(self, host, port, recorder, stop_event, timeout=60.0):
+        self.host, self.port = host, port
+        self.recorder = recorder
+        self.stop_event = stop_event
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None, route=None):
+        """Запрос с keep-alive; (status, headers, body) или None при ошибке соединения."""
+        route = route or path.split("?")[0]
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path, body=body, headers=headers or {})
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.recorder.add(route, time.perf_counter() - started, None, 0)
+            self.close()
+            return None
+        self.recorder.add(route, time.perf_counter() - started, resp.status, len(data))
+        if resp.getheader("Connection", "").lower() == "close":
+            self.close()
+        return resp.status, resp, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def poller(client: Client, interval: float):
+    """Зритель-шлем по таймеру: /get-image с If-None-Match (304, пока кадр не сменился)."""
+    etag = None
+    while not client.stop_event.is_set():
+        started = time.monotonic()
+        result = client.request("GET", "/get-image", headers={"If-None-Match": etag} if etag else None)
+        if result and result[0] == 200:
+            etag = result[1].getheader("ETag")
+        client.stop_event.wait(max(0.0, interval - (time.monotonic() - started)))
+    client.close()
+
+
+def streamer(client: Client, path: str, streams: list):
+    """MJPEG-зритель: время до первого кадра, интервалы между кадрами, байты."""
+    while not client.stop_event.is_set():
+        stats = {"path": path, "frames": 0, "bytes": 0, "gaps": [], "first_frame_s": None, "error": None}
+        streams.append(stats)
+        started = time.perf_counter()
+        conn = http.client.HTTPConnection(client.host, client.port, timeout=client.timeout)
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            if not resp.getheader("Content-Type", "").startswith("multipart/"):
+                stats["error"] = f"HTTP {resp.status}: {resp.read(200).decode('utf-8', 'replace')}"
+                client.stop_event.wait(1.0)
+                continue
+            last = None
+            while not client.stop_event.is_set():
+                length = None
+                # заголовки части: --frame, Content-Type, пустая строка (Content-Length нет)
+                line = resp.fp.readline()
+                if not line:
+                    break
+                if not line.startswith(b"--frame"):
+                    continue
+                while True:
+                    header = resp.fp.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    if header.lower().startswith(b"content-length:"):
+                        length = int(header.split(b":")[1])
+                frame = resp.fp.read(length) if length else _read_jpeg(resp.fp)
+                now = time.perf_counter()
+                if stats["first_frame_s"] is None:
+                    stats["first_frame_s"] = now - started
+                if client.recorder.active:
+                    if last is not None:
+                        stats["gaps"].append(now - last)
+                    stats["frames"] += 1
+                    stats["bytes"] += len(frame)
+                last = now
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            stats["error"] = str(e)
+            client.stop_event.wait(1.0)
+        finally:
+            conn.close()
+
+
+def _read_jpeg(fp) -> bytes:
+    """JPEG без Content-Length: читаем блоками (peek) ровно до маркера конца EOI (FF D9)."""
+    buf = bytearray()
+    while True:
+        ahead = fp.peek(65536)
+        if not ahead:
+            return bytes(buf)
+        # маркер мог разрезаться между блоками
+        if buf and buf[-1] == 0xFF and ahead[:1] == b"\xd9":
+            buf += fp.read(1)
+            return bytes(buf)
+        eoi = ahead.find(b"\xff\xd9")
+        if eoi >= 0:
+            buf += fp.read(eoi + 2)
+            return bytes(buf)
+        buf += fp.read(len(ahead))
+
+
+def operator(client: Client, interval: float, filenames: list, index: int):
+    """
+    Оператор: снимок с конвертацией (/capture?convert=true, ответ 202 сразу) и
+    синхронная конвертация файла (/convert с wait=true — время до готового результата).
+    """
+    step = index
+    while not client.stop_event.is_set():
+        started = time.monotonic()
+        if step % 2 == 0 or not filenames:
+            client.request("POST", "/capture?convert=true")
+        else:
+            name = filenames[(step // 2) % len(filenames)]
+            body = json.dumps({"filename": name, "wait": True})
+            client.request("POST", "/convert", body=body, headers={"Content-Type": "application/json"})
+        step += 1
+        client.stop_event.wait(max(0.0, interval - (time.monotonic() - started)))
+    client.close()
+
+
+def list_images(host, port) -> list:
+    try:
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        conn.request("GET", "/images?limit=50&origin=upload")
+        data = json.loads(conn.getresponse().read())
+    except (OSError, ValueError, http.client.HTTPException):
+        return []
+    return data.get("images", [])
+
+
+def summarize(recorder: Recorder, streams: list, elapsed: float) -> dict:
+    routes = {}
+    for route, r in sorted(recorder.routes.items()):
+        count = len(r["latencies"])
+        routes[route] = dict(latency_summary(r["latencies"]), requests=count, errors=r["errors"],
+                             statuses=r["statuses"], bytes=r["bytes"],
+                             rps=round(count / elapsed, 2) if elapsed else None,
+                             mbps=round(r["bytes"] * 8 / elapsed / 1e6, 2) if elapsed else None)
+    gaps = [g for s in streams for g in s["gaps"]]
+    frames = sum(s["frames"] for s in streams)
+    stream_bytes = sum(s["bytes"] for s in streams)
+    first = [s["first_frame_s"] for s in streams if s["first_frame_s"] is not None]
+    viewers = len([s for s in streams if s["frames"]])
+    stream_summary = None
+    if streams:
+        stream_summary = {
+            "connections": len(streams),
+            "errors": sorted({s["error"] for s in streams if s["error"]})[:5],
+            "frames": frames,
+            "bytes": stream_bytes,
+            "fps_per_viewer": round(frames / elapsed / max(1, viewers), 2) if elapsed else None,
+            "mbps": round(stream_bytes * 8 / elapsed / 1e6, 2) if elapsed else None,
+            "frame_gap": latency_summary(gaps),
+            "first_frame": latency_summary(first),
+        }
+    total_requests = sum(r["requests"] for r in routes.values())
+    total_bytes = sum(r["bytes"] for r in routes.values()) + stream_bytes
+    return {
+        "routes": routes,
+        "streams": stream_summary,
+        "total": {
+            "requests": total_requests,
+            "rps": round(total_requests / elapsed, 2) if elapsed else None,
+            "bytes": total_bytes,
+            "mbps": round(total_bytes * 8 / elapsed / 1e6, 2) if elapsed else None,
+        },
+    }
+
+
+def parse_size(text: str):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Нагрузочный тест: зрители и операторы против FakeCamera")
+    ap.add_argument("--server", choices=("flask", "async"), default="flask",
+                    help="flask — app.run (поток на клиента), async — server_async.py")
+    ap.add_argument("--url", help="не запускать сервер, нагружать уже работающий (CPU/RSS — только с --pid)")
+    ap.add_argument("--pid", type=int, help="PID уже работающего сервера для замера CPU/RSS")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workdir", help="куда копировать проект (по умолчанию — временная папка)")
+    ap.add_argument("--camera", default="synthetic", help="synthetic | картинка | папка с картинками | mp4/avi")
+    ap.add_argument("--camera-size", default="1280x720")
+    ap.add_argument("--camera-fps", type=int, default=30)
+    ap.add_argument("--pollers", type=int, default=10, help="зрители, опрашивающие /get-image")
+    ap.add_argument("--poll-interval", type=float, default=0.5)
+    ap.add_argument("--streamers", type=int, default=2, help="зрители MJPEG-потока")
+    ap.add_argument("--stream-path", default="/camera-feed", choices=("/camera-feed", "/stereo-feed"))
+    ap.add_argument("--operators", type=int, default=1, help="операторы: /capture?convert=true и /convert")
+    ap.add_argument("--operator-interval", type=float, default=3.0)
+    ap.add_argument("--duration", type=float, default=30.0, help="секунд замера")
+    ap.add_argument("--warmup", type=float, default=5.0, help="секунд нагрузки до начала замера")
+    ap.add_argument("--timeout", type=float, default=60.0, help="таймаут одного запроса")
+    ap.add_argument("--output", default="loadtest_results.json")
+    ap.add_argument("--quick", action="store_true", help="5 опрашивающих, 2 потока, 1 оператор, 10 с")
+    args = ap.parse_args(argv)
+
+    if args.quick:
+        args.pollers, args.streamers, args.operators = 5, 2, 1
+        args.duration, args.warmup = 10.0, 3.0
+
+    proc = log = None
+    workdir = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+        server_pid = args.pid
+    else:
+        host, port = "127.0.0.1", args.port
+        workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="loadtest_"))
+        prepare_workdir(workdir)
+        log_path = workdir / "server.log"
+        print(f"[load] starting {args.server} server in {workdir} (camera {args.camera})")
+        proc, log = start_server(args.server, workdir, port, args.camera, parse_size(args.camera_size),
+                                 args.camera_fps, log_path)
+        server_pid = proc.pid
+
+    results = None
+    try:
+        if not wait_ready(host, port):
+            print(f"[load] server did not start on {host}:{port}"
+                  + (f", see {workdir / 'server.log'}" if workdir else ""))
+            return 1
+
+        recorder = Recorder()
+        stop_event = threading.Event()
+        streams = []
+        filenames = list_images(host, port)
+        threads = []
+
+        def spawn(target, *extra):
+            client = Client(host, port, recorder, stop_event, args.timeout)
+            t = threading.Thread(target=target, args=(client,) + extra, daemon=True)
+            t.start()
+            threads.append(t)
+
+        for _ in range(args.pollers):
+            spawn(poller, args.poll_interval)
+        for _ in range(args.streamers):
+            spawn(streamer, args.stream_path, streams)
+        for i in range(args.operators):
+            spawn(operator, args.operator_interval, filenames, i)
+
+        print(f"[load] {args.pollers} pollers, {args.streamers} streamers ({args.stream_path}), "
+              f"{args.operators} operators; warmup {args.warmup}s, measure {args.duration}s")
+        time.sleep(args.warmup)
+
+        sampler = ProcSampler(server_pid) if server_pid and Path(f"/proc/{server_pid}").exists() else None
+        if sampler:
+            sampler.start()
+        recorder.active = True
+        started = time.monotonic()
+        time.sleep(args.duration)
+        recorder.active = False
+        elapsed = time.monotonic() - started
+        processes = sampler.stop() if sampler else None
+
+        stop_event.set()
+        for t in threads:
+            t.join(timeout=args.timeout)
+
+        results = {
+            "meta": {
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "host": platform.node(),
+                "cpu_count": os.cpu_count(),
+                "server": "external" if args.url else args.server,
+                "camera": args.camera,
+                "camera_size": args.camera_size,
+                "camera_fps": args.camera_fps,
+                "pollers": args.pollers,
+                "poll_interval": args.poll_interval,
+                "streamers": args.streamers,
+                "stream_path": args.stream_path,
+                "operators": args.operators,
+                "operator_interval": args.operator_interval,
+                "duration_s": round(elapsed, 2),
+            },
+            **summarize(recorder, streams, elapsed),
+            "processes": processes,
+        }
+    finally:
+        if proc is not None:
+            stop_server(proc)
+            log.close()
+        if workdir is not None and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for route, r in results["routes"].items():
+        print(f"[load] {route}: {r['requests']} req ({r['rps']}/s, errors {r['errors']}) "
+              f"p50 {r['p50_ms']} p95 {r['p95_ms']} p99 {r['p99_ms']} ms, {r['mbps']} Mbit/s {r['statuses']}")
+    s = results["streams"]
+    if s:
+        print(f"[load] streams: {s['frames']} frames, {s['fps_per_viewer']} fps/viewer, {s['mbps']} Mbit/s, "
+              f"gap p50 {s['frame_gap']['p50_ms']} p95 {s['frame_gap']['p95_ms']} "
+              f"p99 {s['frame_gap']['p99_ms']} ms" + (f", errors {s['errors']}" if s["errors"] else ""))
+    t = results["total"]
+    print(f"[load] total: {t['requests']} req ({t['rps']}/s), {t['mbps']} Mbit/s")
+    if results["processes"]:
+        srv, conv = results["processes"]["server"], results["processes"]["converters"]
+        print(f"[load] server: CPU {srv['cpu_percent']}% ({srv['cpu_seconds']} s), peak RSS {srv['peak_rss_mb']} MB")
+        print(f"[load] converters: CPU {conv['cpu_percent']}% ({conv['cpu_seconds']} s), "
+              f"peak RSS {conv['peak_rss_mb']} MB, processes {conv['processes_seen']}")
+
+    Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[load] results: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
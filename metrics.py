@@ -0,0 +1,142 @@
+# metrics.py
+# Лёгкие метрики без внешних зависимостей: счётчики, гистограммы задержек
+# и значения, снимаемые в момент запроса; отдаются в текстовом формате
+# Prometheus (/metrics).
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+# секунды: от миллисекунд (публикация) до десятков секунд (8K в ./stereo)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.series = {}   # labels -> [counts по корзинам..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self.lock:
+            s = self.series.get(key)
+            if s is None:
+                s = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, s in sorted(self.series.items()):
+                for i, bound in enumerate(self.buckets):
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(bound))])} {s[i]}")
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', '+Inf')])} {s[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(round(s[-2], 6))}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {s[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """
+        func() -> [(name, type, help, value | {labels-dict-as-tuple: value})],
+        вызывается на каждый /metrics (очередь, камера, кэш — их состояние уже где-то хранится).
+        """
+        self.collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for func in self.collectors:
+            try:
+                samples = func()
+            except Exception as e:
+                print(f"[metrics] collector {getattr(func, '__name__', func)} failed: {e}")
+                continue
+            for name, kind, help_text, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if isinstance(value, dict):
+                    for labels, v in value.items():
+                        if v is not None:
+                            lines.append(f"{name}{_labels([k for k, _ in labels], [x for _, x in labels])} {_number(v)}")
+                else:
+                    lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def timed(histogram: Histogram, stages: dict = None, **labels):
+    """
+    Замер блока: в гистограмму (секунды) и, если передан, в stages[<stage>_ms]
+    (для трассы одной конвертации).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        histogram.observe(seconds, **labels)
+        if stages is not None:
+            name = labels.get("stage", histogram.name)
+            stages[f"{name}_ms"] = round(stages.get(f"{name}_ms", 0.0) + seconds * 1000, 2)
@@ -0,0 +1,109 @@
+# renditions.py
+# Уменьшенные копии изображений для админки (миниатюры и превью).
+# Создаются лениво, JPEG декодируется сразу в уменьшенном масштабе (PIL draft,
+# масштабирование DCT), лежат в ограниченном дисковом кэше; ключ учитывает mtime исходника.
+
+import queue
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image
+
+
+SIZES = {"thumb": 256, "preview": 1024}
+FORMATS = {"jpeg": ("JPEG", ".jpg", "image/jpeg"), "webp": ("WEBP", ".webp", "image/webp")}
+
+
+class RenditionCache:
+    def __init__(self, source_folder: Path, cache_folder: Path, max_bytes: int, quality=80):
+        self.source_folder = Path(source_folder)
+        self.cache_folder = Path(cache_folder)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.lock = threading.Lock()
+        self.index = OrderedDict()   # имя файла рендишена -> размер, от давнего к свежему
+        self.total_bytes = 0
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+        self.warm_queue = queue.Queue(maxsize=64)
+        self.warm_thread = None
+
+    def _load_index(self):
+        entries = []
+        for p in self.cache_folder.iterdir():
+            if p.suffix in (".jpg", ".webp"):
+                st = p.stat()
+                entries.append((st.st_mtime, p.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self.index[name] = size
+            self.total_bytes += size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.index:
+            name, size = self.index.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                (self.cache_folder / name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _render(self, source: Path, target: Path, box: int, fmt: str):
+        with Image.open(source) as im:
+            # для JPEG декодер сразу отдаёт картинку в 1/2, 1/4 или 1/8 масштаба
+            im.draft("RGB", (box, box))
+            im = im.convert("RGB")
+            im.thumbnail((box, box), Image.BILINEAR)
+            tmp = target.with_name(f"{target.name}.{threading.get_ident()}.tmp")
+            im.save(tmp, FORMATS[fmt][0], quality=self.quality)
+            tmp.replace(target)
+
+    def get(self, name: str, size="thumb", fmt="jpeg"):
+        """
+        Путь к рендишену (создаётся при первом запросе) и mtime исходника
+        в наносекундах (версия). None, если исходника нет.
+        """
+        source = self.source_folder / name
+        try:
+            mtime_ns = source.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        ext = FORMATS[fmt][1]
+        key = f"{name}.{size}.{mtime_ns}{ext}"
+        target = self.cache_folder / key
+
+        with self.lock:
+            if key in self.index and target.exists():
+                self.index.move_to_end(key)
+                return target, mtime_ns
+
+        self._render(source, target, SIZES[size], fmt)
+        with self.lock:
+            old = self.index.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old
+            size_bytes = target.stat().st_size
+            self.index[key] = size_bytes
+            self.total_bytes += size_bytes
+            self._evict()
+        return target, mtime_ns
+
+    def prewarm(self, name: str, sizes=("thumb",), fmt="jpeg"):
+        """Поставить создание рендишенов в фон (после /upload и /capture)."""
+        if self.warm_thread is None or not self.warm_thread.is_alive():
+            self.warm_thread = threading.Thread(target=self._warmer, daemon=True)
+            self.warm_thread.start()
+        for size in sizes:
+            try:
+                self.warm_queue.put_nowait((name, size, fmt))
+            except queue.Full:
+                return
+
+    def _warmer(self):
+        while True:
+            name, size, fmt = self.warm_queue.get()
+            try:
+                self.get(name, size, fmt)
+            except Exception as e:
+                print(f"[renditions] prewarm {name} failed: {e}")
@@ -0,0 +1,161 @@
+# result_cache.py
+# Кэш результатов конвертации по содержимому: ключ = хэш байтов исходника
+# + эффективные параметры. Файлы лежат на диске (LRU по суммарному размеру),
+# самые горячие — ещё и в памяти. Имя записи — ключ и расширение формата (.jpg/.webp).
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class ResultCache:
+    def __init__(self, folder: Path, max_bytes: int, memory_max_bytes: int = 32 * 1024 * 1024):
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self.lock = threading.Lock()
+        self.disk = OrderedDict()     # имя записи -> size, от давнего к свежему
+        self.disk_bytes = 0
+        self.memory = OrderedDict()   # имя записи -> bytes
+        self.memory_bytes = 0
+        self.counters = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if self.enabled:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(source: Path, params: dict) -> str:
+        h = hashlib.sha1()
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        for k in sorted(params):
+            h.update(f"|{k}={params[k]}".encode("utf-8"))
+        return h.hexdigest()
+
+    def path(self, key: str, ext: str = ".jpg") -> Path:
+        """Файл записи (для публикации жёсткой ссылкой); может быть уже вытеснен."""
+        return self.folder / f"{key}{ext}"
+
+    def _load_index(self):
+        # восстанавливаем порядок LRU по времени последнего доступа
+        entries = []
+        for p in self.folder.iterdir():
+            try:
+                if p.suffix == ".tmp":
+                    # недописанная запись с прошлого запуска
+                    p.unlink()
+                    continue
+                st = p.stat()
+                entries.append((st.st_mtime, p.name, st.st_size))
+            except FileNotFoundError:
+                pass
+        for _, name, size in sorted(entries):
+            self.disk[name] = size
+            self.disk_bytes += size
+        self._evict()
+
+    def _remember(self, name: str, data: bytes):
+        if len(data) > self.memory_max_bytes:
+            return
+        if name in self.memory:
+            self.memory.move_to_end(name)
+            return
+        self.memory[name] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.memory_max_bytes and self.memory:
+            _, old = self.memory.popitem(last=False)
+            self.memory_bytes -= len(old)
+
+    def _evict(self):
+        while self.disk_bytes > self.max_bytes and self.disk:
+            name, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            self.counters["evictions"] += 1
+            old = self.memory.pop(name, None)
+            if old is not None:
+                self.memory_bytes -= len(old)
+            try:
+                (self.folder / name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str, ext: str = ".jpg"):
+        """Возвращает байты результата (формат ext) или None."""
+        if not self.enabled:
+            return None
+        path = self.path(key, ext)
+        name = path.name
+        with self.lock:
+            data = self.memory.get(name)
+            if data is not None:
+                self.memory.move_to_end(name)
+                self.disk.move_to_end(name)
+                self.counters["hits_memory"] += 1
+                return data
+            if name not in self.disk:
+                self.counters["misses"] += 1
+                return None
+            self.disk.move_to_end(name)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                size = self.disk.pop(name, None)
+                if size is not None:
+                    self.disk_bytes -= size
+                self.counters["misses"] += 1
+            return None
+        with self.lock:
+            self.counters["hits_disk"] += 1
+            self._remember(name, data)
+        return data
+
+    def put(self, key: str, source: Path, data: bytes = None):
+        """
+        Кладёт в кэш готовый результат (файл source, который больше не меняется):
+        жёсткой ссылкой, без копирования, с расширением source. data — уже
+        прочитанные байты, если есть.
+        """
+        if not self.enabled:
+            return
+        if data is None:
+            data = Path(source).read_bytes()
+        path = self.path(key, Path(source).suffix)
+        name = path.name
+        tmp = path.with_name(f"{name}.{threading.get_ident()}.tmp")
+        try:
+            os.link(source, tmp)
+        except FileExistsError:
+            tmp.unlink()
+            os.link(source, tmp)
+        except OSError:
+            with open(tmp, "wb") as f:
+                f.write(data)
+        tmp.replace(path)
+        with self.lock:
+            old = self.disk.pop(name, None)
+            if old is not None:
+                self.disk_bytes -= old
+            self.disk[name] = len(data)
+            self.disk_bytes += len(data)
+            self.counters["stores"] += 1
+            self._remember(name, data)
+            self._evict()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters,
+                        enabled=self.enabled,
+                        entries=len(self.disk),
+                        disk_bytes=self.disk_bytes,
+                        max_bytes=self.max_bytes,
+                        memory_entries=len(self.memory),
+                        memory_bytes=self.memory_bytes)
@@ -0,0 +1,479 @@
+# server_async.py
+# Альтернативная точка входа: HTTP-сервер на asyncio (только стандартная библиотека).
+# Долгие потоки (/camera-feed, /stereo-feed, /events) и /get-image обслуживаются
+# корутинами: на источник кадров — один поток-ожидатель, на клиента — ни одного.
+# Остальные маршруты Flask работают как есть через WSGI в ограниченном пуле потоков,
+# тяжёлая работа (конвертация, кодирование) и так идёт в своих потоках/процессах.
+#
+#   python server_async.py
+#
+# Лимиты: ASYNC_MAX_CONNECTIONS (одновременные соединения, сверх — 503),
+# ASYNC_WSGI_THREADS (потоки для обычных маршрутов Flask).
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from email.utils import formatdate
+from http import HTTPStatus
+
+import app as webapp
+from encoding import mimetype_of
+
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("ASYNC_PORT", "8000"))
+MAX_CONNECTIONS = max(1, int(os.environ.get("ASYNC_MAX_CONNECTIONS", "256")))
+WSGI_THREADS = max(1, int(os.environ.get("ASYNC_WSGI_THREADS", "8")))
+
+HEADER_LIMIT = 64 * 1024
+KEEPALIVE_TIMEOUT = 15.0
+# медленный зритель, не принявший кадр за это время, отключается
+WRITE_TIMEOUT = 10.0
+# тело запроса больше этого — во временный файл, а не в память
+SPOOL_BYTES = 1024 * 1024
+MAX_BODY = max(webapp.MAX_CONTENT_LENGTH, webapp.MAX_VIDEO_CONTENT_LENGTH)
+# ответ WSGI отдаётся порциями примерно такого размера (один заход в пул на порцию)
+RESPONSE_BATCH = 256 * 1024
+# такие ответы Flask отдаются по мере генерации, без набора порции
+STREAMING_TYPES = ("text/event-stream", "application/x-ndjson", "multipart/x-mixed-replace")
+
+
+class BadRequest(Exception):
+    pass
+
+
+class FrameHub:
+    """
+    Раздача кадров одного источника множеству корутин. Поток-ожидатель
+    (только пока есть подписчики) ждёт новый кадр блокирующим wait(seq, timeout)
+    и будит всех клиентов через asyncio.Event; медленный клиент просто берёт
+    самый свежий кадр.
+    """
+
+    def __init__(self, name, wait, hold=None):
+        """
+        wait(last_seq, timeout) -> (seq, data | None) — как camera.wait_jpeg;
+        hold() — контекст, который держится, пока есть подписчики (stereo_stream.viewer).
+        """
+        self.name = name
+        self.wait = wait
+        self.hold = hold
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.subscribers = 0
+        self.seq = 0
+        self.data = None
+        self.event = None
+
+    def subscribe(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.event = asyncio.Event()
+        with self.lock:
+            self.subscribers += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f"hub-{self.name}", daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self):
+        with self.lock:
+            self.subscribers -= 1
+
+    def _run(self):
+        seq = self.seq
+        with (self.hold() if self.hold else nullcontext()):
+            while True:
+                with self.lock:
+                    if self.subscribers == 0:
+                        self.thread = None
+                        return
+                try:
+                    new_seq, data = self.wait(seq, 1.0)
+                except Exception as e:
+                    print(f"[async] hub {self.name} failed: {e}")
+                    time.sleep(1.0)
+                    continue
+                if data is not None and new_seq != seq:
+                    seq = new_seq
+                    self.loop.call_soon_threadsafe(self._publish, new_seq, data)
+
+    def _publish(self, seq, data):
+        self.seq, self.data = seq, data
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+    async def next(self, last_seq, timeout):
+        """(seq, data) новее last_seq или (last_seq, None) по таймауту."""
+        if self.seq != last_seq and self.data is not None:
+            return self.seq, self.data
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return last_seq, None
+        return self.seq, self.data
+
+
+def _wait_version(last, timeout):
+    current = webapp.latest_frame.wait_newer(last, timeout)
+    return current, (current if current > last else None)
+
+
+camera_hub = FrameHub("camera", webapp.camera.wait_jpeg)
+stereo_hub = FrameHub("stereo", webapp.stereo_stream.wait_jpeg, hold=webapp.stereo_stream.viewer)
+version_hub = FrameHub("latest", _wait_version)
+
+state = {"connections": 0, "streams": 0, "rejected": 0}
+
+
+@webapp.metrics_registry.collector
+def collect_async_state():
+    return [
+        ("async_connections_open", "gauge", "Открытые HTTP-соединения (async-сервер)", state["connections"]),
+        ("async_streams_open", "gauge", "Открытые потоки MJPEG/SSE (async-сервер)", state["streams"]),
+        ("async_rejected_total", "counter", "Соединения, отклонённые по ASYNC_MAX_CONNECTIONS", state["rejected"]),
+    ]
+
+
+def _head(status: int, headers, keep_alive=True) -> bytes:
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+             f"Date: {formatdate(usegmt=True)}", "Server: vr-converter-async"]
+    lines += [f"{k}: {v}" for k, v in headers]
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send(writer, data: bytes):
+    writer.write(data)
+    await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+
+
+async def _simple(writer, status: int, body: bytes, content_type="text/plain; charset=utf-8",
+                  headers=(), keep_alive=True, head=False):
+    hdrs = [("Content-Type", content_type), ("Content-Length", str(len(body)))] + list(headers)
+    await _send(writer, _head(status, hdrs, keep_alive) + (b"" if head else body))
+
+
+async def _read_request(reader):
+    """(method, target, version, {header: value}) или None, если клиент закрыл соединение."""
+    try:
+        raw = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise BadRequest("заголовки слишком большие")
+    lines = raw.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise BadRequest("неверная строка запроса")
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        name = name.strip().lower()
+        value = value.strip()
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+    return method.upper(), target, version, headers
+
+
+def _has_body(headers) -> bool:
+    """Пришло ли с запросом тело (нативные GET/HEAD-маршруты его не читают)."""
+    return "transfer-encoding" in headers or headers.get("content-length", "").strip() not in ("", "0")
+
+
+async def _read_body(reader, writer, headers):
+    """Тело по Content-Length: небольшое — в памяти, большое — во временном файле."""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise BadRequest("chunked-тело не поддерживается, нужен Content-Length")
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY:
+        return None, length
+    if headers.get("expect", "").lower() == "100-continue":
+        await _send(writer, b"HTTP/1.1 100 Continue\r\n\r\n")
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    remaining = length
+    while remaining > 0:
+        chunk = await reader.read(min(remaining, 256 * 1024))
+        if not chunk:
+            raise BadRequest("тело запроса оборвано")
+        body.write(chunk)
+        remaining -= len(chunk)
+    body.seek(0)
+    return body, length
+
+
+def _environ(method, target, version, headers, body, length, peer):
+    path, _, query = target.partition("?")
+    environ = {
+        "REQUEST_METHOD": method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": urllib.parse.unquote_to_bytes(path).decode("latin-1"),
+        "QUERY_STRING": query,
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": str(PORT),
+        "SERVER_PROTOCOL": version,
+        "REMOTE_ADDR": peer[0] if peer else "",
+        "CONTENT_LENGTH": str(length) if length else "",
+        "CONTENT_TYPE": headers.get("content-type", ""),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers.items():
+        if name in ("content-type", "content-length"):
+            continue
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+    return environ
+
+
+def _call_wsgi(environ):
+    """В пуле: вызов Flask-приложения; (статус, заголовки, итератор тела)."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"], response["headers"] = status, headers
+        return lambda data: response.setdefault("written", []).append(data)
+
+    result = webapp.app(environ, start_response)
+    body = iter(result)
+    first = []
+    # Flask вызывает start_response до первой порции; заодно забираем её
+    for chunk in body:
+        if chunk:
+            first.append(chunk)
+            break
+    return response["status"], response["headers"], response.get("written", []) + first, body, result
+
+
+def _next_batch(body):
+    """В пуле: следующая порция тела (несколько кусков до RESPONSE_BATCH); (куски, закончилось ли)."""
+    chunks, size = [], 0
+    for chunk in body:
+        if chunk:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= RESPONSE_BATCH:
+                return chunks, False
+    return chunks, True
+
+
+async def _serve_wsgi(loop, pool, writer, request, body, length, peer, keep_alive):
+    method, target, version, headers = request
+    environ = _environ(method, target, version, headers, body, length, peer)
+    status, resp_headers, first, rest, result = await loop.run_in_executor(pool, _call_wsgi, environ)
+    code = int(status.split(" ", 1)[0])
+    names = {k.lower() for k, _ in resp_headers}
+    chunked = "content-length" not in names and method != "HEAD" and code not in (204, 304)
+    if chunked and version == "HTTP/1.0":
+        keep_alive, chunked = False, False
+    hdrs = list(resp_headers) + ([("Transfer-Encoding", "chunked")] if chunked else [])
+    streaming = any(k.lower() == "content-type" and v.startswith(STREAMING_TYPES) for k, v in resp_headers)
+
+    def frame(chunks):
+        data = b"".join(chunks)
+        if not chunked or not data:
+            return data
+        return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+    try:
+        await _send(writer, _head(code, hdrs, keep_alive) + (b"" if method == "HEAD" else frame(first)))
+        done = method == "HEAD"
+        while not done:
+            if streaming:
+                # NDJSON/SSE из Flask: отдаём каждую порцию сразу, не копим до RESPONSE_BATCH
+                chunk = await loop.run_in_executor(pool, next, rest, None)
+                chunks, done = ([chunk] if chunk else []), chunk is None
+            else:
+                chunks, done = await loop.run_in_executor(pool, _next_batch, rest)
+            if chunks:
+                await _send(writer, frame(chunks))
+        if chunked and method != "HEAD":
+            await _send(writer, b"0\r\n\r\n")
+    finally:
+        close = getattr(result, "close", None)
+        if close:
+            await loop.run_in_executor(pool, close)
+    return keep_alive
+
+
+async def _stream_mjpeg(loop, writer, hub, start_source, method, endpoint):
+    """MJPEG (multipart/x-mixed-replace) из FrameHub без потока на клиента."""
+    started = time.perf_counter()
+    ok, msg = await loop.run_in_executor(None, start_source)
+    if not ok:
+        body = f"<h3 style='font-family:sans-serif'>Ошибка камеры: {msg}</h3>".encode("utf-8")
+        await _simple(writer, 200, body, "text/html; charset=utf-8", keep_alive=False)
+        return
+    await _send(writer, _head(200, [("Content-Type", "multipart/x-mixed-replace; boundary=frame"),
+                                    ("Cache-Control", "no-cache")], keep_alive=False))
+    webapp.http_seconds.observe(time.perf_counter() - started, endpoint=endpoint, method=method)
+    hub.subscribe()
+    state["streams"] += 1
+    try:
+        seq = 0
+        while True:
+            seq, frame = await hub.next(seq, 1.0)
+            if frame is None:
+                continue
+            await _send(writer, b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+    finally:
+        state["streams"] -= 1
+        hub.unsubscribe()
+
+
+async def _stream_events(writer, method):
+    """SSE: событие frame с версией при каждой публикации, keep-alive раз в 15 с."""
+    await _send(writer, _head(200, [("Content-Type", "text/event-stream; charset=utf-8"),
+                                    ("Cache-Control", "no-cache"), ("X-Accel-Buffering", "no")],
+                              keep_alive=False))
+    webapp.http_seconds.observe(0.0, endpoint="/events", method=method)
+    version_hub.subscribe()
+    state["streams"] += 1
+    try:
+        version = -1
+        while True:
+            current = webapp.latest_frame.version
+            if current <= version:
+                current, _ = await version_hub.next(version, 15.0)
+            if current > version:
+                version = current
+                await _send(writer, f"event: frame\ndata: {json.dumps({'version': version})}\n\n".encode())
+            else:
+                await _send(writer, b": keep-alive\n\n")
+    finally:
+        state["streams"] -= 1
+        version_hub.unsubscribe()
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/").strip('"') == etag:
+            return True
+    return False
+
+
+async def _get_image(writer, headers, method, keep_alive):
+    """Последний кадр из памяти, с ETag/304 — как /get-image во Flask, без захода в пул."""
+    started = time.perf_counter()
+    version, etag, data = webapp.latest_frame.get()
+    if data is None:
+        await _simple(writer, 404, "Нет сконвертированных изображений".encode("utf-8"),
+                      keep_alive=keep_alive, head=method == "HEAD")
+    else:
+        extra = [("ETag", f'"{etag}"'), ("Cache-Control", "no-cache"), ("X-Frame-Version", str(version))]
+        if _etag_matches(headers.get("if-none-match", ""), etag):
+            await _send(writer, _head(304, extra, keep_alive))
+        else:
+            await _simple(writer, 200, data, mimetype_of(data), extra, keep_alive, head=method == "HEAD")
+    webapp.http_seconds.observe(time.perf_counter() - started, endpoint="/get-image", method=method)
+
+
+async def handle(reader, writer, loop, pool):
+    peer = writer.get_extra_info("peername")
+    if state["connections"] >= MAX_CONNECTIONS:
+        state["rejected"] += 1
+        try:
+            await _simple(writer, 503, "Сервер перегружен, повторите позже".encode("utf-8"),
+                          headers=[("Retry-After", "1")], keep_alive=False)
+        except Exception:
+            pass
+        writer.close()
+        return
+
+    state["connections"] += 1
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except BadRequest as e:
+                await _simple(writer, 400, str(e).encode("utf-8"), keep_alive=False)
+                break
+            if request is None:
+                break
+            method, target, version, headers = request
+            connection = headers.get("connection", "").lower()
+            keep_alive = (connection != "close") if version == "HTTP/1.1" else (connection == "keep-alive")
+            path = urllib.parse.unquote(target.partition("?")[0])
+
+            if method in ("GET", "HEAD"):
+                # потоковые маршруты закрывают соединение сами; /get-image тело не читает —
+                # иначе его байты разобрались бы как следующий запрос, поэтому закрываем
+                if _has_body(headers):
+                    keep_alive = False
+                if path == "/camera-feed":
+                    await _stream_mjpeg(loop, writer, camera_hub, webapp.camera.start, method, path)
+                    break
+                if path == "/stereo-feed":
+                    await _stream_mjpeg(loop, writer, stereo_hub, webapp.camera.start, method, path)
+                    break
+                if path == "/events":
+                    await _stream_events(writer, method)
+                    break
+                if path == "/get-image":
+                    await _get_image(writer, headers, method, keep_alive)
+                    if not keep_alive:
+                        break
+                    continue
+
+            try:
+                body, length = await _read_body(reader, writer, headers)
+            except BadRequest as e:
+                await _simple(writer, 400, str(e).encode("utf-8"), keep_alive=False)
+                break
+            except ValueError:
+                await _simple(writer, 400, b"bad Content-Length", keep_alive=False)
+                break
+            if body is None:
+                await _simple(writer, 413, "Слишком большой запрос".encode("utf-8"), keep_alive=False)
+                break
+            try:
+                keep_alive = await _serve_wsgi(loop, pool, writer, request, body, length, peer, keep_alive)
+            finally:
+                body.close()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        pass
+    except Exception as e:
+        print(f"[async] {peer}: {e}")
+    finally:
+        state["connections"] -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+    server = await asyncio.start_server(lambda r, w: handle(r, w, loop, pool), HOST, PORT,
+                                        limit=HEADER_LIMIT, backlog=MAX_CONNECTIONS)
+    print(f"[async] listening on {HOST}:{PORT} (max connections {MAX_CONNECTIONS}, wsgi threads {WSGI_THREADS})")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    webapp.start_services()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,310 @@
+# stereo_engine.py
+# Векторизованный (NumPy) аналог converter.cpp: стереопара из моно-изображения
+# по яркости (как "глубине"). Работает с массивами в памяти (BGR, как у OpenCV),
+# без запуска ./stereo и без промежуточных JPEG на диске.
+
+import time
+
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+
+OUTPUT_MODES = {"both": 0, "pair": 1, "split": 2}
+
+
+def luma_depth(image: np.ndarray) -> np.ndarray:
+    """Серый как "глубина": (77 R + 150 G + 29 B) >> 8, вход — BGR uint8."""
+    b = image[..., 0].astype(np.uint16)
+    g = image[..., 1].astype(np.uint16)
+    r = image[..., 2].astype(np.uint16)
+    return ((77 * r + 150 * g + 29 * b) >> 8).astype(np.uint8)
+
+
+def shift_table(layers_count: int, zero_parallax_layer_num: int, max_shift: float) -> np.ndarray:
+    """
+    Таблица depth -> смещение в пикселях (256 значений).
+    Повторяет арифметику process_rows, включая усечение (int)(shift + 0.5).
+    """
+    table = np.zeros(256, dtype=np.int32)
+    for depth in range(256):
+        layer_num = (depth * layers_count) // 255 if layers_count > 1 else 0
+        shift = max_shift * (1.0 - layer_num / zero_parallax_layer_num)
+        table[depth] = int(shift + 0.5)
+    return table
+
+
+def _add_time(timings, stage, started):
+    """Накопить время стадии в мс (timings — dict или None)."""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def _trunc_div2(v: np.ndarray) -> np.ndarray:
+    # целочисленное деление с усечением к нулю, как в C
+    return (v - (v >> 63)) >> 1
+
+
+def _scatter(image, depth, target_x, out_width, out, out_offset=0):
+    """
+    Z-буферизованная раскладка: в каждую целевую точку пишется пиксель
+    с наибольшей глубиной (при равенстве — с меньшим x, как в построчном цикле C).
+    Возвращает маску заполненных пикселей (height x out_width).
+    """
+    height, width = depth.shape
+    rows = np.arange(height, dtype=np.int64)[:, None]
+    cols = np.arange(width, dtype=np.int32)
+
+    # depth == 0 никогда не проходит проверку depth > z-буфер (он обнулён)
+    valid = (target_x >= 0) & (target_x < out_width) & (depth > 0)
+    target = (rows * out_width + target_x)[valid]
+    # ключ: глубина в старших битах, затем "меньший x лучше" в младших 16
+    key = ((depth.astype(np.int32) << 16) | (0xFFFF - cols))[valid]
+
+    zbuf = np.full((height, out_width), -1, dtype=np.int32)
+    np.maximum.at(zbuf.reshape(-1), target, key)
+
+    filled = zbuf >= 0
+    src_index = rows * width + np.where(filled, 0xFFFF - (zbuf & 0xFFFF), 0)
+    pixels = np.take(image.reshape(-1, image.shape[2]), src_index, axis=0)
+    pixels[~filled] = 0
+    out[:, out_offset:out_offset + out_width] = pixels
+    return filled
+
+
+def fill_holes(image: np.ndarray, mask: np.ndarray):
+    """
+    Заполнение "дырок" построчно (in place): линейная интерполяция между
+    ближайшими заполненными соседями, у краёв — копия ближайшего цвета.
+    Полностью пустые строки остаются как есть.
+    """
+    height, width = mask.shape
+    cols = np.arange(width, dtype=np.int64)
+
+    prev_idx = np.where(mask, cols, -1)
+    np.maximum.accumulate(prev_idx, axis=1, out=prev_idx)
+    next_idx = np.where(mask, cols, width)
+    next_idx = np.minimum.accumulate(next_idx[:, ::-1], axis=1)[:, ::-1]
+
+    holes = ~mask & ((prev_idx >= 0) | (next_idx < width))
+    if not holes.any():
+        return
+
+    hole = np.flatnonzero(holes)
+    row_start = hole - hole % width
+    left = prev_idx.reshape(-1)[hole]
+    right = next_idx.reshape(-1)[hole]
+    left = np.where(left < 0, right, left)
+    right = np.where(right >= width, left, right)
+
+    flat = image.reshape(-1, image.shape[2])
+    left_pix = np.take(flat, row_start + left, axis=0).astype(np.float32)
+    right_pix = np.take(flat, row_start + right, axis=0).astype(np.float32)
+    span = np.maximum(right - left, 1).astype(np.float32)
+    t = np.where(right > left, (hole - row_start - left) / span, 0).astype(np.float32)[:, None]
+    flat[hole] = (left_pix * (1.0 - t) + right_pix * t + 0.5).astype(np.uint8)
+
+
+def create_stereo_pair(image, depth, shifts, timings=None):
+    """Два полноразмерных кадра left/right (режим split)."""
+    started = time.perf_counter()
+    height, width = depth.shape
+    xs = np.broadcast_to(np.arange(width, dtype=np.int64), depth.shape)
+    s = shifts[depth].astype(np.int64)
+
+    left = np.zeros_like(image)
+    right = np.zeros_like(image)
+    left_mask = _scatter(image, depth, xs + s, width, left)
+    right_mask = _scatter(image, depth, xs - s, width, right)
+    _add_time(timings, "process_ms", started)
+
+    started = time.perf_counter()
+    fill_holes(left, left_mask)
+    fill_holes(right, right_mask)
+    _add_time(timings, "fill_ms", started)
+    return left, right
+
+
+def _scatter_pair(image, depth, s, half_width, pair):
+    """
+    Раскладка режима pair. Как в converter.cpp, у левой и правой половин один
+    z-буфер на половину ширины: запись проходит, только если глубина больше всего,
+    что уже легло в эту ячейку из обеих половин. Порядок записей — как в цикле C:
+    строка за строкой, по x, для пикселя сначала левая половина. При нечётной ширине
+    последний столбец правой половины делит ячейку со следующей строкой, как в C.
+    Возвращает маску заполненных пикселей (height x width).
+    """
+    height, width = depth.shape
+    rows = np.arange(height, dtype=np.int64)[:, None]
+    xs = np.arange(width, dtype=np.int64)
+    left_x = _trunc_div2(xs + s)
+    right_x = _trunc_div2(xs - s) + half_width
+
+    # ключ события (битовые поля, старшие первыми): строка и столбец ячейки z-буфера,
+    # место в порядке цикла C — своя строка или предыдущая (нечётная ширина), x,
+    # левая/правая — и глубина в младших 8 битах. Место уникально, поэтому
+    # сортировка ключей даёт события каждой ячейки по порядку.
+    x_bits = int(width).bit_length()
+    cell_bits = int(half_width).bit_length()
+    cell_shift = x_bits + 2 + 8
+    own_row = 1 << (x_bits + 1 + 8)
+    order = (xs << 9) + own_row + depth
+    left_key = (((rows << cell_bits) + left_x) << cell_shift) + order
+    right_key = np.where(
+        right_x == 2 * half_width,
+        ((rows + 1) << (cell_bits + cell_shift)) + order - own_row,
+        (((rows << cell_bits) + right_x - half_width) << cell_shift) + order,
+    ) + (1 << 8)
+    keys = np.concatenate([
+        left_key[(left_x >= 0) & (left_x < half_width) & (depth > 0)],
+        right_key[(right_x >= half_width) & (right_x < width) & (depth > 0)],
+    ])
+    keys.sort()
+
+    # запись проходит, если глубина больше максимума предыдущих событий той же ячейки
+    # (z-буфер обнулён)
+    event_depth = keys & 0xFF
+    cell_base = (keys >> cell_shift) << 8
+    running = np.maximum.accumulate(cell_base + event_depth)
+    before = np.empty_like(running)
+    before[0] = -1
+    before[1:] = running[:-1]
+    written = keys[event_depth > np.maximum(before - cell_base, 0)]
+
+    cell = written >> cell_shift
+    column = cell & ((1 << cell_bits) - 1)
+    in_row = (written >> (x_bits + 1 + 8)) & 1
+    y = (cell >> cell_bits) - 1 + in_row
+    source = y * width + ((written >> 9) & ((1 << x_bits) - 1))
+    side = (written >> 8) & 1
+    # правая половина — со сдвигом на half_width, перенесённые из строки выше — в последний столбец
+    target = y * width + column + side * (half_width + (width - 1 - half_width) * (1 - in_row))
+
+    # в каждой точке остаётся последняя прошедшая запись: после разбиения по половинам
+    # записи одной точки идут подряд
+    by_half = np.argsort(side.astype(np.uint8), kind="stable")
+    target = target[by_half]
+    last = np.ones(target.size, dtype=bool)
+    last[:-1] = target[1:] != target[:-1]
+    filled = np.zeros(height * width, dtype=bool)
+    filled[target] = True
+    out = pair.reshape(-1, 3).view("V3").reshape(-1)
+    out[target[last]] = image.reshape(-1, 3).view("V3").reshape(-1)[source[by_half[last]]]
+    return filled.reshape(height, width)
+
+
+def create_stereo_pair_h(image, depth, shifts, timings=None):
+    """Одно изображение: левый кадр в левой половине, правый — в правой (режим pair)."""
+    started = time.perf_counter()
+    height, width = depth.shape
+    s = shifts[depth].astype(np.int64)
+
+    pair = np.zeros_like(image)
+    mask = _scatter_pair(image, depth, s, width // 2, pair)
+    _add_time(timings, "process_ms", started)
+
+    started = time.perf_counter()
+    fill_holes(pair, mask)
+    _add_time(timings, "fill_ms", started)
+    return pair
+
+
+def resize_target(cfg: dict):
+    """(mode, tw, th) из конфига или None, если ресайз выключен."""
+    mode = (cfg.get("resize_mode") or "none").lower()
+    tw = int(float(cfg.get("target_width") or 0))
+    th = int(float(cfg.get("target_height") or 0))
+    if mode not in ("fit", "exact") or tw <= 0 or th <= 0:
+        return None
+    return mode, tw, th
+
+
+def _target_size(target, w, h):
+    """Итоговый размер (w, h) или None, если исходник уже не больше (fit)."""
+    mode, tw, th = target
+    if mode == "fit":
+        scale = min(tw / w, th / h)
+        if scale >= 1.0:
+            return None
+        return max(1, round(w * scale)), max(1, round(h * scale))
+    return tw, th
+
+
+def resize_frame(frame: np.ndarray, cfg: dict) -> np.ndarray:
+    """Ресайз кадра в памяти: resize_mode none|fit|exact (fit только уменьшает)."""
+    target = resize_target(cfg)
+    if target is None:
+        return frame
+    h, w = frame.shape[:2]
+    size = _target_size(target, w, h)
+    if size is None:
+        return frame
+    interpolation = cv2.INTER_AREA if target[0] == "fit" else cv2.INTER_LANCZOS4
+    return cv2.resize(frame, size, interpolation=interpolation)
+
+
+def load_image(path, cfg: dict) -> np.ndarray:
+    """
+    Читает файл сразу в нужном размере, BGR uint8.
+    Без ресайза — обычное чтение OpenCV. С ресайзом JPEG декодируется в
+    уменьшенном масштабе (PIL draft: 1/2, 1/4, 1/8 прямо в DCT), остаток
+    добирается ресайзом — без полного декодирования и без временного файла.
+    """
+    target = resize_target(cfg)
+    if target is None:
+        frame = cv2.imread(str(path), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if frame is None:
+            raise ValueError(f"не удалось прочитать {path}")
+        return frame
+
+    with Image.open(path) as im:
+        size = _target_size(target, *im.size)
+        if size is not None:
+            # масштаб выбирается так, чтобы картинка осталась не меньше size
+            im.draft("RGB", size)
+        im = im.convert("RGB")
+        if size is not None and im.size != size:
+            resample = Image.BICUBIC if target[0] == "fit" else Image.LANCZOS
+            im = im.resize(size, resample)
+        return cv2.cvtColor(np.asarray(im), cv2.COLOR_RGB2BGR)
+
+
+def convert(image: np.ndarray, parallax_perc=0.5, layers_count=10,
+            zero_parallax_layer_num=5, output_mode=0, timings=None, depth=None) -> dict:
+    """
+    Аналог ./stereo для массива в памяти: та же раскладка, в режиме pair — общий
+    z-буфер половин, как в converter.cpp. С ./stereo, собранным без -ffast-math,
+    результат совпадает побитово; с -ffast-math заливка дырок может расходиться
+    на единицу в канале (другое округление интерполяции).
+    output_mode: 0=both, 1=pair только, 2=split только.
+    Возвращает {"left", "right", "pair"} (только запрошенные ключи), BGR uint8.
+    timings — необязательный dict, куда накапливаются process_ms / fill_ms.
+    depth — готовая карта глубины HxW uint8 (например, сглаженная во времени);
+    по умолчанию — яркость изображения.
+    """
+    if image is None or image.ndim != 3 or image.shape[2] < 3:
+        raise ValueError("ожидается изображение HxWx3")
+    image = np.ascontiguousarray(image[..., :3], dtype=np.uint8)
+
+    layers_count = max(1, int(layers_count))
+    zero_parallax_layer_num = max(1, int(zero_parallax_layer_num))
+    output_mode = int(output_mode)
+
+    started = time.perf_counter()
+    width = image.shape[1]
+    max_shift = width * float(parallax_perc) / 100.0
+    if depth is None:
+        depth = luma_depth(image)
+    shifts = shift_table(layers_count, zero_parallax_layer_num, max_shift)
+    _add_time(timings, "process_ms", started)
+
+    result = {}
+    if output_mode in (0, 2):
+        result["left"], result["right"] = create_stereo_pair(image, depth, shifts, timings)
+    if output_mode in (0, 1):
+        result["pair"] = create_stereo_pair_h(image, depth, shifts, timings)
+    return result
@@ -0,0 +1,159 @@
+# stereo_stream.py
+# Живой стерео-поток с камеры: один фоновый поток берёт самый свежий кадр,
+# конвертирует его в памяти в side-by-side (pair), кодирует в JPEG один раз
+# и раздаёт всем зрителям /stereo-feed. Если конвертация не успевает —
+# кадры пропускаются, а ширина обработки адаптивно уменьшается.
+
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+
+class StereoStream:
+    def __init__(self, camera, settings, min_width=320, idle_timeout=5.0):
+        """
+        settings() -> dict: fps, max_width, jpeg_quality, encode_params (необязательно, для cv2.imencode),
+        convert (frame BGR -> pair BGR).
+        Вызывается примерно раз в секунду, чтобы не читать конфиг на каждый кадр.
+        """
+        self.camera = camera
+        self.settings = settings
+        self.min_width = min_width
+        self.idle_timeout = idle_timeout
+
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.thread = None
+        self.viewers = 0
+        self.idle_since = None
+
+        self.seq = 0
+        self.jpeg = None
+        self.width = None          # текущая ширина обработки
+        self.last_error = None
+        self.convert_ms = None
+        self.fps = 0.0
+        self.skipped = 0
+
+    @contextmanager
+    def viewer(self):
+        """Зритель держит поток живым; без зрителей поток останавливается сам."""
+        with self.lock:
+            self.viewers += 1
+            self.idle_since = None
+            if not (self.thread and self.thread.is_alive()):
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.viewers -= 1
+                if self.viewers == 0:
+                    self.idle_since = time.monotonic()
+
+    def wait_jpeg(self, last_seq=0, timeout=1.0):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > last_seq, timeout):
+                return last_seq, None
+            return self.seq, self.jpeg
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "running": bool(self.thread and self.thread.is_alive()),
+                "viewers": self.viewers,
+                "width": self.width,
+                "fps": round(self.fps, 2),
+                "convert_ms": self.convert_ms,
+                "skipped": self.skipped,
+                "last_error": self.last_error,
+            }
+
+    def _adapt(self, elapsed, budget, native_width, max_width):
+        limit = min(native_width, max_width) if max_width > 0 else native_width
+        width = min(self.width or limit, limit)
+        # чётная ширина: pair склеивает две половины, а JPEG с 4:2:0 не любит нечётные размеры
+        if elapsed > budget * 1.1:
+            width = max(self.min_width, int(width * 0.85) // 2 * 2)
+        elif elapsed < budget * 0.6 and width < limit:
+            width = min(limit, (int(width * 1.1) + 2) // 2 * 2)
+        self.width = width
+
+    def _run(self):
+        cfg, cfg_time = None, 0.0
+        cam_seq = 0
+        next_deadline = time.monotonic()
+        frames, fps_window = 0, time.monotonic()
+
+        while True:
+            with self.lock:
+                if self.viewers == 0 and self.idle_since and time.monotonic() - self.idle_since > self.idle_timeout:
+                    self.thread = None
+                    return
+
+            now = time.monotonic()
+            if cfg is None or now - cfg_time > 1.0:
+                try:
+                    cfg = self.settings()
+                except Exception as e:
+                    # конфиг не прочитался (например, его как раз переписывают) — остаёмся на прежнем,
+                    # иначе поток умрёт, а зрители так и будут ждать кадров
+                    self.last_error = f"settings: {e}"
+                    if cfg is None:
+                        time.sleep(0.2)
+                        continue
+                cfg_time = now
+            budget = 1.0 / max(0.1, float(cfg["fps"]))
+
+            # держим целевой FPS: не быстрее дедлайна
+            if now < next_deadline:
+                time.sleep(next_deadline - now)
+            next_deadline = max(next_deadline + budget, time.monotonic())
+
+            new_seq, frame = self.camera.wait_frame(cam_seq, timeout=1.0)
+            if frame is None:
+                continue
+            # всё, что пришло между обработками, пропущено
+            self.skipped += max(0, new_seq - cam_seq - 1) if cam_seq else 0
+            cam_seq = new_seq
+
+            started = time.monotonic()
+            try:
+                h, w = frame.shape[:2]
+                if self.width is None:
+                    self._adapt(0, budget, w, int(cfg["max_width"]))
+                if self.width < w:
+                    size = (self.width, max(1, round(h * self.width / w)))
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                pair = cfg["convert"](frame)
+                params = cfg.get("encode_params") or [int(cv2.IMWRITE_JPEG_QUALITY), int(cfg["jpeg_quality"])]
+                ok, buf = cv2.imencode('.jpg', pair, params)
+                if not ok:
+                    raise RuntimeError("imencode failed")
+                data = buf.tobytes()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                time.sleep(0.2)
+                continue
+
+            elapsed = time.monotonic() - started
+            self._adapt(elapsed, budget, w, int(cfg["max_width"]))
+
+            with self.cond:
+                self.seq += 1
+                self.jpeg = data
+                self.convert_ms = round(elapsed * 1000, 1)
+                self.cond.notify_all()
+
+            frames += 1
+            window = time.monotonic() - fps_window
+            if window >= 2.0:
+                self.fps = frames / window
+                frames, fps_window = 0, time.monotonic()
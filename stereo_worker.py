@@ -0,0 +1,150 @@
+# stereo_worker.py
+# Долгоживущий процесс ./stereo --serve: команды по pipe (stdin/stdout),
+# пиксели — через общий mmap-файл (в /dev/shm, если есть). Кадр с камеры
+# попадает в конвертер без записи JPEG на диск и без запуска процесса на каждый снимок.
+
+import mmap
+import os
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+
+SHM_DIR = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+
+# порядок буферов в общем файле: [вход][left][right][pair], каждый width*height*3 (RGB)
+SLOTS = {"left": 1, "right": 2, "pair": 3}
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+class StereoWorker:
+    def __init__(self, executable):
+        self.executable = executable
+        self.lock = threading.Lock()
+        self.proc = None
+        self.shm_path = SHM_DIR / f"vrconverter_{os.getpid()}_{id(self):x}.buf"
+        self.shm_file = None
+        self.shm = None
+        self.shm_size = 0
+        self.restarts = 0
+        self.spawned = False   # процесс уже запускался: следующий запуск — перезапуск
+        # память последней задачи в ./stereo: buffer_bytes (вход, выходы, z-буферы), arena_bytes
+        self.last_memory = {}
+
+    def _start(self):
+        if self.spawned:
+            self.restarts += 1
+        self.spawned = True
+        self.proc = subprocess.Popen(
+            [self.executable, "--serve"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, bufsize=1
+        )
+
+    def _kill(self):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        try:
+            proc.kill()
+            proc.wait(timeout=2)
+        except Exception:
+            pass
+
+    def _ensure_buffer(self, size: int):
+        if self.shm is not None and self.shm_size >= size:
+            return
+        if self.shm is not None:
+            self.shm.close()
+            self.shm_file.close()
+        # растим с запасом, чтобы не пересоздавать на каждом чуть большем кадре
+        size = max(size, self.shm_size * 2)
+        self.shm_file = open(self.shm_path, "w+b")
+        self.shm_file.truncate(size)
+        self.shm = mmap.mmap(self.shm_file.fileno(), size)
+        self.shm_size = size
+
+    def _request(self, line: str) -> str:
+        if self.proc is None or self.proc.poll() is not None:
+            if self.proc is not None:
+                print(f"[worker] converter exited with {self.proc.returncode}, restarting")
+            self._start()
+        self.proc.stdin.write(line + "\n")
+        self.proc.stdin.flush()
+        reply = self.proc.stdout.readline()
+        if not reply:
+            raise WorkerError("конвертер завершился во время обработки")
+        return reply.strip()
+
+    def convert(self, frame: np.ndarray, parallax_perc=0.5, layers_count=10,
+                zero_parallax_layer_num=5, output_mode=0) -> dict:
+        """
+        Конвертирует BGR-кадр. Возвращает {"left", "right", "pair"}
+        (только запрошенные ключи), BGR uint8 — как stereo_engine.convert.
+        """
+        height, width = frame.shape[:2]
+        frame_bytes = width * height * 3
+        names = {0: ("left", "right", "pair"), 1: ("pair",), 2: ("left", "right")}.get(int(output_mode), ())
+
+        with self.lock:
+            self._ensure_buffer(frame_bytes * 4)
+            buf = np.frombuffer(self.shm, dtype=np.uint8, count=frame_bytes * 4)
+            try:
+                cv2.cvtColor(frame[..., :3], cv2.COLOR_BGR2RGB, dst=buf[:frame_bytes].reshape(height, width, 3))
+
+                line = (f"convert {self.shm_path} {width} {height} {float(parallax_perc)} "
+                        f"{int(layers_count)} {int(zero_parallax_layer_num)} {int(output_mode)}")
+                try:
+                    reply = self._request(line)
+                except (BrokenPipeError, WorkerError):
+                    # упавший процесс перезапускаем и повторяем запрос один раз
+                    self._kill()
+                    reply = self._request(line)
+
+                status, *fields = reply.split()
+                if status != "ok":
+                    raise WorkerError(reply)
+                # "ok buffer_bytes=... arena_bytes=..." (прежний ответ — просто "ok")
+                self.last_memory = {k: int(v) for k, v in (f.split("=", 1) for f in fields)}
+
+                result = {}
+                for name in names:
+                    offset = frame_bytes * SLOTS[name]
+                    rgb = buf[offset:offset + frame_bytes].reshape(height, width, 3)
+                    result[name] = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+                return result
+            finally:
+                # mmap нельзя закрыть/пересоздать, пока на него смотрит ndarray
+                del buf
+
+    def stop(self):
+        with self.lock:
+            if self.proc is not None and self.proc.poll() is None:
+                try:
+                    self.proc.stdin.write("quit\n")
+                    self.proc.stdin.flush()
+                    self.proc.wait(timeout=2)
+                except Exception:
+                    pass
+            self._kill()
+            self.spawned = False
+            if self.shm is not None:
+                self.shm.close()
+                self.shm_file.close()
+                self.shm = None
+                self.shm_size = 0
+            try:
+                self.shm_path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,55 @@
+# Тесты запускаются из корня репозитория: python -m pytest -q
+# Модули проекта лежат в корне, без пакета — добавляем его в путь импорта.
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def build_converter(out_dir, flags):
+    """Собрать converter.cpp в out_dir/stereo (пропуск теста, если нет g++)."""
+    if shutil.which("g++") is None:
+        pytest.skip("нет g++ для сборки ./stereo")
+    executable = Path(out_dir) / "stereo"
+    subprocess.run(["g++", str(ROOT / "converter.cpp"), "-o", str(executable), *flags, "-pthread"],
+                   check=True, cwd=ROOT)
+    return executable
+
+
+@pytest.fixture(scope="session")
+def stereo_exact(tmp_path_factory):
+    """./stereo без -ffast-math: результат должен совпадать с NumPy побитово."""
+    return build_converter(tmp_path_factory.mktemp("stereo_exact"), ["-O2"])
+
+
+@pytest.fixture(scope="session")
+def stereo_release(tmp_path_factory):
+    """./stereo с флагами из README."""
+    return build_converter(tmp_path_factory.mktemp("stereo_release"), ["-O3", "-march=native", "-ffast-math"])
+
+
+@pytest.fixture(scope="session")
+def webapp(tmp_path_factory):
+    """
+    app.py в отдельной рабочей папке (он пишет images/, converted_images/, config/
+    по относительным путям) с синтетической камерой вместо настоящей.
+    """
+    workdir = tmp_path_factory.mktemp("app")
+    previous = os.getcwd()
+    os.environ.setdefault("CAMERA_SOURCE", "synthetic")
+    os.environ.setdefault("CAMERA_WIDTH", "160")
+    os.environ.setdefault("CAMERA_HEIGHT", "120")
+    os.chdir(workdir)
+    try:
+        import app
+        yield app
+        app.camera.stop()
+    finally:
+        os.chdir(previous)
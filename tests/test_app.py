@@ -0,0 +1,44 @@
+import os
+
+import cv2
+
+from test_stereo_engine import sample_image
+
+
+def test_capture_right_after_camera_start(webapp):
+    webapp.camera.stop()
+    client = webapp.app.test_client()
+    response = client.post("/capture")
+    assert response.status_code == 200, response.get_json()
+    filename = response.get_json()["filename"]
+    assert (webapp.IMAGES_FOLDER / filename).is_file()
+
+
+def test_capture_queue_full(webapp, monkeypatch):
+    def full(*args, **kwargs):
+        raise webapp.QueueFull("очередь конвертации переполнена")
+
+    monkeypatch.setattr(webapp, "submit_conversion", full)
+    response = webapp.app.test_client().post("/capture?convert=true")
+    assert response.status_code == 429
+    assert response.get_json()["ok"] is False
+
+
+def test_cache_hit_is_published_by_hardlink(webapp, monkeypatch):
+    cfg = dict(webapp.DEFAULT_CONFIG, engine="numpy", output_format="webp", output_mode="pair")
+    monkeypatch.setattr(webapp, "read_config", lambda: dict(cfg))
+    source = webapp.IMAGES_FOLDER / "cache_hit.png"
+    cv2.imwrite(str(source), sample_image(40, 60))
+
+    ok, _ = webapp.run_conversion(source)
+    assert ok
+    ok, message = webapp.run_conversion(source)
+    assert ok and "кэш" in message
+
+    latest = webapp.get_latest_converted_image()
+    assert latest.name == "latest.webp"
+    assert not (webapp.CONVERTED_IMAGES_FOLDER / "latest.jpg").exists()
+    key = webapp.conversion_cache.make_key(source, webapp.cache_params(cfg))
+    assert os.path.samefile(latest, webapp.conversion_cache.path(key, ".webp"))
+    _, _, data = webapp.latest_frame.get()
+    assert data == latest.read_bytes()
@@ -0,0 +1,81 @@
+import itertools
+import threading
+import time
+
+from auto_snap import AutoSnap
+
+INTERVAL = 0.05
+
+
+def run(snap, seconds):
+    snap.start()
+    time.sleep(seconds)
+    snap.stop()
+    for t in snap.threads:
+        t.join(2)
+
+
+def counter_capture(delay=0.0):
+    numbers = itertools.count(1)
+
+    def capture():
+        time.sleep(delay)
+        return next(numbers), None
+    return capture
+
+
+def test_ticks_follow_deadline_without_drift():
+    processed = []
+    snap = AutoSnap(lambda: {"enabled": True, "interval": INTERVAL},
+                    # захват занимает почти половину интервала — расписание не должно уплыть
+                    counter_capture(delay=INTERVAL * 0.4),
+                    lambda frame, at: processed.append(frame) or {"conversion": "submitted"})
+    run(snap, 20 * INTERVAL + INTERVAL / 2)
+    stats = snap.stats()
+    assert 17 <= stats["cycles"] <= 22
+    assert stats["missed_ticks"] <= 2
+    assert stats["conversions"]["submitted"] == stats["processed"] == len(processed)
+    assert processed == sorted(processed)
+
+
+def test_slow_capture_skips_ticks_instead_of_bursting():
+    snap = AutoSnap(lambda: {"enabled": True, "interval": INTERVAL},
+                    counter_capture(delay=INTERVAL * 2.5),
+                    lambda frame, at: {})
+    run(snap, 20 * INTERVAL)
+    stats = snap.stats()
+    assert stats["missed_ticks"] >= 8
+    assert stats["cycles"] <= 10
+    # после пропуска тик догоняет текущий, опоздание меньше интервала
+    assert stats["lateness_ms"]["max"] < INTERVAL * 1000
+
+
+def test_slow_processing_drops_old_frames():
+    seen = []
+    release = threading.Event()
+
+    def process(frame, at):
+        seen.append(frame)
+        release.wait(INTERVAL * 6)
+        return {"conversion": "skipped"}
+
+    snap = AutoSnap(lambda: {"enabled": True, "interval": INTERVAL}, counter_capture(), process)
+    run(snap, 20 * INTERVAL)
+    release.set()
+    stats = snap.stats()
+    assert stats["dropped_frames"] > 0
+    # обработчик берёт самый свежий кадр — номера идут с пропусками
+    assert any(b - a > 1 for a, b in zip(seen, seen[1:]))
+    assert stats["processed"] == len(seen) < stats["cycles"]
+
+
+def test_disabled_and_errors():
+    enabled = {"enabled": False, "interval": INTERVAL}
+    snap = AutoSnap(lambda: enabled, lambda: (None, "камера не запущена"), lambda frame, at: {})
+    run(snap, 0.1)
+    assert snap.stats()["cycles"] == 0
+    enabled["enabled"] = True
+    snap = AutoSnap(lambda: enabled, lambda: (None, "камера не запущена"), lambda frame, at: {})
+    run(snap, 3 * INTERVAL)
+    assert snap.stats()["cycles"] >= 1 and snap.stats()["processed"] == 0
+    assert snap.last_error == "камера не запущена"
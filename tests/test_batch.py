@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import pytest
+
+import batch
+from test_stereo_engine import sample_image
+
+
+PARAMS = {
+    "parallax_perc": 0.5, "layers_count": 6, "zero_parallax_layer_num": 3,
+    "output_mode": "pair", "resize_mode": "none", "target_width": None, "target_height": None,
+    "jpeg_quality": 90, "output_format": "jpeg", "chroma_subsampling": None, "encoder": None,
+    "engine": "numpy", "executable": "./stereo",
+}
+
+
+class ThreadPool(ThreadPoolExecutor):
+    """Пул потоков вместо процессов: spawn в тестах медленный, логика run_batch та же."""
+
+    def __init__(self, max_workers=None, mp_context=None):
+        super().__init__(max_workers=max_workers)
+
+
+class BrokenPool(ThreadPool):
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("пул упал")
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", ThreadPool)
+    monkeypatch.setattr(batch, "_pool", None)
+    yield
+    if batch._pool is not None:
+        batch._pool.shutdown()
+
+
+def write_sources(tmp_path, names):
+    paths = []
+    for seed, name in enumerate(names):
+        path = tmp_path / name
+        cv2.imwrite(str(path), sample_image(24, 32, seed=seed))
+        paths.append(path)
+    return paths
+
+
+def test_same_stem_gets_separate_outputs(tmp_path, pool):
+    paths = write_sources(tmp_path, ["foo.jpg", "foo.png"])
+    events = list(batch.run_batch(paths, tmp_path / "out", PARAMS, workers=1))
+
+    files = [e for e in events if e["event"] == "file"]
+    assert all(e["ok"] for e in files), files
+    outputs = {e["filename"]: e["outputs"] for e in files}
+    assert outputs["foo.jpg"] != outputs["foo.png"]
+    for name in outputs["foo.jpg"] + outputs["foo.png"]:
+        assert (tmp_path / "out" / name).is_file()
+    assert events[0]["workers"] == 1
+
+
+def test_broken_pool_is_rebuilt_on_submit(tmp_path, pool):
+    broken = BrokenPool(max_workers=1)
+    batch._pool = broken
+    paths = write_sources(tmp_path, ["a.png"])
+
+    events = list(batch.run_batch(paths, tmp_path / "out", PARAMS, workers=1))
+
+    assert events[-1]["ok_count"] == 1
+    assert batch._pool is not broken
+
+
+def test_broken_pool_on_result_is_discarded(tmp_path, pool, monkeypatch):
+    def crash(*args):
+        raise BrokenProcessPool("процесс убит")
+
+    monkeypatch.setattr(batch, "convert_file", crash)
+    paths = write_sources(tmp_path, ["a.png"])
+
+    events = list(batch.run_batch(paths, tmp_path / "out", PARAMS, workers=1))
+
+    assert events[1]["ok"] is False and "упал" in events[1]["message"]
+    assert batch._pool is None
+
+
+def test_batch_outputs_are_pruned(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "KEEP_BATCH_OUTPUTS", 2)
+    for i in range(4):
+        (webapp.BATCH_FOLDER / f"20000101_00000{i}_old").mkdir(parents=True, exist_ok=True)
+
+    def run_batch(paths, out_dir, params, workers=1):
+        (out_dir / "29990101_000000_new").mkdir()
+        yield {"event": "end"}
+
+    monkeypatch.setattr(webapp.batch, "run_batch", run_batch)
+    cv2.imwrite(str(webapp.IMAGES_FOLDER / "prune_src.png"), sample_image(8, 8))
+    webapp.image_catalog.add("prune_src.png")
+
+    response = webapp.app.test_client().post("/batch-convert", json={"filenames": ["prune_src.png"]})
+    assert response.status_code == 200
+    response.get_data()
+    response.close()
+
+    left = sorted(p.name for p in webapp.BATCH_FOLDER.iterdir())
+    assert left == ["20000101_000003_old", "29990101_000000_new"]
@@ -0,0 +1,68 @@
+import os
+
+from catalog import ImageCatalog, origin_of
+
+EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def touch(folder, name, data=b"x"):
+    (folder / name).write_bytes(data)
+
+
+def test_origin():
+    assert origin_of("auto_20240101_000000.jpg") == "auto"
+    assert origin_of("camera_20240101_000000.jpg") == "camera"
+    assert origin_of("photo.png") == "upload"
+
+
+def test_add_remove_and_query(tmp_path):
+    catalog = ImageCatalog(tmp_path, EXTENSIONS)
+    for name in ("b.jpg", "camera_1.jpg", "a.png", "notes.txt"):
+        touch(tmp_path, name)
+        catalog.add(name)
+    assert catalog.list_names() == ["a.png", "b.jpg", "camera_1.jpg"]
+    total, page = catalog.query(offset=1, limit=1)
+    assert total == 3 and [e["name"] for e in page] == ["b.jpg"]
+    total, page = catalog.query(origin="camera")
+    assert total == 1 and page[0]["origin"] == "camera"
+    assert catalog.query(q="B.J")[0] == 1
+    assert catalog.version_of("a.png") == (tmp_path / "a.png").stat().st_mtime_ns
+    catalog.remove("b.jpg")
+    assert "b.jpg" not in catalog.list_names()
+    catalog.add("missing.jpg")
+    assert "missing.jpg" not in catalog.list_names()
+
+
+def test_reconcile_picks_up_manual_changes(tmp_path):
+    touch(tmp_path, "old.jpg")
+    catalog = ImageCatalog(tmp_path, EXTENSIONS)
+    assert catalog.list_names() == ["old.jpg"]
+    touch(tmp_path, "manual.jpg", b"longer")
+    os.unlink(tmp_path / "old.jpg")
+    catalog.reconcile()
+    assert catalog.list_names() == ["manual.jpg"]
+    assert catalog.query()[1][0]["size"] == 6
+
+
+def test_prune_auto_keeps_newest(tmp_path):
+    catalog = ImageCatalog(tmp_path, EXTENSIONS)
+    # не по порядку: обрезка всё равно идёт от самых старых имён
+    for stamp in ("03", "01", "04", "02"):
+        name = f"auto_20240101_0000{stamp}.jpg"
+        touch(tmp_path, name)
+        catalog.add(name)
+    touch(tmp_path, "upload.jpg")
+    catalog.add("upload.jpg")
+    catalog.prune_auto(2)
+    assert catalog.list_names() == ["auto_20240101_000003.jpg", "auto_20240101_000004.jpg", "upload.jpg"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == catalog.list_names()
+    catalog.prune_auto(0)
+    assert catalog.list_names() == ["upload.jpg"]
+
+
+def test_reconcile_keeps_auto_order(tmp_path):
+    for stamp in ("02", "01"):
+        touch(tmp_path, f"auto_20240101_0000{stamp}.jpg")
+    catalog = ImageCatalog(tmp_path, EXTENSIONS)
+    catalog.prune_auto(1)
+    assert catalog.list_names() == ["auto_20240101_000002.jpg"]
@@ -0,0 +1,128 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import encoding
+import stereo_engine
+from incremental import IncrementalConverter
+from stereo_worker import StereoWorker
+from test_stereo_engine import sample_image
+
+
+def frame_sequence(height=70, width=48, count=6):
+    """Кадры с изменениями разного масштаба: блок, один пиксель на единицу, последняя (неполная) полоса."""
+    frame = sample_image(height, width, seed=5)
+    frames = [frame]
+    edits = [
+        lambda f: f.__setitem__((slice(20, 30), slice(5, 20)), 255),
+        lambda f: f.__setitem__((40, 7, 1), (int(f[40, 7, 1]) + 1) % 256),
+        lambda f: None,
+        lambda f: f.__setitem__((slice(66, 70),), 30),
+        lambda f: f.__setitem__((slice(0, 70), slice(0, 3)), 128),
+    ]
+    for edit in edits[:count - 1]:
+        frame = frame.copy()
+        edit(frame)
+        frames.append(frame)
+    return frames
+
+
+@pytest.mark.parametrize("mode", [0, 1, 2])
+def test_threshold_zero_matches_full_conversion(mode):
+    inc = IncrementalConverter(band_rows=16, threshold=0, smoothing=0)
+    for frame in frame_sequence():
+        expected = stereo_engine.convert(frame, 3, 20, 3, mode)
+        result = inc.convert(frame, stereo_engine.convert, 3, 20, 3, mode)
+        for key in expected:
+            assert np.array_equal(result[key], expected[key]), key
+    stats = inc.stats()
+    assert stats["full_frames"] == 1
+    assert stats["converted_ratio"] < 1
+
+
+def test_threshold_zero_with_worker(stereo_exact):
+    worker = StereoWorker(str(stereo_exact))
+    try:
+        inc = IncrementalConverter(band_rows=16, threshold=0)
+        for frame in frame_sequence():
+            expected = worker.convert(frame, 0.5, 10, 5, 0)
+            result = inc.convert(frame, worker.convert, 0.5, 10, 5, 0)
+            for key in expected:
+                assert np.array_equal(result[key], expected[key]), key
+    finally:
+        worker.stop()
+
+
+def test_unchanged_frame_reuses_result():
+    inc = IncrementalConverter(threshold=6)
+    frame = sample_image(64, 32)
+    calls = []
+
+    def convert(strip, *args, **kwargs):
+        calls.append(strip.shape[0])
+        return stereo_engine.convert(strip, *args, **kwargs)
+
+    first = inc.convert(frame, convert, output_mode=1)
+    second = inc.convert(frame.copy(), convert, output_mode=1)
+    assert calls == [64]
+    assert inc.last_changed == 0
+    assert np.array_equal(first["pair"], second["pair"])
+    second["pair"][:] = 0   # вызывающий получает копию
+    assert inc.convert(frame, convert, output_mode=1)["pair"].any()
+
+
+def test_incremental_camera_result_is_not_cached(webapp, monkeypatch):
+    cfg = dict(webapp.DEFAULT_CONFIG, engine="numpy", output_mode="pair", incremental="true")
+    monkeypatch.setattr(webapp, "read_config", lambda: dict(cfg))
+    frame = sample_image(40, 64, seed=9)
+    source = webapp.IMAGES_FOLDER / "incremental.png"
+    cv2.imwrite(str(source), frame)
+
+    stores = webapp.conversion_cache.stats()["stores"]
+    ok, _ = webapp.run_conversion(source, frame=frame, incremental=True)
+    assert ok
+    assert webapp.conversion_cache.stats()["stores"] == stores
+    ok, message = webapp.run_conversion(source)
+    assert ok and "кэш" not in message
+    assert webapp.conversion_cache.stats()["stores"] == stores + 1
+
+
+def test_frame_after_gap_is_converted_exactly():
+    # новый кадр почти как старый: блоки сдвинулись меньше порога, глубина сглаживается
+    first = sample_image(64, 48, seed=11)
+    second = np.clip(first.astype(np.int16) + 4, 0, 255).astype(np.uint8)
+    expected = stereo_engine.convert(second, 3, 20, 3, 1)["pair"]
+
+    inc = IncrementalConverter(threshold=6, smoothing=0.3)
+    inc.convert(first, stereo_engine.convert, 3, 20, 3, 1)
+    reused = inc.convert(second, stereo_engine.convert, 3, 20, 3, 1)["pair"]
+    assert not np.array_equal(reused, expected)   # без разрыва — прошлые полосы
+
+    inc = IncrementalConverter(threshold=6, smoothing=0.3, max_gap=0.05)
+    inc.convert(first, stereo_engine.convert, 3, 20, 3, 1)
+    time.sleep(0.1)
+    result = inc.convert(second, stereo_engine.convert, 3, 20, 3, 1)["pair"]
+    assert np.array_equal(result, expected)
+    assert inc.stats()["full_frames"] == 2
+
+
+def test_one_shot_capture_is_not_incremental(webapp, monkeypatch):
+    cfg = dict(webapp.DEFAULT_CONFIG, engine="numpy", output_mode="pair", incremental="true",
+               depth_smoothing="0.3")
+    monkeypatch.setattr(webapp, "read_config", lambda: dict(cfg))
+    first = sample_image(40, 64, seed=12)
+    second = np.clip(first.astype(np.int16) + 4, 0, 255).astype(np.uint8)
+    source = webapp.IMAGES_FOLDER / "one_shot.png"
+    cv2.imwrite(str(source), second)
+
+    ok, _ = webapp.run_conversion(webapp.IMAGES_FOLDER / "one_shot.png", frame=first, incremental=True)
+    assert ok
+    frames = webapp.camera_incremental.frames
+    ok, _ = webapp.run_conversion(source, frame=second)
+    assert ok
+    assert webapp.camera_incremental.frames == frames
+    _, _, data = webapp.latest_frame.get()
+    enc = dict(encoding.encode_settings(cfg), encoder="opencv")
+    assert data == encoding.encode(stereo_engine.convert(second, output_mode=1)["pair"], enc)
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from jobs import JobQueue, QueueFull
+
+
+def blocking_queue(max_pending):
+    """Очередь с одним воркером, занятым задачей до release.set()."""
+    jobs = JobQueue(workers=1, max_pending=max_pending)
+    release = threading.Event()
+    started = threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+        return True, "held"
+
+    first, _ = jobs.submit(None, hold)
+    assert started.wait(5)
+    return jobs, first, release
+
+
+def test_same_key_is_coalesced():
+    jobs, _, release = blocking_queue(max_pending=4)
+    calls = []
+    job, created = jobs.submit("a", lambda: calls.append(1) or (True, "ok"))
+    again, created_again = jobs.submit("a", lambda: calls.append(2) or (True, "ok"))
+    assert created and not created_again
+    assert again is job
+    release.set()
+    assert job.wait(5)
+    assert calls == [1]
+    assert job.to_dict()["status"] == "done"
+
+
+def test_key_is_released_after_finish():
+    jobs = JobQueue(workers=1, max_pending=4)
+    job, _ = jobs.submit("a", lambda: (True, "ok"))
+    assert job.wait(5)
+    second, created = jobs.submit("a", lambda: (True, "ok"))
+    assert created and second is not job
+    assert second.wait(5)
+
+
+def test_full_queue_raises():
+    jobs, _, release = blocking_queue(max_pending=2)
+    jobs.submit("a", lambda: (True, "ok"))
+    jobs.submit("b", lambda: (True, "ok"))
+    with pytest.raises(QueueFull):
+        jobs.submit("c", lambda: (True, "ok"))
+    # склейка с уже стоящей задачей проходит и при полной очереди
+    _, created = jobs.submit("a", lambda: (True, "ok"))
+    assert not created
+    assert jobs.stats()["pending"] == 2
+    release.set()
+
+
+def test_error_is_reported():
+    jobs = JobQueue(workers=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    job, _ = jobs.submit(None, fail)
+    assert job.wait(5)
+    assert job.status == "error" and not job.ok
+    assert "boom" in job.message
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from latest_frame import LatestFrame
+
+
+def test_version_and_etag():
+    frame = LatestFrame()
+    assert frame.get() == (0, None, None)
+    frame.set(b"one")
+    version, etag, data = frame.get()
+    assert (version, data) == (1, b"one")
+    frame.set(b"one")
+    # те же байты — новая версия, но тот же ETag (клиент получит 304)
+    assert frame.get()[:2] == (2, etag)
+    frame.set(b"two")
+    assert frame.get()[1] != etag
+
+
+def test_wait_newer_wakes_on_set():
+    frame = LatestFrame()
+    frame.set(b"a")
+    threading.Timer(0.05, frame.set, args=(b"b",)).start()
+    started = time.monotonic()
+    assert frame.wait_newer(1, timeout=5) == 2
+    assert time.monotonic() - started < 2
+
+
+def test_wait_newer_timeout():
+    frame = LatestFrame()
+    frame.set(b"a")
+    assert frame.wait_newer(1, timeout=0.05) == 1
+    assert frame.wait_newer(0, timeout=5) == 1   # уже есть новее — сразу
+
+
+def test_get_image_304(webapp):
+    webapp.latest_frame.set(b"\xff\xd8frame\xff\xd9")
+    client = webapp.app.test_client()
+    first = client.get("/get-image")
+    assert first.status_code == 200
+    assert first.headers["Content-Type"] == "image/jpeg"
+    etag = first.headers["ETag"]
+    again = client.get("/get-image", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    webapp.latest_frame.set(b"RIFF\x00\x00\x00\x00WEBPdata")
+    changed = client.get("/get-image", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["Content-Type"] == "image/webp"
@@ -0,0 +1,67 @@
+from metrics import Registry, timed
+
+
+def test_counter_render_and_escaping():
+    registry = Registry()
+    counter = registry.counter("stereo_conversions_total", "Конвертации", labels=("engine", "result"))
+    counter.inc(engine="numpy", result="ok")
+    counter.inc(2, engine="numpy", result="ok")
+    counter.inc(engine='we"ird\n', result="error")
+    text = registry.render()
+    assert "# TYPE stereo_conversions_total counter" in text
+    assert 'stereo_conversions_total{engine="numpy",result="ok"} 3' in text
+    assert 'engine="we\\"ird\\n"' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    hist = registry.histogram("stage_seconds", "Стадии", labels=("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        hist.observe(value, stage="total")
+    lines = registry.render().splitlines()
+    assert 'stage_seconds_bucket{stage="total",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="total",le="1.0"} 2' in lines
+    assert 'stage_seconds_bucket{stage="total",le="+Inf"} 3' in lines
+    assert 'stage_seconds_count{stage="total"} 3' in lines
+    assert 'stage_seconds_sum{stage="total"} 5.55' in lines
+
+
+def test_collectors_skip_none_and_failures():
+    registry = Registry()
+
+    @registry.collector
+    def broken():
+        raise RuntimeError("boom")
+
+    @registry.collector
+    def queue():
+        return [
+            ("stereo_queue_pending", "gauge", "Ожидают", 2),
+            ("stereo_camera_fps", "gauge", "FPS", None),
+            ("stereo_cache_hits", "counter", "Попадания", {(("tier", "memory"),): 4, (("tier", "disk"),): None}),
+        ]
+
+    text = registry.render()
+    assert "stereo_queue_pending 2\n" in text
+    assert "stereo_camera_fps" not in text
+    assert 'stereo_cache_hits{tier="memory"} 4' in text
+    assert 'tier="disk"' not in text
+
+
+def test_timed_fills_stage_trace():
+    registry = Registry()
+    hist = registry.histogram("stage_seconds", "Стадии", labels=("stage",))
+    stages = {}
+    with timed(hist, stages, stage="publish"):
+        pass
+    with timed(hist, stages, stage="publish"):
+        pass
+    assert set(stages) == {"publish_ms"}
+    assert hist.series[("publish",)][-1] == 2
+
+
+def test_metrics_endpoint(webapp):
+    response = webapp.app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "stereo_latest_version" in response.get_data(as_text=True)
@@ -0,0 +1,65 @@
+import os
+
+from result_cache import ResultCache
+
+
+def store(cache, tmp_path, key, size, ext=".jpg"):
+    source = tmp_path / f"src_{key}{ext}"
+    source.write_bytes(bytes([len(key)]) * size)
+    cache.put(key, source)
+    return source
+
+
+def test_lru_eviction_by_total_size(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=300, memory_max_bytes=0)
+    store(cache, tmp_path, "a", 100)
+    store(cache, tmp_path, "b", 100)
+    store(cache, tmp_path, "c", 100)
+    assert cache.get("a") is not None       # a — теперь самый свежий
+    store(cache, tmp_path, "d", 100)        # вытесняет b
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["disk_bytes"] == 300
+    assert stats["evictions"] == 1
+    assert not cache.path("b").exists()
+
+
+def test_entry_is_hardlink_with_format_extension(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000)
+    source = store(cache, tmp_path, "k", 50, ext=".webp")
+    entry = cache.path("k", ".webp")
+    assert entry.exists() and os.path.samefile(entry, source)
+    assert not cache.path("k", ".jpg").exists()
+    assert cache.get("k", ".webp") == source.read_bytes()
+    assert cache.get("k", ".jpg") is None
+
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000, memory_max_bytes=150)
+    store(cache, tmp_path, "a", 100)
+    store(cache, tmp_path, "b", 100)       # вытесняет a из памяти, не с диска
+    assert cache.get("b") is not None
+    assert cache.get("a") is not None
+    stats = cache.stats()
+    assert stats["hits_memory"] == 1 and stats["hits_disk"] == 1
+    assert stats["memory_bytes"] <= 150
+
+
+def test_index_survives_restart(tmp_path):
+    folder = tmp_path / "cache"
+    cache = ResultCache(folder, max_bytes=10_000)
+    store(cache, tmp_path, "a", 100)
+    store(cache, tmp_path, "b", 100, ext=".webp")
+    (folder / "junk.123.tmp").write_bytes(b"x")
+    reopened = ResultCache(folder, max_bytes=150)   # лимит меньше — старшая запись уходит
+    assert reopened.stats()["entries"] == 1
+    assert reopened.get("b", ".webp") is not None
+    assert not (folder / "junk.123.tmp").exists()
+
+
+def test_disabled_cache(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes=0)
+    store(cache, tmp_path, "a", 10)
+    assert cache.get("a") is None
+    assert not (tmp_path / "cache").exists()
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import pytest
+
+from test_stereo_engine import sample_image
+
+
+@pytest.fixture(scope="module")
+def server(webapp):
+    """server_async.handle на 127.0.0.1:<свободный порт> в своём потоке с event loop."""
+    import server_async
+
+    loop = asyncio.new_event_loop()
+    pool = ThreadPoolExecutor(max_workers=4)
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def start():
+        return await asyncio.start_server(lambda r, w: server_async.handle(r, w, loop, pool),
+                                          "127.0.0.1", 0, limit=server_async.HEADER_LIMIT)
+
+    async def shutdown():
+        # открытые keep-alive соединения ждут следующий запрос — отменяем их обработчики
+        srv.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    srv = asyncio.run_coroutine_threadsafe(start(), loop).result(5)
+    yield server_async, srv.sockets[0].getsockname()[1]
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+    pool.shutdown(wait=False)
+
+
+class Client:
+    def __init__(self, port):
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+        self.file = self.sock.makefile("rb")
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def request(self, method, path, headers=(), body=b"", version="HTTP/1.1"):
+        lines = [f"{method} {path} {version}", "Host: test"]
+        lines += [f"{k}: {v}" for k, v in headers]
+        if body:
+            lines.append(f"Content-Length: {len(body)}")
+        self.sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+    def response(self, head=False):
+        """(status, заголовки, тело, куски chunked-тела или None)."""
+        status_line = self.file.readline()
+        if not status_line:
+            return None
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = self.file.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        chunks = None
+        if head or status in (204, 304):
+            body = b""
+        elif headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int(self.file.readline().strip(), 16)
+                if size == 0:
+                    assert self.file.readline() == b"\r\n"
+                    break
+                chunks.append(self.file.read(size))
+                assert self.file.readline() == b"\r\n"
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = self.file.read(int(headers["content-length"]))
+        else:
+            body = self.file.read()
+        return status, headers, body, chunks
+
+    def closed(self):
+        return self.file.read(1) == b""
+
+
+@pytest.fixture
+def client(server):
+    c = Client(server[1])
+    yield c
+    c.close()
+
+
+JPEG = b"\xff\xd8async\xff\xd9"
+
+
+def test_keep_alive_serves_several_requests(webapp, client):
+    webapp.latest_frame.set(JPEG)
+    client.request("GET", "/get-image")
+    status, headers, body, _ = client.response()
+    assert (status, body) == (200, JPEG)
+    assert headers["connection"] == "keep-alive"
+    # второй запрос — в WSGI (Flask), по тому же соединению
+    client.request("GET", "/metrics")
+    status, headers, body, _ = client.response()
+    assert status == 200 and b"async_connections" in body
+    client.request("GET", "/get-image", headers=[("Connection", "close")])
+    assert client.response()[0] == 200
+    assert client.closed()
+
+
+def test_get_with_body_closes_connection(webapp, client):
+    webapp.latest_frame.set(JPEG)
+    # тело GET не читается: его байты не должны разобраться как второй запрос
+    client.request("GET", "/get-image", body=b"GET /metrics HTTP/1.1\r\nHost: test\r\n\r\n")
+    status, headers, body, _ = client.response()
+    assert (status, body) == (200, JPEG)
+    assert headers["connection"] == "close"
+    assert client.closed()
+
+
+def test_etag_304_and_head(webapp, client):
+    webapp.latest_frame.set(JPEG + b"2")
+    client.request("GET", "/get-image")
+    _, headers, _, _ = client.response()
+    etag = headers["etag"]
+    client.request("GET", "/get-image", headers=[("If-None-Match", f"W/{etag}")])
+    status, headers, body, _ = client.response()
+    assert status == 304 and body == b"" and headers["etag"] == etag
+
+    # HEAD: заголовки как у GET, без тела — следующий ответ на соединении должен разобраться
+    client.request("HEAD", "/get-image")
+    status, headers, _, _ = client.response(head=True)
+    assert status == 200 and headers["content-length"] == str(len(JPEG) + 1)
+    client.request("HEAD", "/metrics")
+    status, headers, _, _ = client.response(head=True)
+    assert status == 200 and "transfer-encoding" not in headers
+    client.request("GET", "/get-image", headers=[("If-None-Match", etag)])
+    assert client.response()[0] == 304
+
+
+def test_streaming_response_is_chunked(webapp, client, monkeypatch):
+    events = [{"event": "start", "total": 2}, {"event": "file", "ok": True}, {"event": "end"}]
+
+    def run_batch(paths, out_dir, params, workers=1):
+        for event in events:
+            time.sleep(0.02)
+            yield event
+
+    monkeypatch.setattr(webapp.batch, "run_batch", run_batch)
+    cv2.imwrite(str(webapp.IMAGES_FOLDER / "batch_src.png"), sample_image(8, 8))
+    webapp.image_catalog.add("batch_src.png")
+
+    client.request("POST", "/batch-convert", headers=[("Content-Type", "application/json")],
+                   body=json.dumps({"filenames": ["batch_src.png"]}).encode())
+    status, headers, body, chunks = client.response()
+    assert status == 200
+    assert headers["transfer-encoding"] == "chunked"
+    assert len(chunks) == len(events)   # NDJSON уходит по событию, не одним куском
+    assert [json.loads(line) for line in body.splitlines()] == events
+    client.request("GET", "/get-image")
+    assert client.response()[0] in (200, 404)
+
+
+def test_header_limit(server, client):
+    server_async, _ = server
+    client.request("GET", "/get-image", headers=[("X-Big", "a" * (server_async.HEADER_LIMIT + 10))])
+    status, _, body, _ = client.response()
+    assert status == 400
+    assert client.closed()
+
+
+def test_bad_request_line_and_chunked_body(server):
+    c = Client(server[1])
+    try:
+        c.sock.sendall(b"NONSENSE\r\n\r\n")
+        assert c.response()[0] == 400
+        assert c.closed()
+    finally:
+        c.close()
+    c = Client(server[1])
+    try:
+        c.request("POST", "/convert", headers=[("Transfer-Encoding", "chunked")])
+        assert c.response()[0] == 400
+    finally:
+        c.close()
+
+
+def test_http10_closes_without_keep_alive(webapp, client):
+    webapp.latest_frame.set(JPEG)
+    client.request("GET", "/metrics", version="HTTP/1.0")
+    status, headers, body, _ = client.response()
+    assert status == 200 and headers["connection"] == "close"
+    assert body and client.closed()
+
+
+def test_connection_limit(server, monkeypatch):
+    server_async, port = server
+    monkeypatch.setattr(server_async, "MAX_CONNECTIONS", 0)
+    c = Client(port)
+    try:
+        # 503 уходит сразу после accept, запрос не читается
+        status, headers, _, _ = c.response()
+        assert status == 503 and headers["retry-after"] == "1"
+        assert c.closed()
+    finally:
+        c.close()
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import stereo_engine
+from stereo_worker import StereoWorker
+
+
+def sample_image(height, width, seed=1):
+    """Градиент с шумом и несколькими "близкими" прямоугольниками — много перекрытий и дырок."""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:height, 0:width]
+    image = np.stack([(xs * 255) // width, (ys * 255) // height, (xs + ys) % 256], axis=-1)
+    image = image + rng.integers(-40, 40, size=image.shape)
+    image[height // 4:height // 2, width // 3:width // 2] = 250
+    image[height // 2:, width // 8:width // 5] = (10, 240, 240)
+    image[-3:] = 0   # тёмные строки: depth 0 ничего не пишет
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+PARAMS = [(0.5, 10, 5), (3, 20, 3), (5, 7, 2)]
+
+
+@pytest.fixture
+def worker_exact(stereo_exact):
+    worker = StereoWorker(str(stereo_exact))
+    yield worker
+    worker.stop()
+
+
+@pytest.mark.parametrize("mode", [0, 1, 2])
+@pytest.mark.parametrize("width", [96, 77])
+def test_numpy_matches_stereo_serve(worker_exact, mode, width):
+    image = sample_image(64, width)
+    for params in PARAMS:
+        expected = worker_exact.convert(image, *params, mode)
+        result = stereo_engine.convert(image, *params, mode)
+        assert result.keys() == expected.keys()
+        for key in expected:
+            assert np.array_equal(result[key], expected[key]), (params, key)
+
+
+@pytest.mark.parametrize("mode", [0, 1, 2])
+def test_numpy_close_to_release_build(stereo_release, mode):
+    worker = StereoWorker(str(stereo_release))
+    try:
+        image = sample_image(48, 64, seed=2)
+        expected = worker.convert(image, 3, 20, 3, mode)
+        result = stereo_engine.convert(image, 3, 20, 3, mode)
+    finally:
+        worker.stop()
+    for key in expected:
+        diff = np.abs(result[key].astype(np.int16) - expected[key])
+        assert diff.max() <= 1, key
+        assert (diff > 0).mean() < 0.01, key
+
+
+def test_pair_halves_share_zbuffer():
+    # одна строка: пиксель x=0 (depth 200, сдвиг 2) пишет в левую ячейку 1,
+    # пиксель x=3 (depth 100, сдвиг 1) — в правую ячейку 1 той же строки, но она уже
+    # занята более близким — правая половина в этой точке остаётся дыркой
+    image = np.zeros((1, 4, 3), dtype=np.uint8)
+    depth = np.array([[200, 0, 0, 100]], dtype=np.uint8)
+    shifts = np.zeros(256, dtype=np.int32)
+    shifts[200] = 2
+    shifts[100] = 1
+    image[0, 0] = 200
+    image[0, 3] = 100
+    pair = np.zeros_like(image)
+    mask = stereo_engine._scatter_pair(image, depth, shifts[depth].astype(np.int64), 2, pair)
+    assert mask.tolist() == [[False, True, False, False]]
+    assert pair[0, 1].tolist() == [200, 200, 200]
+
+
+def test_depth_override_and_modes():
+    image = sample_image(20, 30)
+    both = stereo_engine.convert(image, output_mode=0)
+    assert set(both) == {"left", "right", "pair"}
+    assert set(stereo_engine.convert(image, output_mode=1)) == {"pair"}
+    assert set(stereo_engine.convert(image, output_mode=2)) == {"left", "right"}
+    flat = stereo_engine.convert(image, output_mode=2, depth=np.zeros((20, 30), dtype=np.uint8))
+    assert not flat["left"].any()   # depth 0 нигде не пишет, строки пустые
@@ -0,0 +1,41 @@
+import time
+
+from stereo_stream import StereoStream
+from test_stereo_engine import sample_image
+
+
+class FakeCamera:
+    def __init__(self):
+        self.seq = 0
+        self.frame = sample_image(60, 80)
+
+    def wait_frame(self, last_seq, timeout=1.0):
+        time.sleep(0.01)
+        self.seq += 1
+        return self.seq, self.frame
+
+
+def test_settings_error_does_not_kill_thread():
+    calls = []
+
+    def settings():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("config.txt занят")
+        return {"fps": 30, "max_width": 0, "jpeg_quality": 80, "convert": lambda frame: frame}
+
+    stream = StereoStream(FakeCamera(), settings, min_width=16, idle_timeout=0.1)
+    with stream.viewer():
+        seq, jpeg = stream.wait_jpeg(0, timeout=3.0)
+        assert jpeg is not None and jpeg[:2] == b"\xff\xd8"
+        assert stream.stats()["running"]
+    assert len(calls) >= 2
+
+
+def test_adapted_width_is_even():
+    stream = StereoStream(None, None, min_width=16)
+    stream.width = 990
+    stream._adapt(1.0, 0.1, 990, 0)
+    assert stream.width == 840
+    stream._adapt(0.0, 0.1, 990, 0)
+    assert stream.width % 2 == 0 and stream.width > 840
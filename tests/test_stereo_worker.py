@@ -0,0 +1,47 @@
+import os
+import signal
+
+import numpy as np
+import pytest
+
+from stereo_worker import StereoWorker, WorkerError
+from test_stereo_engine import sample_image
+
+
+def test_restart_after_crash_counted_once(stereo_exact):
+    worker = StereoWorker(str(stereo_exact))
+    try:
+        image = sample_image(16, 24)
+        first = worker.convert(image, output_mode=1)
+        os.kill(worker.proc.pid, signal.SIGKILL)
+        worker.proc.wait()
+        again = worker.convert(image, output_mode=1)
+        assert np.array_equal(first["pair"], again["pair"])
+        assert worker.restarts == 1
+    finally:
+        worker.stop()
+
+
+def test_retry_after_crash_during_request(tmp_path):
+    # "конвертер" читает команду и завершается, не ответив: один повтор, потом ошибка
+    fake = tmp_path / "stereo"
+    fake.write_text("#!/bin/sh\nread line\nexit 3\n")
+    fake.chmod(0o755)
+    worker = StereoWorker(str(fake))
+    try:
+        with pytest.raises(WorkerError):
+            worker.convert(sample_image(8, 8), output_mode=1)
+        assert worker.restarts == 1
+    finally:
+        worker.stop()
+
+
+def test_stop_is_not_a_restart(stereo_exact):
+    worker = StereoWorker(str(stereo_exact))
+    try:
+        worker.convert(sample_image(8, 8), output_mode=2)
+        worker.stop()
+        worker.convert(sample_image(8, 8), output_mode=2)
+        assert worker.restarts == 0
+    finally:
+        worker.stop()
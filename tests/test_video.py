@@ -0,0 +1,98 @@
+import threading
+
+import numpy as np
+import pytest
+
+import video
+
+cv2 = pytest.importorskip("cv2")
+
+FRAMES = 23
+SEGMENT = 5
+
+
+def frame_value(i):
+    return 10 + i * 10
+
+
+def write_clip(path):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 25, (32, 24))
+    assert writer.isOpened()
+    for i in range(FRAMES):
+        writer.write(np.full((24, 32, 3), frame_value(i), dtype=np.uint8))
+    writer.release()
+
+
+def read_values(path):
+    cap = cv2.VideoCapture(str(path))
+    values = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        values.append(float(frame.mean()))
+    cap.release()
+    return values
+
+
+def test_stop_and_resume_from_last_segment(tmp_path):
+    source = tmp_path / "clip.avi"
+    write_clip(source)
+    work = tmp_path / "work"
+    stop = threading.Event()
+    converted = []
+    stop_after = {"frames": 12}
+
+    def make_converter():
+        def convert(frame):
+            converted.append(frame)
+            if len(converted) == stop_after["frames"]:
+                stop.set()
+            return frame
+        return convert, None
+
+    progress = {}
+    with pytest.raises(video.VideoError):
+        video.convert_video(source, work, make_converter, workers=2, segment_frames=SEGMENT,
+                            progress=progress, stop_event=stop)
+    assert progress["status"] == "stopped"
+    segments = sorted(p.name for p in work.glob("seg_*"))
+    assert segments and len(segments) * SEGMENT <= len(converted)
+    assert not list(work.glob(".seg_*"))   # недописанный сегмент выброшен
+
+    converted.clear()
+    stop.clear()
+    stop_after["frames"] = None
+    progress = {}
+    target = video.convert_video(source, work, make_converter, workers=2, segment_frames=SEGMENT,
+                                 progress=progress, stop_event=stop)
+    assert progress["resumed_from"] == len(segments) * SEGMENT
+    assert len(converted) == FRAMES - len(segments) * SEGMENT
+    values = read_values(target)
+    assert len(values) == FRAMES
+    # кадры в исходном порядке, без повторов на стыке сегментов
+    assert all(abs(v - frame_value(i)) < 3 for i, v in enumerate(values))
+    assert not list(work.glob("seg_*"))
+
+    progress = {}
+    assert video.convert_video(source, work, make_converter, segment_frames=SEGMENT, progress=progress) == target
+    assert progress["cached"] is True
+
+
+def test_changed_source_starts_over(tmp_path):
+    source = tmp_path / "clip.avi"
+    write_clip(source)
+    work = tmp_path / "work"
+    identity = lambda: (lambda frame: frame, None)   # noqa: E731
+    video.convert_video(source, work, identity, segment_frames=SEGMENT)
+    write_clip(source)   # новый mtime — старый результат не подходит
+    progress = {}
+    video.convert_video(source, work, identity, segment_frames=SEGMENT, progress=progress)
+    assert not progress.get("cached") and progress["resumed_from"] is None
+
+
+def test_unsupported_format(tmp_path):
+    source = tmp_path / "clip.mkv"
+    source.write_bytes(b"")
+    with pytest.raises(video.VideoError):
+        video.convert_video(source, tmp_path / "work", lambda: (lambda f: f, None))
@@ -0,0 +1,256 @@
+# video.py
+# Видео (MP4/AVI) -> стерео side-by-side видео. Кадры читаются cv2.VideoCapture
+# по одному и идут через пул потоков (у каждого свой конвертер); результат пишется
+# cv2.VideoWriter строго в исходном порядке. В памяти — только окно из нескольких
+# кадров, на диск — только сегменты готового видео: после перезапуска конвертация
+# продолжается с первого незавершённого сегмента.
+
+import json
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+
+VIDEO_EXTENSIONS = {".mp4", ".avi"}
+FOURCC = {".mp4": "mp4v", ".avi": "MJPG"}
+STATE_NAME = "state.json"
+
+
+class VideoError(RuntimeError):
+    pass
+
+
+def _write_state(path: Path, state: dict):
+    tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _open_writer(path: Path, fps: float, size):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*FOURCC[path.suffix]), fps, size)
+    if not writer.isOpened():
+        raise VideoError(f"не удалось открыть VideoWriter для {path.name}")
+    return writer
+
+
+def _join_segments(segments: list, target: Path, fps: float):
+    """
+    Склейка сегментов в один файл: ffmpeg (если есть) копирует потоки без
+    перекодирования, иначе — перепаковка кадров через cv2 (без повторной конвертации).
+    """
+    tmp = target.with_name(f".{target.stem}.joining{target.suffix}")
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg and len(segments) > 1:
+        listing = target.with_name(".segments.txt")
+        listing.write_text("".join(f"file '{p.resolve()}'\n" for p in segments), encoding="utf-8")
+        try:
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                            "-i", str(listing), "-c", "copy", str(tmp)], check=True)
+            tmp.replace(target)
+            return
+        except subprocess.CalledProcessError as e:
+            print(f"[video] ffmpeg concat failed ({e}), joining with OpenCV")
+        finally:
+            listing.unlink(missing_ok=True)
+
+    if len(segments) == 1:
+        shutil.copyfile(segments[0], tmp)
+        tmp.replace(target)
+        return
+
+    writer = None
+    try:
+        for seg in segments:
+            cap = cv2.VideoCapture(str(seg))
+            try:
+                while True:
+                    ok, frame = cap.read()
+                    if not ok:
+                        break
+                    if writer is None:
+                        writer = _open_writer(tmp, fps, (frame.shape[1], frame.shape[0]))
+                    writer.write(frame)
+            finally:
+                cap.release()
+    finally:
+        if writer is not None:
+            writer.release()
+    tmp.replace(target)
+
+
+def convert_video(source: Path, work_dir: Path, make_converter, workers=2,
+                  segment_frames=300, progress=None, stop_event=None) -> Path:
+    """
+    Конвертирует видео source в work_dir/<имя>_sbs<расширение источника>.
+
+    make_converter() -> (convert(frame BGR) -> SBS-кадр BGR, close() | None) —
+    вызывается один раз в каждом потоке пула (свой ./stereo --serve на поток).
+    progress — dict, который обновляется по ходу (frames_done, frames_total, fps...).
+    Состояние (готовые сегменты) лежит в work_dir/state.json; повторный вызов
+    с тем же work_dir продолжает с места остановки.
+    """
+    source = Path(source)
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    ext = source.suffix.lower()
+    if ext not in VIDEO_EXTENSIONS:
+        raise VideoError(f"неподдерживаемый формат видео: {ext}")
+    target = work_dir / f"{source.stem}_sbs{ext}"
+    progress = progress if progress is not None else {}
+    state_path = work_dir / STATE_NAME
+
+    st = source.stat()
+    stamp = {"source": source.name, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+             "segment_frames": segment_frames}
+    state = {}
+    if state_path.exists():
+        try:
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            state = {}
+    if state.get("stamp") != stamp or (state.get("done") and not target.exists()):
+        # другой файл, другая нарезка или удалённый результат — начинаем заново
+        for old in work_dir.glob("seg_*"):
+            old.unlink()
+        state = {"stamp": stamp, "segments": [], "done": False}
+
+    if state.get("done") and target.exists():
+        progress.update(status="done", frames_done=state.get("frames_total"),
+                        frames_total=state.get("frames_total"), output=target.name, resumed_from=None,
+                        cached=True)
+        return target
+
+    cap = cv2.VideoCapture(str(source))
+    if not cap.isOpened():
+        raise VideoError(f"не удалось открыть видео {source.name}")
+
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+    segments = [work_dir / name for name in state["segments"]]
+    first_frame = len(segments) * segment_frames
+    progress.update(status="running", frames_total=frames_total, frames_done=first_frame,
+                    source_fps=round(source_fps, 3), fps=None, eta_s=None,
+                    segments_done=len(segments), resumed_from=first_frame or None, output=None)
+
+    # пропуск уже сконвертированных кадров: grab() без декодирования в BGR,
+    # надёжнее, чем CAP_PROP_POS_FRAMES (у mp4 — по ключевым кадрам)
+    for _ in range(first_frame):
+        if not cap.grab():
+            break
+
+    local = threading.local()
+    closers = []
+    closers_lock = threading.Lock()
+
+    def run(frame):
+        conv = getattr(local, "convert", None)
+        if conv is None:
+            conv, close = make_converter()
+            local.convert = conv
+            if close:
+                with closers_lock:
+                    closers.append(close)
+        return conv(frame)
+
+    # окно кадров "в работе": ограничивает память и держит порядок на выходе
+    max_in_flight = max(2, workers * 2)
+    window = deque()
+    writer = None
+    seg_index = len(segments)
+    seg_frames = 0
+    seg_tmp = None
+    frame_no = first_frame
+    started = time.perf_counter()
+
+    def write(result):
+        nonlocal writer, seg_frames, seg_tmp, seg_index
+        if writer is None:
+            seg_tmp = work_dir / f".seg_{seg_index:05d}{ext}"
+            writer = _open_writer(seg_tmp, source_fps, (result.shape[1], result.shape[0]))
+        writer.write(result)
+        seg_frames += 1
+        if seg_frames == segment_frames:
+            close_segment()
+
+    def close_segment():
+        nonlocal writer, seg_frames, seg_tmp, seg_index
+        writer.release()
+        writer = None
+        seg = work_dir / f"seg_{seg_index:05d}{ext}"
+        seg_tmp.replace(seg)
+        segments.append(seg)
+        state["segments"].append(seg.name)
+        _write_state(state_path, state)
+        seg_index += 1
+        seg_frames = 0
+        progress["segments_done"] = len(segments)
+
+    def update_progress():
+        done = frame_no - len(window)
+        elapsed = time.perf_counter() - started
+        fps = (done - first_frame) / elapsed if elapsed > 0 else None
+        progress["frames_done"] = done
+        progress["fps"] = round(fps, 2) if fps else None
+        if fps and frames_total:
+            progress["eta_s"] = round(max(0, frames_total - done) / fps, 1)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="video") as pool:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    raise VideoError("конвертация остановлена")
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                window.append(pool.submit(run, frame))
+                frame_no += 1
+                if len(window) >= max_in_flight:
+                    write(window.popleft().result())
+                    update_progress()
+            while window:
+                write(window.popleft().result())
+                update_progress()
+        if writer is not None:
+            close_segment()
+    except BaseException:
+        # недописанный сегмент выбрасываем — продолжим с последнего целого
+        for fut in window:
+            fut.cancel()
+        if writer is not None:
+            writer.release()
+            seg_tmp.unlink(missing_ok=True)
+        progress["status"] = "stopped"
+        raise
+    finally:
+        cap.release()
+        for close in closers:
+            try:
+                close()
+            except Exception as e:
+                print(f"[video] converter close failed: {e}")
+
+    if not segments:
+        raise VideoError("в видео нет кадров")
+
+    progress["status"] = "joining"
+    _join_segments(segments, target, source_fps)
+    for seg in segments:
+        seg.unlink(missing_ok=True)
+    state.update(done=True, segments=[], frames_total=frame_no)
+    _write_state(state_path, state)
+
+    elapsed = time.perf_counter() - started
+    progress.update(status="done", frames_done=frame_no, frames_total=frame_no, eta_s=0,
+                    output=target.name, seconds=round(elapsed, 2))
+    if frame_no > first_frame and elapsed > 0:
+        progress["fps"] = round((frame_no - first_frame) / elapsed, 2)
+    return target